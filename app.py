@@ -1,16 +1,30 @@
 import os
+import functools
 import logging
 import logging.handlers
+import hashlib
+import shutil
 import socket
+import tempfile
+import threading
 import time
 import uuid
-from flask import Flask, render_template, request, jsonify, flash, redirect, url_for, session
+from collections import OrderedDict
+import queue
+from flask import Flask, render_template, request, jsonify, flash, redirect, url_for, session, Response, stream_with_context, abort, make_response
 import json
 from datetime import datetime
+from werkzeug.http import is_resource_modified
 from werkzeug.utils import secure_filename
-from smtp_tool import SMTPTool
+from smtp_tool import SMTPTool, SMTPTranscript, SendScheduler, iter_recipient_rows
 from config_manager import ConfigManager
 from email_validator import validate_email
+from message_archive import MessageArchive
+from mail_spool import MailSpool
+from security_sweep import SPECIAL_TESTS, create_special_attachment, run_sweep, special_test_data
+from send_jobs import SendJobQueue
+from static_assets import IMMUTABLE_MAX_AGE, StaticAssets
+from template_engine import TemplateEngine
 
 # Configure logging
 # Get log directory from environment variable or default to current directory
@@ -46,6 +60,64 @@ config_manager = ConfigManager()
 # Initialize SMTP tool
 smtp_tool = SMTPTool()
 
+# Initialize archive of sent messages used for replay
+message_archive = MessageArchive(os.path.join(config_manager.config_dir, 'archive'))
+
+def log_spool_result(entry, status, error):
+    """Record the outcome of a spooled retry in the email logs"""
+    if status == 'deferred':
+        return
+    connection = entry['connection']
+    log_entry = {
+        'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'profile': 'Spool',
+        'server': f"{connection['server']}:{connection['port']}",
+        'sender': entry['sender'],
+        'recipients': entry['recipients'],
+        'cc': [],
+        'bcc': [],
+        'subject': entry['subject'],
+        'status': 'Success' if status == 'delivered' else 'Failed',
+        'message_id': entry['message_id'],
+        'spool_id': entry['id'],
+        'attempts': entry['attempts']
+    }
+    if error:
+        log_entry['error'] = error
+    config_manager.add_log_entry(log_entry)
+
+# Initialize spool of messages deferred by the server; the entry point starts its
+# delivery workers, so importing this module never sends mail on its own
+mail_spool = MailSpool(os.path.join(config_manager.config_dir, 'spool'), on_result=log_spool_result,
+                       get_profile=config_manager.get_profile)
+
+
+def start_spool():
+    """
+    Start delivering spooled messages in the background
+
+    Called by the server entry point (main.py). SPOOL_WORKERS=0 leaves the
+    spool to ``cli.py queue --run`` instead.
+
+    Returns:
+        bool: True if delivery workers were started
+    """
+    workers = int(os.environ.get('SPOOL_WORKERS', 2))
+    if workers <= 0:
+        logger.info("Spool delivery disabled (SPOOL_WORKERS=0)")
+        return False
+    mail_spool.start(workers=workers)
+    return True
+
+# Initialize compiled template cache used for personalized sends
+template_engine = TemplateEngine(config_manager)
+
+# Initialize background send queue
+send_queue = SendJobQueue(
+    max_workers=int(os.environ.get('SEND_WORKERS', 4)),
+    max_pending=int(os.environ.get('SEND_QUEUE_SIZE', 100))
+)
+
 # Initialize default templates if none exist
 def init_default_templates():
     templates = config_manager.get_templates()
@@ -161,7 +233,77 @@ If properly implemented, this test message will help verify SPF functionality.
 
 init_default_templates()
 
+# Static files are served fingerprinted, precompressed and cached for a year
+static_assets = StaticAssets(app.static_folder)
+
+# Pages rendered by a restarted process are never treated as unchanged
+PAGE_VERSION = uuid.uuid4().hex[:8]
+
+@app.url_defaults
+def fingerprint_static_urls(endpoint, values):
+    """Point url_for('static', ...) at the fingerprinted path of the file"""
+    if endpoint == 'static' and 'filename' in values:
+        values['filename'] = static_assets.url_path(values['filename'])
+
+def serve_static(filename):
+    """Serve a static file, gzipped when the client accepts it
+
+    Paths with the current fingerprint are immutable; plain and outdated
+    paths are revalidated on every use.
+    """
+    asset, immutable = static_assets.resolve(filename)
+    if asset is None:
+        abort(404)
+    compressed = asset['gzip'] is not None and request.accept_encodings['gzip'] > 0
+    response = Response(asset['gzip'] if compressed else asset['data'], mimetype=asset['mimetype'])
+    if compressed:
+        response.content_encoding = 'gzip'
+    response.vary.add('Accept-Encoding')
+    response.set_etag(asset['fingerprint'] + ('-gzip' if compressed else ''))
+    response.last_modified = asset['mtime']
+    if immutable:
+        response.cache_control.public = True
+        response.cache_control.max_age = IMMUTABLE_MAX_AGE
+        response.cache_control.immutable = True
+    else:
+        response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+app.view_functions['static'] = serve_static
+
+def conditional(*config_files):
+    """
+    Answer 304 Not Modified while the config files a view reads are unchanged
+
+    The ETag combines the files' versions, the static asset fingerprints and
+    the process; there is no Last-Modified, since a file's modification time
+    cannot tell a restarted process or changed assets apart. The view only runs when the client has no current copy; responses must be
+    revalidated on every use. Pages with pending flash messages are always
+    rendered.
+
+    Args:
+        *config_files (str): ConfigManager files the view reads ('profiles', 'templates', 'settings')
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            version = config_manager.version(*config_files)
+            etag = f"{PAGE_VERSION}-{static_assets.version()}-{version}"
+            if not session.get('_flashes') and not is_resource_modified(request.environ, etag=etag):
+                response = Response(status=304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag)
+            response.cache_control.private = True
+            response.cache_control.no_cache = True
+            return response
+        return wrapper
+    return decorator
+
 @app.route('/')
+@conditional('profiles', 'templates', 'settings')
 def index():
     """Render the main page for sending emails"""
     smtp_profiles = config_manager.get_profiles()
@@ -180,121 +322,284 @@ def index():
                           saved_recipients=saved_recipients,
                           default_sender=default_sender)
 
-# Global request cache with results for duplicate prevention
-_request_cache = {}
+# Duplicate prevention for /send_email
+# Requests carrying an explicit idempotency key are suppressed for the whole
+# retention period; requests identified only by a content hash are suppressed
+# for a short window so that genuine re-sends are still possible.
+IDEMPOTENCY_TTL = 30
+CONTENT_HASH_WINDOW = 8
+IDEMPOTENCY_MAX_ENTRIES = 1024
 
-@app.route('/send_email', methods=['POST'])
-def send_email():
-    """API endpoint to send an email"""
-    global _request_cache
-    
-    # Ultra-simple duplicate prevention - track request by timestamp + form data
-    import hashlib
-    current_time = time.time()
-    
-    # Create unique identifier for this request
-    form_items = sorted([(k, v) for k, v in request.form.items() if k != 'timestamp'])
-    form_string = str(form_items)
-    request_id = hashlib.sha256(form_string.encode()).hexdigest()[:12]
-    
-    # Check if this exact request was made in the last 8 seconds
-    if request_id in _request_cache:
-        cache_entry = _request_cache[request_id]
-        if current_time - cache_entry['time'] < 8:
-            logger.warning(f"BLOCKING duplicate request: {request_id}")
-            return jsonify(cache_entry['result'])
-    
-    # Clean old entries (keep last 30 seconds)
-    _request_cache = {k: v for k, v in _request_cache.items() if current_time - v.get('time', 0) < 30}
-    
-    # Get body type for HTML processing
-    body_type = request.form.get('body_type', 'plain')
+
+class IdempotencyCache:
+    """Time-ordered cache of recent send results used for duplicate suppression
+
+    Completed entries live in an OrderedDict kept in insertion (and therefore
+    time) order, so expiry only ever has to look at the oldest entries. Each
+    lookup or insert costs amortized O(1) regardless of how many keys are being
+    tracked.
+
+    Reservations for requests still in flight are kept apart and are never
+    evicted to honour the TTL or the size bound: they only go away when the
+    request stores its result or releases the key, so a retry of a slow send
+    is still caught however many other keys arrive meanwhile.
+    """
+
+    def __init__(self, ttl=IDEMPOTENCY_TTL, max_size=IDEMPOTENCY_MAX_ENTRIES):
+        """
+        Initialize the cache
+
+        Args:
+            ttl (float): Seconds a completed entry is retained
+            max_size (int): Maximum number of completed entries kept at any time
+        """
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    def _expire(self, now):
+        """Drop completed entries older than the TTL and enforce the size bound"""
+        entries = self._entries
+        while entries:
+            key, entry = next(iter(entries.items()))
+            if now - entry['time'] < self.ttl and len(entries) <= self.max_size:
+                break
+            entries.popitem(last=False)
+
+    def claim(self, key, window):
+        """
+        Look up a key and reserve it if it is not already known
+
+        Args:
+            key (str): Idempotency key
+            window (float): Seconds within which a repeat is treated as a duplicate
+
+        Returns:
+            tuple: (is_duplicate, result) where result is the cached response for a
+            completed request or None while the original is still in flight
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            started = self._in_flight.get(key)
+            if started is not None and now - started < window:
+                return True, None
+            entry = self._entries.get(key)
+            if entry is not None and now - entry['time'] < window:
+                return True, entry['result']
+
+            # Reserve the key so concurrent duplicates are caught while sending
+            self._entries.pop(key, None)
+            self._in_flight[key] = now
+            return False, None
+
+    def store(self, key, result):
+        """
+        Record the final result for a key
+
+        Args:
+            key (str): Idempotency key
+            result (dict): Response returned to the client
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._in_flight.pop(key, None)
+            self._entries.pop(key, None)
+            self._entries[key] = {'time': now, 'result': result}
+            self._expire(now)
+
+    def release(self, key):
+        """
+        Forget a key so that the request can be retried immediately
+
+        Args:
+            key (str): Idempotency key
+        """
+        with self._lock:
+            self._in_flight.pop(key, None)
+            self._entries.pop(key, None)
+
+    def __len__(self):
+        return len(self._entries) + len(self._in_flight)
+
+
+_request_cache = IdempotencyCache()
+
+
+def get_idempotency_key(form, headers):
+    """
+    Derive the duplicate-suppression key for a send request
+
+    A client-supplied ``Idempotency-Key`` header (or ``idempotency_key`` form
+    field) is used as-is. Otherwise a hash of every form field is used, so
+    two sends that differ anywhere, even late in a long body, get different
+    keys.
+
+    Args:
+        form (MultiDict): Submitted form fields
+        headers (Headers): Request headers
+
+    Returns:
+        tuple: (key, window) where window is the suppression period in seconds
+    """
+    client_key = headers.get('Idempotency-Key') or form.get('idempotency_key')
+    if client_key:
+        return f"key:{client_key.strip()[:128]}", IDEMPOTENCY_TTL
+
+    digest = hashlib.sha256()
+    for name, value in sorted(form.items(multi=True)):
+        if name in ('timestamp', 'idempotency_key'):
+            continue
+        digest.update(name.encode())
+        digest.update(b'\0')
+        value = value.encode()
+        # Length-prefixed so field boundaries cannot be shifted between values
+        digest.update(f"{len(value)}\0".encode())
+        digest.update(value)
+    return f"hash:{digest.hexdigest()[:24]}", CONTENT_HASH_WINDOW
+
+
+def build_send_request(form, files):
+    """
+    Validate a submitted send form and collect everything needed to send it
+
+    Uploaded and generated attachments are written to a temporary directory
+    created for this request, so overlapping queued sends never share a file.
+    deliver_email removes the directory once the send has finished.
+
+    Args:
+        form (MultiDict): Submitted form fields
+        files (MultiDict): Uploaded files
+
+    Returns:
+        tuple: (send_request, error) where exactly one of the two is None
+    """
+    # Get form data
+    profile_name = form.get('profile')
+    sender = form.get('sender', '')
+    recipients_str = form.get('recipients', '')
+    recipients = recipients_str.split(',') if recipients_str else []
+    
+    cc_str = form.get('cc', '')
+    cc = cc_str.split(',') if cc_str else []
+    
+    bcc_str = form.get('bcc', '')
+    bcc = bcc_str.split(',') if bcc_str else []
+    
+    subject = form.get('subject', '')
+    body_type = form.get('body_type', 'plain')
+    body = form.get('body', '')
+    
     if body_type == 'html':
         logger.info("Processing HTML email")
     
-    try:
-        # Get form data
-        profile_name = request.form.get('profile')
-        sender = request.form.get('sender', '')
-        recipients_str = request.form.get('recipients', '')
-        recipients = recipients_str.split(',') if recipients_str else []
-        
-        cc_str = request.form.get('cc', '')
-        cc = cc_str.split(',') if cc_str else []
-        
-        bcc_str = request.form.get('bcc', '')
-        bcc = bcc_str.split(',') if bcc_str else []
-        
-        subject = request.form.get('subject', '')
-        body_type = request.form.get('body_type', 'plain')
-        body = request.form.get('body', '')
-        
-        # Validate email addresses
-        all_recipients = recipients + cc + bcc
-        for email in all_recipients + [sender]:
-            if email and email.strip():
-                try:
-                    validate_email(email.strip())
-                except Exception as e:
-                    return jsonify({'success': False, 'message': f'Invalid email address: {email} - {str(e)}'})
-        
-        # Get profile configuration
-        profile = config_manager.get_profile(profile_name)
-        if not profile:
-            return jsonify({'success': False, 'message': f'Profile {profile_name} not found'})
-        
-        # Get attachments
-        attachments = []
-        if 'attachments' in request.files:
-            files = request.files.getlist('attachments')
-            for file in files:
-                if file.filename:
-                    temp_path = os.path.join('/tmp', file.filename)
-                    file.save(temp_path)
-                    attachments.append(temp_path)
-        
-        # Check for special attachment
-        special_attachment = request.form.get('special_attachment')
-        if special_attachment:
+    # Validate email addresses
+    all_recipients = recipients + cc + bcc
+    for email in all_recipients + [sender]:
+        if email and email.strip():
             try:
-                attachment_data = json.loads(special_attachment)
-                attachment_type = attachment_data.get('type')
-                
-                if attachment_type == 'pdf':
-                    filename, data = smtp_tool.create_pdf_attachment(
-                        malformed=attachment_data.get('malformed', False),
-                        active_content=attachment_data.get('active_content', False)
-                    )
-                    temp_path = os.path.join('/tmp', filename)
-                    with open(temp_path, 'wb') as f:
-                        f.write(data)
-                    attachments.append(temp_path)
-                
-
-                
-                elif attachment_type == 'eicar':
-                    filename, data = smtp_tool.create_eicar_attachment()
-                    temp_path = os.path.join('/tmp', filename)
-                    with open(temp_path, 'wb') as f:
-                        f.write(data)
-                    attachments.append(temp_path)
-            
+                validate_email(email.strip())
             except Exception as e:
-                logger.exception(f"Failed to create special attachment: {str(e)}")
-        
-        # Get application settings
-        settings = config_manager.get_settings()
+                return None, f'Invalid email address: {email} - {str(e)}'
+    
+    # Get profile configuration
+    profile = config_manager.get_profile(profile_name)
+    if not profile:
+        return None, f'Profile {profile_name} not found'
+    
+    # Get attachments
+    attachments = []
+    attachment_dir = None
+    
+    def attachment_path(filename):
+        nonlocal attachment_dir
+        if attachment_dir is None:
+            attachment_dir = tempfile.mkdtemp(prefix='smtp-send-')
+        filename = secure_filename(filename) or 'attachment'
+        if os.path.exists(os.path.join(attachment_dir, filename)):
+            filename = f"{len(attachments)}-{filename}"
+        return os.path.join(attachment_dir, filename)
+    
+    if 'attachments' in files:
+        for file in files.getlist('attachments'):
+            if file.filename:
+                temp_path = attachment_path(file.filename)
+                file.save(temp_path)
+                attachments.append(temp_path)
+    
+    # Check for special attachment
+    special_attachment = form.get('special_attachment')
+    if special_attachment:
+        try:
+            attachment = create_special_attachment(smtp_tool, json.loads(special_attachment))
+            if attachment:
+                filename, data = attachment
+                temp_path = attachment_path(filename)
+                with open(temp_path, 'wb') as f:
+                    f.write(data)
+                attachments.append(temp_path)
         
-        # Get any custom headers for special tests
-        custom_headers = {}
-        if request.form.get('custom_headers'):
-            try:
-                custom_headers_str = request.form.get('custom_headers')
-                if custom_headers_str:
-                    custom_headers = json.loads(custom_headers_str)
-            except Exception as e:
-                logger.warning(f"Failed to parse custom headers: {str(e)}")
-                
+        except Exception as e:
+            logger.exception(f"Failed to create special attachment: {str(e)}")
+    
+    # Get any custom headers for special tests
+    custom_headers = {}
+    if form.get('custom_headers'):
+        try:
+            custom_headers_str = form.get('custom_headers')
+            if custom_headers_str:
+                custom_headers = json.loads(custom_headers_str)
+        except Exception as e:
+            logger.warning(f"Failed to parse custom headers: {str(e)}")
+    
+    return {
+        'profile_name': profile_name,
+        'profile': profile,
+        'sender': sender,
+        'recipients': recipients,
+        'cc': cc,
+        'bcc': bcc,
+        'subject': subject,
+        'body': body,
+        'body_type': body_type,
+        'attachments': attachments,
+        'attachment_dir': attachment_dir,
+        'custom_headers': custom_headers
+    }, None
+
+
+def remove_attachments(send_request):
+    """
+    Delete the temporary attachment directory of a send request
+
+    Args:
+        send_request (dict): Request built by build_send_request
+    """
+    if send_request.get('attachment_dir'):
+        shutil.rmtree(send_request['attachment_dir'], ignore_errors=True)
+
+
+def deliver_email(send_request, transcript=None):
+    """
+    Send a validated request through its SMTP profile and record the log entry
+
+    Args:
+        send_request (dict): Request built by build_send_request
+        transcript (SMTPTranscript, optional): Transcript to record into while sending
+
+    Returns:
+        tuple: (response, smtp_log) with the JSON response for the client and
+        the SMTP transcript of the send
+    """
+    profile = send_request['profile']
+    attachments = send_request['attachments']
+    
+    # Get application settings
+    settings = config_manager.get_settings()
+    
+    try:
         # Send email using the SMTP tool
         result = smtp_tool.send_email(
             server=profile['server'],
@@ -303,84 +608,372 @@ def send_email():
             use_ssl=profile['use_ssl'],
             username=profile['username'],
             password=profile['password'],
-            sender=sender,
-            recipients=recipients,
-            cc=cc,
-            bcc=bcc,
-            subject=subject,
-            body=body,
-            body_type=body_type,
+            sender=send_request['sender'],
+            recipients=send_request['recipients'],
+            cc=send_request['cc'],
+            bcc=send_request['bcc'],
+            subject=send_request['subject'],
+            body=send_request['body'],
+            body_type=send_request['body_type'],
             attachments=attachments,
             hostname=settings.get('send_hostname'),
-            custom_headers=custom_headers,
-            no_tls_verify=profile.get('no_tls_verify', False)
+            custom_headers=send_request['custom_headers'],
+            no_tls_verify=profile.get('no_tls_verify', False),
+            transcript=transcript,
+            archive=message_archive if settings.get('archive_messages', True) else None,
+            optimize_encoding=settings.get('optimize_transfer_encoding', True),
+            spool=mail_spool if settings.get('spool_deferred', True) else None,
+            profile_name=send_request['profile_name']
         )
-        
+    finally:
         # Clean up temporary files
-        for attachment in attachments:
-            if os.path.exists(attachment):
-                os.remove(attachment)
-        
-        if result['success']:
-            # Log the successful email send
-            log_entry = {
-                'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                'profile': profile_name,
-                'server': f"{profile['server']}:{profile['port']}",
-                'sender': sender,
-                'recipients': recipients,
-                'cc': cc,
-                'bcc': bcc,
-                'subject': subject,
-                'status': 'Success',
-                'attachments': [os.path.basename(att) for att in attachments] if attachments else [],
-                'message_id': result.get('message_id', ''),
-                'smtp_log': result.get('smtp_log', [])
-            }
-            
-            # Add any additional settings info if present
-            if settings.get('log_message_content', False):
-                log_entry['body'] = body
-                log_entry['body_type'] = body_type
-                
-            config_manager.add_log_entry(log_entry)
+        remove_attachments(send_request)
+    
+    log_entry = {
+        'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'profile': send_request['profile_name'],
+        'server': f"{profile['server']}:{profile['port']}",
+        'sender': send_request['sender'],
+        'recipients': send_request['recipients'],
+        'cc': send_request['cc'],
+        'bcc': send_request['bcc'],
+        'subject': send_request['subject'],
+        'status': 'Success' if result['success'] else 'Failed',
+        'attachments': [os.path.basename(att) for att in attachments] if attachments else []
+    }
+    
+    if result.get('message_id'):
+        log_entry['message_id'] = result['message_id']
+    if result.get('queued'):
+        log_entry['spool_id'] = result['queued']
+    
+    if result['success']:
+        # Log the successful email send
+        log_entry['smtp_log'] = result.get('smtp_log', [])
+        
+        # Add any additional settings info if present
+        if settings.get('log_message_content', False):
+            log_entry['body'] = send_request['body']
+            log_entry['body_type'] = send_request['body_type']
+        
+        response = {'success': True, 'message': 'Email sent'}
+    elif result.get('queued'):
+        # The server deferred the message; the spool retries it in the background
+        log_entry['status'] = 'Queued'
+        log_entry['error'] = result['error']
+        log_entry['smtp_log'] = result.get('smtp_log', [])
+        response = {'success': True, 'queued': result['queued'],
+                    'message': f'Email deferred ({result["error"]}), queued for retry'}
+    else:
+        # Log the failed email send
+        log_entry['error'] = result['error']
+        log_entry['smtp_log'] = result.get('smtp_log', [])
+        response = {'success': False, 'message': f'Email failed: {result["error"]}'}
+    
+    config_manager.add_log_entry(log_entry)
+    return response, result.get('smtp_log', [])
+
+
+def run_send_job(job, send_request):
+    """Job queue entry point for a queued send"""
+    job.transcript = SMTPTranscript(listener=job.publish)
+    response, _ = deliver_email(send_request, transcript=job.transcript)
+    response['timings'] = dict(job.transcript.timings)
+    return response
+
+
+def run_test_connection_job(job, profile, hostname):
+    """Job queue entry point for a queued connection test"""
+    job.transcript = SMTPTranscript(listener=job.publish)
+    result = smtp_tool.test_connection(
+        server=profile['server'],
+        port=profile['port'],
+        use_tls=profile['use_tls'],
+        use_ssl=profile['use_ssl'],
+        username=profile['username'],
+        password=profile['password'],
+        hostname=hostname,
+        no_tls_verify=profile.get('no_tls_verify', False),
+        transcript=job.transcript
+    )
+    result.pop('smtp_log', None)
+    return result
+
+
+def wants_job_mode(form, headers):
+    """Check whether the client asked for the send to be queued as a job"""
+    if form.get('mode') == 'job':
+        return True
+    return 'respond-async' in headers.get('Prefer', '')
+
+
+@app.route('/send_email', methods=['POST'])
+def send_email():
+    """API endpoint to send an email
+
+    With ``mode=job`` (or a ``Prefer: respond-async`` header) the request is
+    validated, queued on the send worker pool and answered immediately with a
+    job id that can be polled at ``/jobs/<job_id>``.
+    """
+    request_id, duplicate_window = get_idempotency_key(request.form, request.headers)
+    is_duplicate, cached_result = _request_cache.claim(request_id, duplicate_window)
+    if is_duplicate:
+        logger.warning(f"BLOCKING duplicate request: {request_id}")
+        if cached_result is None:
+            return jsonify({'success': False, 'message': 'An identical request is already being processed'})
+        return jsonify(cached_result)
+    
+    try:
+        send_request, error = build_send_request(request.form, request.files)
+        if error:
+            _request_cache.release(request_id)
+            return jsonify({'success': False, 'message': error})
+        
+        if wants_job_mode(request.form, request.headers):
+            job = send_queue.submit(
+                run_send_job,
+                kind='send',
+                description=f"{send_request['subject']} -> {', '.join(send_request['recipients'])}",
+                send_request=send_request
+            )
+            if job is None:
+                remove_attachments(send_request)
+                _request_cache.release(request_id)
+                return jsonify({'success': False, 'message': 'Send queue is full, please retry shortly'}), 503
             
-            # Store successful result in cache
-            success_result = {'success': True, 'message': 'Email sent'}
-            _request_cache[request_id] = {'time': current_time, 'result': success_result}
-            return jsonify(success_result)
-        else:
-            # Log the failed email send
-            log_entry = {
-                'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                'profile': profile_name,
-                'server': f"{profile['server']}:{profile['port']}",
-                'sender': sender,
-                'recipients': recipients,
-                'cc': cc,
-                'bcc': bcc,
-                'subject': subject,
-                'status': 'Failed',
-                'error': result['error'],
-                'attachments': [os.path.basename(att) for att in attachments] if attachments else [],
-                'smtp_log': result.get('smtp_log', [])
+            job_result = {
+                'success': True,
+                'message': 'Email queued',
+                'job_id': job.id,
+                'status_url': url_for('job_status', job_id=job.id),
+                'events_url': url_for('job_events', job_id=job.id)
             }
-            config_manager.add_log_entry(log_entry)
-            
-            # Store failed result in cache
-            failure_result = {'success': False, 'message': f'Email failed: {result["error"]}'}
-            _request_cache[request_id] = {'time': current_time, 'result': failure_result}
-            return jsonify(failure_result)
+            _request_cache.store(request_id, job_result)
+            return jsonify(job_result), 202
+        
+        response, _ = deliver_email(send_request)
+        
+        # Store result in cache
+        _request_cache.store(request_id, response)
+        return jsonify(response)
     
     except Exception as e:
         logger.exception("Error sending email")
         
         # Store exception result in cache
         exception_result = {'success': False, 'message': f'Email failed: {str(e)}'}
-        _request_cache[request_id] = {'time': current_time, 'result': exception_result}
+        _request_cache.store(request_id, exception_result)
         return jsonify(exception_result)
 
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    """API endpoint to get the status and result of a queued job"""
+    job = send_queue.get(job_id)
+    if not job:
+        return jsonify({'success': False, 'message': f'Job {job_id} not found'}), 404
+    return jsonify({'success': True, 'job': job.to_dict()})
+
+@app.route('/jobs/<job_id>/transcript')
+def job_transcript(job_id):
+    """API endpoint to get the SMTP transcript of a queued job"""
+    job = send_queue.get(job_id)
+    if not job:
+        return jsonify({'success': False, 'message': f'Job {job_id} not found'}), 404
+    return jsonify({'success': True, 'job_id': job.id, 'status': job.status, 'transcript': list(job.transcript)})
+
+def format_sse(event):
+    """Format a job event as a Server-Sent Events message"""
+    return f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+@app.route('/jobs/<job_id>/events')
+def job_events(job_id):
+    """Stream live transcript lines and phase timings of a job as Server-Sent Events
+
+    Events are taken from the job's bounded event queue, so each job supports a
+    single live subscriber. The stream ends with a 'done' event carrying the result.
+    """
+    job = send_queue.get(job_id)
+    if not job:
+        return jsonify({'success': False, 'message': f'Job {job_id} not found'}), 404
+    
+    def generate():
+        while True:
+            try:
+                event = job.events.get(timeout=0.5 if job.done else 15)
+            except queue.Empty:
+                if job.done:
+                    yield format_sse({'type': 'done', 'status': job.status, 'result': job.result})
+                    return
+                # Keep the connection open through proxies while the server is silent
+                yield ": keepalive\n\n"
+                continue
+            yield format_sse(event)
+            if event['type'] == 'done':
+                return
+    
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/jobs/<job_id>/results')
+def job_results(job_id):
+    """API endpoint to get the per-recipient outcomes of a batch job"""
+    job = send_queue.get(job_id)
+    if not job:
+        return jsonify({'success': False, 'message': f'Job {job_id} not found'}), 404
+    return jsonify({'success': True, 'job_id': job.id, 'status': job.status, 'results': list(job.outcomes)})
+
+BATCH_PROGRESS_INTERVAL = 100
+
+def run_batch_job(job, profile_name, profile, template, sender, recipients_path, concurrency,
+                  scheduler=None, max_retries=0):
+    """Job queue entry point for a batch campaign"""
+    settings = config_manager.get_settings()
+    
+    def on_result(outcome):
+        job.outcomes.append(outcome)
+        if len(job.outcomes) % BATCH_PROGRESS_INTERVAL == 0:
+            job.publish({'type': 'progress', 'completed': len(job.outcomes)})
+    
+    try:
+        result = smtp_tool.send_batch(
+            profile=profile,
+            sender=sender,
+            template=template,
+            rows=iter_recipient_rows(recipients_path),
+            concurrency=concurrency,
+            hostname=settings.get('send_hostname'),
+            on_result=on_result,
+            collect_results=False,
+            scheduler=scheduler,
+            max_retries=max_retries
+        )
+    finally:
+        if os.path.exists(recipients_path):
+            os.remove(recipients_path)
+    
+    job.outcomes.sort(key=lambda outcome: outcome['row'])
+    stats = result['stats']
+    config_manager.add_log_entry({
+        'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'profile': profile_name,
+        'server': f"{profile['server']}:{profile['port']}",
+        'sender': sender,
+        'recipients': [f"batch of {stats['total']} recipients"],
+        'cc': [],
+        'bcc': [],
+        'subject': template.subject.source,
+        'status': 'Success' if result['success'] else 'Failed',
+        'error': '' if result['success'] else f"{stats['failed']} failed, {stats['invalid']} invalid",
+        'batch_stats': stats
+    })
+    
+    return {
+        'success': result['success'],
+        'message': f"Batch sent {stats['sent']} of {stats['total']} messages",
+        'stats': stats
+    }
+
+@app.route('/send_batch', methods=['POST'])
+def send_batch():
+    """API endpoint to send a saved template to every row of a CSV/JSONL recipient file
+
+    The batch always runs as a background job; progress and the final stats are
+    available from the job endpoints and per-recipient outcomes from
+    ``/jobs/<job_id>/results``.
+    """
+    try:
+        profile_name = request.form.get('profile')
+        profile = config_manager.get_profile(profile_name)
+        if not profile:
+            return jsonify({'success': False, 'message': f'Profile {profile_name} not found'})
+        
+        template_name = request.form.get('template')
+        template = template_engine.get(template_name)
+        if not template:
+            return jsonify({'success': False, 'message': f'Template {template_name} not found'})
+        
+        sender = request.form.get('sender', '')
+        try:
+            validate_email(sender)
+        except ValueError as e:
+            return jsonify({'success': False, 'message': f'Invalid sender address: {sender} - {str(e)}'})
+        
+        recipients_file = request.files.get('recipients_file')
+        if not recipients_file or not recipients_file.filename:
+            return jsonify({'success': False, 'message': 'A CSV or JSONL recipients file is required'})
+        
+        concurrency = max(1, min(int(request.form.get('concurrency', 4)), 64))
+        scheduler = SendScheduler.from_profile(
+            profile,
+            rate=request.form.get('rate', type=float),
+            domain_rate=request.form.get('domain_rate', type=float),
+            domain_concurrency=request.form.get('domain_concurrency', type=int),
+            max_pending=concurrency * 100
+        )
+        max_retries = max(0, min(request.form.get('retries', 0, type=int), 10))
+        
+        # Keep the extension so the file format can be detected
+        recipients_path = os.path.join('/tmp', f"batch-{uuid.uuid4().hex}-{secure_filename(recipients_file.filename)}")
+        recipients_file.save(recipients_path)
+        
+        job = send_queue.submit(
+            run_batch_job,
+            kind='batch',
+            description=f"{template_name} -> {recipients_file.filename}",
+            profile_name=profile_name,
+            profile=profile,
+            template=template,
+            sender=sender,
+            recipients_path=recipients_path,
+            concurrency=concurrency,
+            scheduler=scheduler,
+            max_retries=max_retries
+        )
+        if job is None:
+            os.remove(recipients_path)
+            return jsonify({'success': False, 'message': 'Send queue is full, please retry shortly'}), 503
+        
+        return jsonify({
+            'success': True,
+            'message': 'Batch queued',
+            'job_id': job.id,
+            'status_url': url_for('job_status', job_id=job.id),
+            'events_url': url_for('job_events', job_id=job.id),
+            'results_url': url_for('job_results', job_id=job.id)
+        }), 202
+    
+    except Exception as e:
+        logger.exception("Error queueing batch")
+        return jsonify({'success': False, 'message': f'Batch failed: {str(e)}'})
+
+@app.route('/jobs')
+def job_queue_stats():
+    """API endpoint to get send queue depth"""
+    return jsonify({'success': True, 'queue': send_queue.stats()})
+
+@app.route('/spool')
+def spool_status():
+    """API endpoint to get spool depth, age and the queued entries"""
+    include_failed = request.args.get('failed', '1') != '0'
+    return jsonify({'success': True, 'stats': mail_spool.stats(),
+                    'entries': mail_spool.list(include_failed=include_failed)})
+
+@app.route('/spool/<entry_id>/retry', methods=['POST'])
+def spool_retry(entry_id):
+    """API endpoint to retry a spooled message now"""
+    if not mail_spool.retry_now(entry_id):
+        return jsonify({'success': False, 'message': f'Spool entry {entry_id} not found'}), 404
+    return jsonify({'success': True})
+
+@app.route('/spool/<entry_id>', methods=['DELETE'])
+def spool_delete(entry_id):
+    """API endpoint to drop a spooled message"""
+    if not mail_spool.delete(entry_id):
+        return jsonify({'success': False, 'message': f'Spool entry {entry_id} not found'}), 404
+    return jsonify({'success': True})
+
 @app.route('/settings')
+@conditional('profiles', 'settings')
 def settings():
     """Render the settings page for managing SMTP profiles"""
     smtp_profiles = config_manager.get_profiles()
@@ -388,6 +981,7 @@ def settings():
     return render_template('settings.html', smtp_profiles=smtp_profiles, settings=app_settings)
 
 @app.route('/advanced_settings')
+@conditional('settings')
 def advanced_settings():
     """Render the advanced settings page"""
     app_settings = config_manager.get_settings()
@@ -494,6 +1088,7 @@ def delete_recipient():
         return jsonify({'success': False, 'message': str(e)})
 
 @app.route('/addresses')
+@conditional('settings')
 def addresses():
     """Render the email addresses management page"""
     settings = config_manager.get_settings()
@@ -516,6 +1111,9 @@ def update_settings():
             'log_retention_days': int(request.form.get('log_retention_days', 30)),
             'log_smtp_traffic': request.form.get('log_smtp_traffic') == 'on',
             'log_message_content': request.form.get('log_message_content') == 'on',
+            'archive_messages': request.form.get('archive_messages') == 'on',
+            'optimize_transfer_encoding': request.form.get('optimize_transfer_encoding') == 'on',
+            'spool_deferred': request.form.get('spool_deferred') == 'on',
             'max_attachment_size_mb': int(request.form.get('max_attachment_size_mb', 10))
         }
         
@@ -533,6 +1131,16 @@ def update_settings():
         flash(f'Error updating settings: {str(e)}', 'danger')
         return redirect(url_for('advanced_settings'))
 
+@app.route('/get_profiles')
+@conditional('profiles')
+def get_profiles():
+    """API endpoint to get all SMTP profiles without their passwords, cacheable with If-None-Match"""
+    profiles = {}
+    for name, profile in config_manager.get_profiles().items():
+        profiles[name] = {key: value for key, value in profile.items() if key != 'password'}
+        profiles[name]['has_password'] = bool(profile.get('password'))
+    return jsonify({'success': True, 'profiles': profiles})
+
 @app.route('/add_profile', methods=['POST'])
 def add_profile():
     """API endpoint to add a new SMTP profile"""
@@ -592,6 +1200,7 @@ def delete_profile(name):
         return redirect(url_for('settings'))
 
 @app.route('/templates')
+@conditional('templates')
 def templates():
     """Render the templates page for managing email templates"""
     all_templates = config_manager.get_templates()
@@ -607,6 +1216,14 @@ def templates():
     
     return render_template('templates.html', email_templates=email_templates)
 
+@app.route('/get_templates')
+@conditional('templates')
+def get_templates():
+    """API endpoint to get all email templates, cacheable with If-None-Match"""
+    all_templates = config_manager.get_templates()
+    email_templates = {k: v for k, v in all_templates.items() if not k.startswith('_')}
+    return jsonify({'success': True, 'templates': email_templates})
+
 @app.route('/add_template', methods=['POST'])
 def add_template():
     """API endpoint to add a new email template"""
@@ -711,6 +1328,23 @@ def test_connection():
         # Get application settings for hostname configuration
         settings = config_manager.get_settings()
         
+        if wants_job_mode(request.form, request.headers):
+            job = send_queue.submit(
+                run_test_connection_job,
+                kind='test_connection',
+                description=f"{profile['server']}:{profile['port']}",
+                profile=profile,
+                hostname=settings.get('send_hostname')
+            )
+            if job is None:
+                return jsonify({'success': False, 'message': 'Send queue is full, please retry shortly'}), 503
+            return jsonify({
+                'success': True,
+                'job_id': job.id,
+                'status_url': url_for('job_status', job_id=job.id),
+                'events_url': url_for('job_events', job_id=job.id)
+            }), 202
+        
         result = smtp_tool.test_connection(
             server=profile['server'],
             port=profile['port'],
@@ -739,84 +1373,116 @@ def get_test_data():
         # Get recipient from the first request parameter or use a default
         recipient = request.args.get('recipient', default_sender)
         
-        # Base test data
-        test_data = {
-            'sender': default_sender,
-            'recipients': [recipient],
-            'cc': [],
-            'bcc': [],
-            'body_type': 'plain'
-        }
-        
-        if test_type == 'pdf':
-            # PDF attachment test
-            test_data.update({
-                'subject': 'PDF Attachment Test',
-                'body': 'This email contains a standard PDF attachment generated for testing purposes.',
-                'special_attachment': {
-                    'type': 'pdf',
-                    'malformed': False,
-                    'active_content': False
-                }
-            })
-        
-        elif test_type == 'pdf-malformed':
-            # Malformed PDF attachment test
-            test_data.update({
-                'subject': 'Malformed PDF Test',
-                'body': 'This email contains a malformed PDF attachment intended for testing how systems handle invalid PDFs.',
-                'special_attachment': {
-                    'type': 'pdf',
-                    'malformed': True,
-                    'active_content': False
-                }
-            })
-        
-        elif test_type == 'pdf-active':
-            # PDF with active content
-            test_data.update({
-                'subject': 'PDF with Active Content Test',
-                'body': 'This email contains a PDF with simulated active content (JavaScript) for testing security policies.',
-                'special_attachment': {
-                    'type': 'pdf',
-                    'malformed': False,
-                    'active_content': True
-                }
-            })
-        
-        # Removed docx and xlsx test types as requested
+        try:
+            test_data = special_test_data(smtp_tool, test_type, default_sender, recipient)
+        except ValueError as e:
+            return jsonify({'success': False, 'message': str(e)})
         
-        elif test_type == 'eicar':
-            # EICAR antivirus test
-            test_data.update({
-                'subject': 'EICAR Antivirus Test File',
-                'body': """This email contains the EICAR antivirus test file as an attachment.
+        return jsonify({'success': True, 'test_data': test_data})
+    
+    except Exception as e:
+        logger.exception("Error getting test data")
+        return jsonify({'success': False, 'message': f'An error occurred: {str(e)}'})
 
-The EICAR test file is a standard test file developed by the European Institute for Computer Antivirus Research to safely test antivirus software without using actual malware.
+def run_sweep_request(profile_names, sender, recipients, tests, expect_reject, concurrency, on_result=None):
+    """
+    Run a security sweep across saved profiles and record it in the log
 
-When this email is delivered, most antivirus systems should detect the attachment as a threat, even though it's completely harmless.
+    Returns:
+        dict: Report from run_sweep
+    """
+    settings = config_manager.get_settings()
+    targets = [(name, config_manager.get_profile(name)) for name in profile_names]
+    report = run_sweep(targets, sender, recipients, tests=tests, expect_reject=expect_reject,
+                       concurrency=concurrency, hostname=settings.get('send_hostname'), tool=smtp_tool,
+                       on_result=on_result)
+    config_manager.add_log_entry({
+        'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'profile': ', '.join(profile_names),
+        'server': ', '.join(f"{profile['server']}:{profile['port']}" for _, profile in targets),
+        'sender': sender,
+        'recipients': recipients,
+        'cc': [],
+        'bcc': [],
+        'subject': f"Security sweep: {', '.join(tests or SPECIAL_TESTS)}",
+        'status': 'Success' if report['success'] else 'Failed',
+        'error': '' if report['success'] else f"{report['failed']} of {len(report['results'])} checks failed",
+        'sweep_summary': report['summary']
+    })
+    return report
 
-Note: Your email system or antivirus might block this email entirely.""",
-                'special_attachment': {
-                    'type': 'eicar'
-                }
-            })
+
+def run_sweep_job(job, **kwargs):
+    """Job queue entry point for a security sweep"""
+    def on_result(row):
+        job.outcomes.append(row)
+        job.publish({'type': 'progress', 'completed': len(job.outcomes)})
+    
+    report = run_sweep_request(on_result=on_result, **kwargs)
+    report['message'] = f"Sweep passed {report['passed']} of {len(report['results'])} checks"
+    return report
+
+@app.route('/sweep', methods=['POST'])
+def sweep():
+    """API endpoint to send every special test email through one or more profiles
+
+    Each test message is built once and sent to all profiles concurrently;
+    the response is one report with pass/fail and latency per profile and
+    test. With ``mode=job`` the sweep runs on the send worker pool and each
+    result is available from ``/jobs/<job_id>/results`` as it completes.
+    """
+    try:
+        profile_names = [name.strip() for name in request.form.get('profiles', '').split(',') if name.strip()]
+        if not profile_names:
+            return jsonify({'success': False, 'message': 'At least one profile is required'})
+        for name in profile_names:
+            if not config_manager.get_profile(name):
+                return jsonify({'success': False, 'message': f'Profile {name} not found'})
         
-        elif test_type == 'spf':
-            # SPF test only
-            spf_test = smtp_tool.create_spf_test_email(recipient)
-            test_data.update(spf_test)
-            
-        # Removed DKIM, DMARC, and combined tests as requested
-            
-        else:
-            return jsonify({'success': False, 'message': f'Unknown test type: {test_type}'})
+        settings = config_manager.get_settings()
+        sender = request.form.get('sender') or settings.get('default_sender', f'smtp@{socket.getfqdn()}')
+        recipients = [email.strip() for email in request.form.get('recipients', '').split(',') if email.strip()]
+        if not recipients:
+            return jsonify({'success': False, 'message': 'At least one recipient is required'})
+        for email in [sender] + recipients:
+            try:
+                validate_email(email)
+            except ValueError as e:
+                return jsonify({'success': False, 'message': f'Invalid email address: {email} - {str(e)}'})
         
-        return jsonify({'success': True, 'test_data': test_data})
+        tests = [test.strip() for test in request.form.get('tests', '').split(',') if test.strip()] or None
+        unknown = [test for test in tests or [] if test not in SPECIAL_TESTS]
+        if unknown:
+            return jsonify({'success': False, 'message': f"Unknown test types: {', '.join(unknown)}"})
+        expect_reject = [test.strip() for test in request.form.get('expect_reject', '').split(',') if test.strip()]
+        concurrency = max(1, min(request.form.get('concurrency', 8, type=int), 64))
+        
+        sweep_args = {
+            'profile_names': profile_names,
+            'sender': sender,
+            'recipients': recipients,
+            'tests': tests,
+            'expect_reject': expect_reject,
+            'concurrency': concurrency
+        }
+        if wants_job_mode(request.form, request.headers):
+            job = send_queue.submit(run_sweep_job, kind='sweep', description=f"sweep -> {', '.join(profile_names)}",
+                                    **sweep_args)
+            if job is None:
+                return jsonify({'success': False, 'message': 'Send queue is full, please retry shortly'}), 503
+            return jsonify({
+                'success': True,
+                'job_id': job.id,
+                'status_url': url_for('job_status', job_id=job.id),
+                'events_url': url_for('job_events', job_id=job.id),
+                'results_url': url_for('job_results', job_id=job.id)
+            }), 202
+        
+        return jsonify(run_sweep_request(**sweep_args))
     
     except Exception as e:
-        logger.exception("Error getting test data")
-        return jsonify({'success': False, 'message': f'An error occurred: {str(e)}'})
+        logger.exception("Error running security sweep")
+        return jsonify({'success': False, 'message': f'Sweep failed: {str(e)}'})
 
 @app.route('/health_check')
 def health_check():
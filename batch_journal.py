@@ -0,0 +1,308 @@
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+import uuid
+
+from smtp_tool import iter_recipient_rows
+
+logger = logging.getLogger(__name__)
+
+# Replies that name the server's queue ID (Postfix, Exim, Gmail, generic)
+QUEUE_ID_PATTERNS = [
+    re.compile(r'queued as ([\w.\-]+)', re.IGNORECASE),
+    re.compile(r'\bid=([\w.\-]+)', re.IGNORECASE),
+    re.compile(r'\b([\w.\-]+) - gsmtp\b'),
+    re.compile(r'\bmessage ([\w.\-]+) accepted\b', re.IGNORECASE)
+]
+
+
+def parse_queue_id(reply):
+    """
+    Extract the server's queue ID from a reply to the message data
+
+    Args:
+        reply (str): Reply text after the status code
+
+    Returns:
+        str: Queue ID, or None if the reply does not name one
+    """
+    for pattern in QUEUE_ID_PATTERNS:
+        match = pattern.search(reply or '')
+        if match:
+            return match.group(1)
+    return None
+
+
+def is_complete(outcome):
+    """
+    Whether a journaled outcome should be skipped when a run is resumed
+
+    Sent and invalid rows are done, and so are permanent (5xx) failures;
+    temporary failures and transport errors are sent again.
+    """
+    if outcome['status'] in ('sent', 'invalid'):
+        return True
+    return outcome['status'] == 'failed' and (outcome.get('code') or 0) >= 500
+
+
+def _write_json_atomic(path, data):
+    directory = os.path.dirname(path)
+    fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(data, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+    except Exception:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def _truncate_torn_line(path):
+    """Cut a partial last line left by a crash so new lines start cleanly"""
+    try:
+        with open(path, 'r+b') as f:
+            end = f.seek(0, os.SEEK_END)
+            position = end
+            while position > 0:
+                block = min(4096, position)
+                f.seek(position - block)
+                newline = f.read(block).rfind(b'\n')
+                if newline >= 0:
+                    position = position - block + newline + 1
+                    break
+                position -= block
+            if position != end:
+                f.truncate(position)
+    except FileNotFoundError:
+        pass
+
+
+class BatchJournal:
+    """Durable, append-only progress journal for a batch run
+
+    Every outcome is appended to journal.jsonl with the row's byte offset in
+    the recipients file and the server's queue ID. Writes are fsynced in
+    groups (every ``sync_every`` outcomes or ``sync_interval`` seconds), and
+    after each group a checkpoint in index.json records the lowest row still
+    in flight, its byte offset and the journal size when it was dispatched.
+
+    Resuming seeks the recipients file to the checkpoint and reads only the
+    journal written since, so restarting costs the same regardless of how far
+    the run got. Rows are sent at least once: outcomes after the last fsync
+    are lost on a crash and those rows are sent again.
+    """
+
+    def __init__(self, directory, sync_every=500, sync_interval=1.0):
+        """
+        Open a run directory created by BatchJournal.create
+
+        Args:
+            directory (str): Run directory
+            sync_every (int, optional): Outcomes per fsync
+            sync_interval (float, optional): Maximum seconds between fsyncs
+        """
+        self.directory = directory
+        self.run_id = os.path.basename(directory.rstrip(os.sep))
+        self.journal_file = os.path.join(directory, 'journal.jsonl')
+        self.index_file = os.path.join(directory, 'index.json')
+        self.sync_every = sync_every
+        self.sync_interval = sync_interval
+        with open(os.path.join(directory, 'meta.json'), 'r') as f:
+            self.meta = json.load(f)
+        try:
+            with open(self.index_file, 'r') as f:
+                self.checkpoint = json.load(f)
+        except FileNotFoundError:
+            self.checkpoint = {'row': 0, 'offset': 0, 'journal': 0, 'failed': []}
+
+        self._lock = threading.Lock()
+        _truncate_torn_line(self.journal_file)
+        self._file = open(self.journal_file, 'ab')
+        self._written = self._file.tell()
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+        # row -> (input offset, journal size at dispatch) for rows being sent
+        self._inflight = {}
+        # Rows completed since the checkpoint, and failed rows before it -> input offset to send again
+        self._done, self._failed = self._read_tail()
+        # Rows below this were completed or failed before this session
+        self._first_row = self.checkpoint['row']
+        self._next_row = self.checkpoint['row']
+        self._next_offset = self.checkpoint['offset']
+        self.skipped = 0
+
+    @classmethod
+    def create(cls, base_dir, recipients_path, **meta):
+        """
+        Start the journal for a new run
+
+        Args:
+            base_dir (str): Directory holding all run directories
+            recipients_path (str): Recipients file the run reads
+            **meta: Run settings to keep for resuming (profile, template, sender, ...)
+
+        Returns:
+            BatchJournal: Journal for the new run
+        """
+        run_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
+        directory = os.path.join(base_dir, run_id)
+        os.makedirs(directory)
+        stat = os.stat(recipients_path)
+        meta.update({
+            'run_id': run_id,
+            'recipients': os.path.abspath(recipients_path),
+            'recipients_size': stat.st_size,
+            'recipients_mtime': stat.st_mtime,
+            'created': time.strftime('%Y-%m-%d %H:%M:%S')
+        })
+        _write_json_atomic(os.path.join(directory, 'meta.json'), meta)
+        return cls(directory)
+
+    @classmethod
+    def open(cls, base_dir, run_id):
+        """
+        Open the journal of an earlier run for resuming
+
+        Args:
+            base_dir (str): Directory holding all run directories
+            run_id (str): Run ID printed when the run started
+
+        Returns:
+            BatchJournal: Journal positioned at the last checkpoint
+
+        Raises:
+            FileNotFoundError: If the run does not exist
+            ValueError: If the recipients file changed since the run started
+        """
+        directory = os.path.join(base_dir, os.path.basename(run_id))
+        if not os.path.isfile(os.path.join(directory, 'meta.json')):
+            raise FileNotFoundError(f"Batch run '{run_id}' not found")
+        journal = cls(directory)
+        stat = os.stat(journal.meta['recipients'])
+        if stat.st_size != journal.meta['recipients_size'] or stat.st_mtime != journal.meta['recipients_mtime']:
+            journal.close()
+            raise ValueError(f"Recipients file {journal.meta['recipients']} changed since run {run_id} started")
+        return journal
+
+    def _read_tail(self):
+        """
+        Read the outcomes journaled since the checkpoint
+
+        Returns:
+            tuple: (rows completed at or after the checkpoint row, failed rows
+            before it mapped to their input offsets)
+        """
+        done = set()
+        failed = {int(row): offset for row, offset in self.checkpoint['failed']}
+        with open(self.journal_file, 'rb') as f:
+            f.seek(self.checkpoint['journal'])
+            for line in f:
+                try:
+                    outcome = json.loads(line)
+                except ValueError:
+                    # A torn last line from a crash; the row is sent again
+                    continue
+                if is_complete(outcome):
+                    done.add(outcome['row'])
+                    failed.pop(outcome['row'], None)
+                elif outcome['row'] < self.checkpoint['row']:
+                    failed[outcome['row']] = outcome['offset']
+        return done, failed
+
+    def rows(self):
+        """
+        Yield the rows this run still has to send
+
+        Failed rows from before the checkpoint are read first by seeking to
+        their offsets, then the recipients file is read from the checkpoint,
+        skipping rows already completed.
+
+        Yields:
+            tuple: (row index, row dict)
+        """
+        path = self.meta['recipients']
+        start = self.checkpoint['offset']
+        with self._lock:
+            retries = sorted(self._failed.items())
+        for index, offset in retries:
+            for row, _ in iter_recipient_rows(path, start=offset, offsets=True):
+                with self._lock:
+                    self._failed.pop(index, None)
+                    self._inflight[index] = (offset, self._written)
+                yield index, row
+                break
+
+        index = self._first_row
+        for row, end in iter_recipient_rows(path, start=start or None, offsets=True):
+            with self._lock:
+                done = index in self._done
+                if done:
+                    self.skipped += 1
+                else:
+                    self._inflight[index] = (start, self._written)
+                self._next_row = index + 1
+                self._next_offset = end
+            if not done:
+                yield index, row
+            index += 1
+            start = end
+
+    def record(self, outcome):
+        """
+        Append one row's outcome to the journal
+
+        Args:
+            outcome (dict): Outcome from send_batch with 'row' and 'status'
+        """
+        with self._lock:
+            offset, _ = self._inflight.pop(outcome['row'], (None, None))
+            if offset is None:
+                return
+            entry = dict(outcome, offset=offset)
+            queue_id = parse_queue_id(outcome.get('reply'))
+            if queue_id:
+                entry['queue_id'] = queue_id
+            data = json.dumps(entry).encode('utf-8') + b'\n'
+            self._file.write(data)
+            self._written += len(data)
+            if not is_complete(entry):
+                self._failed[outcome['row']] = offset
+            self._unsynced += 1
+            if self._unsynced >= self.sync_every or time.monotonic() - self._last_sync >= self.sync_interval:
+                self._sync()
+
+    def _sync(self):
+        """fsync the journal, then move the checkpoint up to the lowest row still in flight"""
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        in_order = [(row, value) for row, value in self._inflight.items() if row >= self._first_row]
+        if in_order:
+            row, (offset, journal_offset) = min(in_order)
+        else:
+            row, offset, journal_offset = self._next_row, self._next_offset, self._written
+        failed = sorted([index, offset] for index, offset in self._failed.items() if index < row)
+        # Failed rows still in flight were read by seeking, not in order; keep them pending
+        failed += sorted([index, value[0]] for index, value in self._inflight.items() if index < self._first_row)
+        self.checkpoint = {'row': row, 'offset': offset, 'journal': journal_offset, 'failed': failed}
+        _write_json_atomic(self.index_file, self.checkpoint)
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def sync(self):
+        """Make every recorded outcome durable now"""
+        with self._lock:
+            self._sync()
+
+    def close(self):
+        """Sync and close the journal"""
+        if self._file.closed:
+            return
+        self.sync()
+        self._file.close()
@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+"""Benchmark the send path against a local SMTP sink
+
+Each scenario runs in a forked child process so CPU time and peak RSS are
+measured for that scenario alone; the sink runs in its own process so its
+work is not counted against the client.
+
+Usage:
+    python benchmarks/bench_send.py [--count N] [--matrix] [--output results.json]
+    python benchmarks/bench_send.py --save-baseline baseline.json
+    python benchmarks/bench_send.py --baseline baseline.json [--threshold 0.1]
+"""
+import argparse
+import itertools
+import json
+import logging
+import math
+import multiprocessing
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from smtp_sink import SMTPSink
+from smtp_tool import SMTPTool
+
+# Scenario used as the starting point when varying one dimension at a time
+BASE_SCENARIO = {'path': 'send_email', 'mode': 'plain', 'body_kb': 10, 'attachments': 0, 'recipients': 1}
+
+# Values tried for each dimension
+DIMENSIONS = {
+    'mode': ['plain', 'starttls', 'ssl'],
+    'body_kb': [1, 10, 100, 1000],
+    'attachments': [0, 1, 5],
+    'recipients': [1, 10, 50],
+    'path': ['send_email', 'send_batch', 'send_grouped']
+}
+
+# Metrics compared against a baseline, and whether higher is better
+COMPARED_METRICS = {'messages_per_second': True, 'p50_ms': False, 'p99_ms': False, 'cpu_seconds': False}
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not values:
+        return 0.0
+    rank = math.ceil(pct / 100.0 * len(values))
+    return values[min(len(values) - 1, max(0, rank - 1))]
+
+
+def scenario_name(scenario):
+    return (f"{scenario['path']}/{scenario['mode']}/body{scenario['body_kb']}k/"
+            f"att{scenario['attachments']}/rcpt{scenario['recipients']}")
+
+
+def build_scenarios(matrix):
+    """Vary one dimension at a time from BASE_SCENARIO, or every combination"""
+    if matrix:
+        keys = list(DIMENSIONS)
+        return [dict(zip(keys, values)) for values in itertools.product(*(DIMENSIONS[k] for k in keys))]
+    scenarios = [dict(BASE_SCENARIO)]
+    for key, values in DIMENSIONS.items():
+        for value in values:
+            scenario = dict(BASE_SCENARIO, **{key: value})
+            if scenario not in scenarios:
+                scenarios.append(scenario)
+    return scenarios
+
+
+def run_sink(ports, stop):
+    """Child process entry point running the sink until told to stop"""
+    logging.disable(logging.CRITICAL)
+    sink = SMTPSink(port=0, ssl_port=0).start_in_thread()
+    ports.send((sink.port, sink.ssl_port))
+    stop.wait()
+    ports.send(sink.stats.snapshot())
+    sink.stop()
+
+
+def profile_for(mode, ports):
+    port, ssl_port = ports
+    return {
+        'server': '127.0.0.1',
+        'port': ssl_port if mode == 'ssl' else port,
+        'use_tls': mode == 'starttls',
+        'use_ssl': mode == 'ssl',
+        'no_tls_verify': True,
+        'username': '',
+        'password': ''
+    }
+
+
+def run_scenario(scenario, ports, count, attachment_kb, concurrency, result_pipe):
+    """Child process entry point timing one scenario"""
+    logging.disable(logging.CRITICAL)
+    # smtplib debug output is echoed to stderr by the transcript capture; keep
+    # paying for the write but not flooding the terminal
+    sys.stderr = open(os.devnull, 'w')
+    tool = SMTPTool()
+    profile = profile_for(scenario['mode'], ports)
+    body = ('Lorem ipsum dolor sit amet, consectetur adipiscing elit.\n' * 20000)[:scenario['body_kb'] * 1024]
+    recipients = [f'user{i}@example.com' for i in range(scenario['recipients'])]
+
+    attachment_dir = tempfile.mkdtemp(prefix='bench-send-')
+    attachments = []
+    for i in range(scenario['attachments']):
+        path = os.path.join(attachment_dir, f'attachment{i}.bin')
+        with open(path, 'wb') as f:
+            f.write(os.urandom(attachment_kb * 1024))
+        attachments.append(path)
+
+    latencies = []
+    failures = 0
+    cpu_start = time.process_time()
+    start = time.perf_counter()
+    if scenario['path'] == 'send_email':
+        for _ in range(count):
+            started = time.perf_counter()
+            result = tool.send_email(
+                server=profile['server'], port=profile['port'], use_tls=profile['use_tls'],
+                use_ssl=profile['use_ssl'], username=None, password=None,
+                sender='bench@example.com', recipients=recipients, subject='Benchmark',
+                body=body, attachments=attachments or None, no_tls_verify=True)
+            latencies.append(time.perf_counter() - started)
+            failures += 0 if result['success'] else 1
+    elif scenario['path'] == 'send_batch':
+        rows = ({'email': recipients[i % len(recipients)].replace('@', f'+{i}@')} for i in range(count))
+        result = tool.send_batch(profile, 'bench@example.com', {'subject': 'Benchmark', 'body': body},
+                                 rows, concurrency=concurrency)
+        latencies = [outcome['seconds'] for outcome in result['results']]
+        failures = result['stats']['failed']
+    else:
+        message = tool.build_message('bench@example.com', recipients, subject='Benchmark', body=body,
+                                     attachments=attachments or None).as_bytes()
+        for _ in range(count):
+            started = time.perf_counter()
+            result = tool.send_grouped(profile, 'bench@example.com', recipients, message)
+            latencies.append(time.perf_counter() - started)
+            failures += 0 if result['success'] else 1
+    elapsed = time.perf_counter() - start
+    cpu = time.process_time() - cpu_start
+    shutil.rmtree(attachment_dir, ignore_errors=True)
+
+    latencies.sort()
+    result_pipe.send({
+        'name': scenario_name(scenario),
+        'scenario': scenario,
+        'messages': count,
+        'failures': failures,
+        'seconds': round(elapsed, 4),
+        'messages_per_second': round(count / elapsed, 2) if elapsed > 0 else 0,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+        'cpu_seconds': round(cpu, 4),
+        'peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    })
+
+
+def compare(results, baseline, threshold):
+    """Compare results with a baseline run, flagging changes worse than threshold"""
+    previous = {entry['name']: entry for entry in baseline.get('results', [])}
+    comparison = []
+    regressions = 0
+    for entry in results:
+        before = previous.get(entry['name'])
+        if not before:
+            continue
+        changes = {}
+        for metric, higher_is_better in COMPARED_METRICS.items():
+            if not before.get(metric):
+                continue
+            change = (entry[metric] - before[metric]) / before[metric]
+            regressed = change < -threshold if higher_is_better else change > threshold
+            changes[metric] = {'baseline': before[metric], 'current': entry[metric],
+                               'change': round(change, 4), 'regressed': regressed}
+            regressions += regressed
+        comparison.append({'name': entry['name'], 'metrics': changes})
+    return comparison, regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the SMTP send path against a local sink')
+    parser.add_argument('--count', '-n', type=int, default=200, help='Messages per scenario (default: 200)')
+    parser.add_argument('--matrix', action='store_true', help='Run every combination instead of one dimension at a time')
+    parser.add_argument('--only', help='Only run scenarios whose name contains this text')
+    parser.add_argument('--attachment-kb', type=int, default=100, help='Size of each attachment (default: 100)')
+    parser.add_argument('--concurrency', '-c', type=int, default=4, help='Sessions for send_batch (default: 4)')
+    parser.add_argument('--output', '-o', help='Write the JSON report to this file instead of stdout')
+    parser.add_argument('--save-baseline', help='Also save the report as a baseline file')
+    parser.add_argument('--baseline', help='Compare against a saved baseline')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='Relative change counted as a regression (default: 0.1)')
+    parser.add_argument('--timeout', type=float, default=600,
+                        help='Seconds a scenario may run before it is counted as failed (default: 600)')
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context('fork')
+    sink_pipe, child_pipe = context.Pipe()
+    stop = context.Event()
+    sink = context.Process(target=run_sink, args=(child_pipe, stop), daemon=True)
+    sink.start()
+    ports = sink_pipe.recv()
+
+    results = []
+    failed = []
+    try:
+        for scenario in build_scenarios(args.matrix):
+            if args.only and args.only not in scenario_name(scenario):
+                continue
+            receive, send = context.Pipe(duplex=False)
+            worker = context.Process(target=run_scenario,
+                                     args=(scenario, ports, args.count, args.attachment_kb, args.concurrency, send))
+            worker.start()
+            # Only the child may hold the send end, so its exit shows up as EOF
+            send.close()
+            try:
+                if not receive.poll(args.timeout):
+                    raise TimeoutError(f"no result after {args.timeout:g}s")
+                result = receive.recv()
+            except (EOFError, TimeoutError) as e:
+                if worker.is_alive():
+                    worker.terminate()
+                worker.join()
+                error = str(e) if isinstance(e, TimeoutError) else f"worker exited with code {worker.exitcode}"
+                print(f"{scenario_name(scenario)}: failed ({error})", file=sys.stderr)
+                failed.append({'name': scenario_name(scenario), 'scenario': scenario, 'error': error})
+                continue
+            finally:
+                receive.close()
+            worker.join()
+            print(f"{result['name']}: {result['messages_per_second']} msg/s, p99 {result['p99_ms']} ms",
+                  file=sys.stderr)
+            results.append(result)
+    finally:
+        stop.set()
+        sink_stats = sink_pipe.recv() if sink_pipe.poll(5) else None
+        sink.join(timeout=5)
+
+    report = {
+        'benchmark': 'send_path',
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': sys.version.split()[0],
+        'count': args.count,
+        'results': results,
+        'failed': failed,
+        'sink': sink_stats
+    }
+    exit_code = 1 if failed else 0
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            report['comparison'], regressions = compare(results, json.load(f), args.threshold)
+        report['regressions'] = regressions
+        exit_code = 1 if regressions or failed else 0
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    else:
+        print(output)
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            f.write(output)
+    return exit_code
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""Benchmark ConfigManager storage operations and Flask routes
+
+A throwaway home directory is seeded with realistic volumes (profiles,
+templates, log entries with SMTP transcripts and long saved address lists)
+before the app is imported, so the real ~/.smtp_tool is never touched.
+Routes are driven through the Flask test client; /send_email and
+/test_connection talk to a local SMTP sink.
+
+Usage:
+    python benchmarks/bench_storage.py [--profiles N] [--templates N] [--logs N]
+        [--saved N] [--iterations N] [--skip-web] [--output results.json]
+"""
+import argparse
+import json
+import logging
+import math
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not values:
+        return 0.0
+    rank = math.ceil(pct / 100.0 * len(values))
+    return values[min(len(values) - 1, max(0, rank - 1))]
+
+
+def measure(name, func, iterations, setup=None):
+    """
+    Time repeated calls, excluding an optional untimed setup step before each
+
+    Returns:
+        dict: Operations per second and p50/p99/max latency in milliseconds
+    """
+    latencies = []
+    for i in range(iterations):
+        if setup:
+            setup()
+        started = time.perf_counter()
+        func(i)
+        latencies.append(time.perf_counter() - started)
+    total = sum(latencies)
+    latencies.sort()
+    result = {
+        'name': name,
+        'iterations': iterations,
+        'ops_per_second': round(iterations / total, 2) if total > 0 else 0,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+        'max_ms': round(latencies[-1] * 1000, 3)
+    }
+    print(f"{name}: {result['ops_per_second']} ops/s, p50 {result['p50_ms']} ms, p99 {result['p99_ms']} ms",
+          file=sys.stderr)
+    return result
+
+
+def sample_transcript(index):
+    lines = ["Connecting to 127.0.0.1:2525...", "reply: 220 smtp-sink.local ESMTP sink ready",
+             "send: ehlo bench.local", "reply: 250-smtp-sink.local", "reply: 250-PIPELINING",
+             "reply: 250-SIZE 104857600", "reply: 250 AUTH PLAIN LOGIN",
+             f"send: mail FROM:<sender{index}@example.com> size=2048",
+             "reply: 250 2.1.0 OK"]
+    lines += [f"send: rcpt TO:<user{index}-{n}@example.com>" for n in range(5)]
+    lines += ["reply: 250 2.1.5 OK"] * 5
+    lines += ["send: data", "reply: 354 End data with <CR><LF>.<CR><LF>",
+              "data: Subject: Relay test\nFrom: sender@example.com\n\n" + "Body line of the message.\n" * 20,
+              "reply: 250 2.0.0 OK: queued", "send: quit", "reply: 221 2.0.0 Bye"]
+    return lines
+
+
+def seed(config_dir, args, sink_port):
+    """Write seeded configuration files directly"""
+    profiles = {f'profile-{i}': {
+        'server': f'smtp{i}.example.com', 'port': 587, 'use_tls': True, 'use_ssl': False,
+        'no_tls_verify': False, 'username': f'user{i}', 'password': 'secret'
+    } for i in range(args.profiles)}
+    profiles['sink'] = {'server': '127.0.0.1', 'port': sink_port, 'use_tls': False, 'use_ssl': False,
+                        'no_tls_verify': True, 'username': '', 'password': ''}
+
+    templates = {f'template-{i}': {
+        'subject': f'Relay test {i} for {{{{ first_name }}}}',
+        'body': 'Hello {{ first_name }},\n\n' + 'Lorem ipsum dolor sit amet. ' * 40,
+        'body_type': 'html' if i % 3 == 0 else 'plain'
+    } for i in range(args.templates)}
+
+    statuses = ['Success'] * 9 + ['Failed']
+    logs = [{
+        'timestamp': f'2026-{1 + i % 12:02d}-{1 + i % 28:02d} {i % 24:02d}:{i % 60:02d}:{i % 60:02d}',
+        'profile': f'profile-{i % max(1, args.profiles)}',
+        'server': f'smtp{i % 50}.example.com:587',
+        'sender': f'sender{i % 100}@example.com',
+        'recipients': [f'user{i}@example.com'],
+        'cc': [], 'bcc': [],
+        'subject': f'Relay test {i}',
+        'status': random.choice(statuses),
+        'error': '',
+        'smtp_log': sample_transcript(i)
+    } for i in range(args.logs)]
+
+    settings = {
+        'send_hostname': 'bench.local',
+        'default_sender': 'sender@example.com',
+        'saved_senders': [f'sender{i}@example.com' for i in range(args.saved)],
+        'saved_recipients': [f'recipient{i}@example.com' for i in range(args.saved)],
+        'log_level': 'INFO', 'log_retention_days': 30, 'log_smtp_traffic': True,
+        'log_message_content': False, 'max_attachment_size_mb': 10
+    }
+
+    for name, data in (('profiles.json', profiles), ('templates.json', templates),
+                       ('logs.json', logs), ('settings.json', settings)):
+        with open(os.path.join(config_dir, name), 'w') as f:
+            json.dump(data, f, indent=2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark ConfigManager storage and Flask routes')
+    parser.add_argument('--profiles', type=int, default=2000, help='Seeded profiles (default: 2000)')
+    parser.add_argument('--templates', type=int, default=2000, help='Seeded templates (default: 2000)')
+    parser.add_argument('--logs', type=int, default=20000, help='Seeded log entries (default: 20000)')
+    parser.add_argument('--saved', type=int, default=10000, help='Saved senders and recipients (default: 10000)')
+    parser.add_argument('--iterations', '-n', type=int, default=20, help='Calls per operation (default: 20)')
+    parser.add_argument('--skip-web', action='store_true', help='Only benchmark ConfigManager')
+    parser.add_argument('--output', '-o', help='Write the JSON report to this file instead of stdout')
+    args = parser.parse_args()
+
+    home = tempfile.mkdtemp(prefix='bench-storage-')
+    os.environ['HOME'] = home
+    os.environ['SMTP_LOG_DIR'] = home
+    config_dir = os.path.join(home, '.smtp_tool')
+    os.makedirs(config_dir)
+    logging.disable(logging.CRITICAL)
+
+    from smtp_sink import SMTPSink
+    sink = SMTPSink(port=0, tls=False).start_in_thread()
+    seed(config_dir, args, sink.port)
+    seeded_logs = os.path.join(home, 'logs.seed.json')
+    shutil.copyfile(os.path.join(config_dir, 'logs.json'), seeded_logs)
+
+    def restore_logs():
+        shutil.copyfile(seeded_logs, os.path.join(config_dir, 'logs.json'))
+
+    from config_manager import ConfigManager
+    config_manager = ConfigManager()
+    log_entry = {'profile': 'profile-1', 'server': 'smtp1.example.com:587', 'sender': 'sender@example.com',
+                 'recipients': ['user@example.com'], 'cc': [], 'bcc': [], 'subject': 'Relay test',
+                 'status': 'Success', 'error': '', 'smtp_log': sample_transcript(0)}
+    middle = args.saved // 2
+    n = args.iterations
+
+    results = [
+        measure('get_settings', lambda i: config_manager.get_settings(), n),
+        measure('get_profiles', lambda i: config_manager.get_profiles(), n),
+        measure('get_template', lambda i: config_manager.get_template(f'template-{i}'), n),
+        measure('get_detailed_logs', lambda i: config_manager.get_detailed_logs(limit=100), n),
+        measure('get_detailed_logs_search', lambda i: config_manager.get_detailed_logs(
+            limit=100, search_text=f'user{i * 7}@'), n),
+        measure('add_log_entry', lambda i: config_manager.add_log_entry(dict(log_entry)), n, setup=restore_logs),
+        measure('add_saved_sender', lambda i: config_manager.add_saved_sender(f'new{i}@example.com'), n),
+        measure('remove_saved_sender', lambda i: config_manager.remove_saved_sender(f'new{i}@example.com'), n),
+        measure('remove_saved_sender_existing', lambda i: config_manager.remove_saved_sender(
+            f'sender{middle + i}@example.com'), n),
+        measure('add_saved_recipient', lambda i: config_manager.add_saved_recipient(f'new{i}@example.com'), n),
+    ]
+    restore_logs()
+
+    if not args.skip_web:
+        from app import app
+        app.testing = True
+        client = app.test_client()
+
+        def send(i):
+            response = client.post('/send_email', data={
+                'profile': 'sink', 'sender': 'sender@example.com', 'recipients': 'user@example.com',
+                'subject': f'Benchmark {i}', 'body': 'Hello', 'body_type': 'plain'
+            }, headers={'Idempotency-Key': f'bench-{time.time()}-{i}'})
+            assert response.status_code == 200 and response.get_json()['success'], response.data[:200]
+
+        def get(path):
+            def call(i):
+                response = client.get(path)
+                assert response.status_code == 200, response.status_code
+            return call
+
+        results += [
+            measure('GET /', get('/'), n),
+            measure('GET /logs', get('/logs'), n, setup=restore_logs),
+            measure('POST /send_email', send, n, setup=restore_logs),
+            measure('POST /test_connection', lambda i: client.post('/test_connection', data={'profile': 'sink'}), n),
+        ]
+
+    sink.stop()
+    shutil.rmtree(home, ignore_errors=True)
+
+    report = {
+        'benchmark': 'storage',
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': sys.version.split()[0],
+        'seed': {'profiles': args.profiles, 'templates': args.templates, 'logs': args.logs,
+                 'saved_addresses': args.saved},
+        'results': results
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,422 @@
+import asyncio
+import json
+import logging
+import random
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+# Commands whose replies may be replaced with injected 421/451 replies by default;
+# DATA means the final reply to the message, not the 354
+DEFAULT_FAULT_COMMANDS = ('MAIL', 'RCPT', 'DATA')
+
+# Injected events kept in memory for inspection
+MAX_EVENTS = 10000
+
+# Slice size used when throttling bandwidth
+THROTTLE_SLICE = 16 * 1024
+
+REPLY_421 = b"421 4.3.2 Injected fault, closing connection\r\n"
+REPLY_451 = b"451 4.3.0 Injected fault, try again later\r\n"
+
+
+class ProxyStats:
+    """Counters kept by the proxy; updated only from the event loop thread"""
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.connections = 0
+        self.active_connections = 0
+        self.upstream_failures = 0
+        self.commands = 0
+        self.bytes_up = 0
+        self.bytes_down = 0
+        self.faults = {}
+
+    def snapshot(self):
+        """
+        Get the counters and injected fault totals
+
+        Returns:
+            dict: Counters, elapsed seconds and faults by type
+        """
+        data = {key: value for key, value in vars(self).items() if key != 'started'}
+        data['faults'] = dict(self.faults)
+        data['elapsed_seconds'] = round(time.monotonic() - self.started, 3)
+        return data
+
+
+class _Connection:
+    """State shared by the two directions of one proxied connection"""
+
+    def __init__(self, number, client):
+        self.number = number
+        self.client = client
+        self.pending = deque([('BANNER', None)])
+        self.data_mode = False
+        self.starttls = None
+        self.next_send = {'up': 0.0, 'down': 0.0}
+        self.closing = False
+
+
+class ChaosProxy:
+    """Fault-injecting TCP proxy for SMTP
+
+    Sits between a client and any SMTP server and, while the session is in
+    cleartext, follows the command/reply pairing so it can delay commands,
+    hold back the banner, replace replies with 421 (then hang up) or 451, and
+    drop the connection part way through message data. After STARTTLS, or
+    for implicit TLS, traffic is relayed opaquely and only TLS stalls,
+    command-independent latency and bandwidth caps apply. Every injected
+    fault is recorded with a timestamp and the client's address so client
+    side timeouts and retries can be matched against it.
+    """
+
+    def __init__(self, upstream_host, upstream_port, host='127.0.0.1', port=2526, command_delay=None,
+                 jitter=0.0, bandwidth=None, banner_delay=0.0, reply_421=0.0, reply_451=0.0,
+                 fault_commands=DEFAULT_FAULT_COMMANDS, disconnect_in_data=0.0, tls_stall=0.0,
+                 implicit_tls=False, seed=None, events=None, connect_timeout=10):
+        """
+        Initialize the proxy
+
+        Args:
+            upstream_host (str): SMTP server to forward to
+            upstream_port (int): SMTP server port
+            host (str, optional): Address to listen on
+            port (int, optional): Port to listen on, 0 for an ephemeral port
+            command_delay (dict, optional): Seconds to hold each command by verb,
+                with '*' applying to every other command
+            jitter (float, optional): Up to this many extra seconds added to each delay
+            bandwidth (int, optional): Bytes per second per direction per connection
+            banner_delay (float, optional): Seconds to hold the server's greeting
+            reply_421 (float, optional): Probability of replacing a reply with 421 and hanging up
+            reply_451 (float, optional): Probability of replacing a reply with 451
+            fault_commands (tuple, optional): Commands whose replies may be replaced
+            disconnect_in_data (float, optional): Probability of dropping the connection
+                part way through a message's data
+            tls_stall (float, optional): Seconds to hold the TLS handshake
+            implicit_tls (bool, optional): Upstream expects TLS from the first byte
+            seed (int, optional): Seed for reproducible fault decisions
+            events (str or file, optional): Path or open file to append JSON lines
+                describing each injected fault to
+            connect_timeout (float, optional): Seconds to wait for the upstream server
+        """
+        self.upstream_host = upstream_host
+        self.upstream_port = upstream_port
+        self.host = host
+        self.port = port
+        self.command_delay = {verb.upper(): seconds for verb, seconds in (command_delay or {}).items()}
+        self.jitter = jitter
+        self.bandwidth = bandwidth
+        self.banner_delay = banner_delay
+        self.reply_421 = reply_421
+        self.reply_451 = reply_451
+        self.fault_commands = {verb.upper() for verb in fault_commands}
+        self.disconnect_in_data = disconnect_in_data
+        self.tls_stall = tls_stall
+        self.implicit_tls = implicit_tls
+        self.connect_timeout = connect_timeout
+        self.random = random.Random(seed)
+        self.events = deque(maxlen=MAX_EVENTS)
+        self._events_file = events
+        self._events_output = None
+        self.stats = ProxyStats()
+        self._server = None
+        self._handlers = set()
+        self._loop = None
+        self._thread = None
+        self._ready = threading.Event()
+
+    async def start(self):
+        """Start listening; a port chosen by the OS is stored back on the proxy"""
+        if isinstance(self._events_file, str):
+            self._events_output = open(self._events_file, 'a')
+        else:
+            self._events_output = self._events_file
+        self.stats = ProxyStats()
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        logger.info(f"Chaos proxy listening on {self.host}:{self.port}, "
+                    f"forwarding to {self.upstream_host}:{self.upstream_port}")
+
+    async def close(self):
+        """Stop accepting connections"""
+        if self._server is not None:
+            self._server.close()
+            self._server = None
+        # Connections are held open by the proxy itself, so end them explicitly
+        for handler in list(self._handlers):
+            handler.cancel()
+        if self._handlers:
+            await asyncio.wait(list(self._handlers), timeout=5)
+        if isinstance(self._events_file, str) and self._events_output:
+            self._events_output.close()
+        self._events_output = None
+
+    def start_in_thread(self):
+        """
+        Run the proxy on its own event loop in a daemon thread
+
+        Returns:
+            ChaosProxy: self, once the proxy is listening
+        """
+        def run():
+            self._loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(self._loop)
+            try:
+                self._loop.run_until_complete(self.start())
+            finally:
+                self._ready.set()
+            self._loop.run_forever()
+            self._loop.run_until_complete(self.close())
+            self._loop.close()
+
+        self._thread = threading.Thread(target=run, name='chaos-proxy', daemon=True)
+        self._thread.start()
+        self._ready.wait()
+        if self._server is None:
+            raise RuntimeError("Chaos proxy failed to start")
+        return self
+
+    def stop(self):
+        """Stop a proxy started with start_in_thread"""
+        if self._loop is not None and self._thread is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def _record(self, conn, fault, command=None, **detail):
+        """Count an injected fault and publish it as an event"""
+        self.stats.faults[fault] = self.stats.faults.get(fault, 0) + 1
+        event = {'time': round(time.time(), 6), 'connection': conn.number, 'client': conn.client,
+                 'fault': fault, 'command': command}
+        event.update(detail)
+        self.events.append(event)
+        if self._events_output:
+            self._events_output.write(json.dumps(event) + '\n')
+            self._events_output.flush()
+
+    def _command_delay(self, verb):
+        delay = self.command_delay.get(verb, self.command_delay.get('*', 0.0))
+        if delay and self.jitter:
+            delay += self.random.uniform(0, self.jitter)
+        return delay
+
+    def _pick_reply_fault(self, verb):
+        if verb not in self.fault_commands:
+            return None
+        roll = self.random.random()
+        if roll < self.reply_421:
+            return '421'
+        if roll < self.reply_421 + self.reply_451:
+            return '451'
+        return None
+
+    async def _write(self, conn, writer, data, direction):
+        """Forward bytes, pacing them when a bandwidth cap is set"""
+        if direction == 'up':
+            self.stats.bytes_up += len(data)
+        else:
+            self.stats.bytes_down += len(data)
+        if not self.bandwidth:
+            writer.write(data)
+            await writer.drain()
+            return
+        loop = asyncio.get_running_loop()
+        for offset in range(0, len(data), THROTTLE_SLICE):
+            piece = data[offset:offset + THROTTLE_SLICE]
+            now = loop.time()
+            start = max(now, conn.next_send[direction])
+            conn.next_send[direction] = start + len(piece) / self.bandwidth
+            writer.write(piece)
+            await writer.drain()
+            await asyncio.sleep(conn.next_send[direction] - now)
+
+    async def _relay(self, conn, reader, writer, direction):
+        """Relay bytes without looking at them"""
+        while True:
+            chunk = await reader.read(65536)
+            if not chunk:
+                return
+            await self._write(conn, writer, chunk, direction)
+
+    async def _client_to_server(self, conn, reader, writer):
+        disconnect_after = None
+        data_lines = 0
+        while True:
+            line = await reader.readline()
+            if not line:
+                return
+            if conn.data_mode:
+                if disconnect_after is not None and (data_lines >= disconnect_after or line == b'.\r\n'):
+                    self._record(conn, 'disconnect_in_data', 'DATA', after_lines=data_lines)
+                    conn.closing = True
+                    return
+                data_lines += 1
+                await self._write(conn, writer, line, 'up')
+                if line == b'.\r\n':
+                    conn.data_mode = False
+                    disconnect_after = None
+                    conn.pending.append(('DATA', self._pick_reply_fault('DATA')))
+                continue
+
+            self.stats.commands += 1
+            verb = line.split(b' ', 1)[0].strip().upper().decode('ascii', errors='replace')
+            delay = self._command_delay(verb)
+            if delay:
+                self._record(conn, 'delay', verb, seconds=round(delay, 6))
+                await asyncio.sleep(delay)
+
+            if verb == 'DATA':
+                conn.pending.append(('DATA-COMMAND', None))
+                if self.disconnect_in_data and self.random.random() < self.disconnect_in_data:
+                    disconnect_after = self.random.randint(0, 20)
+                data_lines = 0
+                await self._write(conn, writer, line, 'up')
+            elif verb == 'BDAT':
+                parts = line.split()
+                size = int(parts[1]) if len(parts) > 1 and parts[1].isdigit() else 0
+                last = len(parts) > 2 and parts[2].upper() == b'LAST'
+                cut = self.disconnect_in_data and self.random.random() < self.disconnect_in_data
+                await self._write(conn, writer, line, 'up')
+                remaining = size // 2 if cut else size
+                while remaining:
+                    chunk = await reader.read(min(remaining, 65536))
+                    if not chunk:
+                        return
+                    remaining -= len(chunk)
+                    await self._write(conn, writer, chunk, 'up')
+                if cut:
+                    self._record(conn, 'disconnect_in_data', 'BDAT', after_bytes=size // 2)
+                    conn.closing = True
+                    return
+                conn.pending.append(('BDAT', self._pick_reply_fault('DATA') if last else None))
+            elif verb == 'STARTTLS':
+                conn.starttls = asyncio.get_running_loop().create_future()
+                conn.pending.append(('STARTTLS', None))
+                await self._write(conn, writer, line, 'up')
+                if await conn.starttls:
+                    if self.tls_stall:
+                        self._record(conn, 'tls_stall', 'STARTTLS', seconds=self.tls_stall)
+                        await asyncio.sleep(self.tls_stall)
+                    await self._relay(conn, reader, writer, 'up')
+                    return
+            else:
+                conn.pending.append((verb, self._pick_reply_fault(verb)))
+                await self._write(conn, writer, line, 'up')
+
+    async def _server_to_client(self, conn, reader, writer):
+        while True:
+            reply = b''
+            while True:
+                line = await reader.readline()
+                if not line:
+                    return
+                reply += line
+                if line[3:4] != b'-':
+                    break
+            verb, fault = conn.pending.popleft() if conn.pending else (None, None)
+
+            if verb == 'BANNER' and self.banner_delay:
+                self._record(conn, 'banner_delay', seconds=self.banner_delay)
+                await asyncio.sleep(self.banner_delay)
+            if fault == '421':
+                self._record(conn, 'reply_421', verb, replaced=reply[:3].decode('ascii', errors='replace'))
+                await self._write(conn, writer, REPLY_421, 'down')
+                conn.closing = True
+                return
+            if fault == '451':
+                self._record(conn, 'reply_451', verb, replaced=reply[:3].decode('ascii', errors='replace'))
+                reply = REPLY_451
+
+            if verb == 'DATA-COMMAND' and reply.startswith(b'354'):
+                conn.data_mode = True
+            await self._write(conn, writer, reply, 'down')
+            if verb == 'STARTTLS':
+                ready = reply.startswith(b'220')
+                conn.starttls.set_result(ready)
+                if ready:
+                    await self._relay(conn, reader, writer, 'down')
+                    return
+
+    async def _handle(self, client_reader, client_writer):
+        """Proxy one client connection"""
+        stats = self.stats
+        stats.connections += 1
+        stats.active_connections += 1
+        peer = client_writer.get_extra_info('peername') or ('', 0)
+        conn = _Connection(stats.connections, f"{peer[0]}:{peer[1]}")
+        upstream_writer = None
+        tasks = []
+        handler = asyncio.current_task()
+        self._handlers.add(handler)
+        try:
+            try:
+                upstream_reader, upstream_writer = await asyncio.wait_for(
+                    asyncio.open_connection(self.upstream_host, self.upstream_port), self.connect_timeout)
+            except (OSError, asyncio.TimeoutError) as e:
+                stats.upstream_failures += 1
+                logger.error(f"Chaos proxy could not reach {self.upstream_host}:{self.upstream_port}: {str(e)}")
+                return
+
+            if self.implicit_tls:
+                if self.tls_stall:
+                    self._record(conn, 'tls_stall', seconds=self.tls_stall)
+                    await asyncio.sleep(self.tls_stall)
+                up = self._relay(conn, client_reader, upstream_writer, 'up')
+                down = self._relay(conn, upstream_reader, client_writer, 'down')
+            else:
+                up = self._client_to_server(conn, client_reader, upstream_writer)
+                down = self._server_to_client(conn, upstream_reader, client_writer)
+            tasks = [asyncio.ensure_future(up), asyncio.ensure_future(down)]
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            if not conn.closing:
+                # One side closed normally; let the other flush what it has left
+                await asyncio.wait(tasks, timeout=1)
+            for task in done:
+                if not task.cancelled() and task.exception():
+                    logger.debug(f"Chaos proxy connection ended: {str(task.exception())}")
+        except (ConnectionError, OSError) as e:
+            logger.debug(f"Chaos proxy connection ended: {str(e)}")
+        except asyncio.CancelledError:
+            pass
+        finally:
+            self._handlers.discard(handler)
+            for task in tasks:
+                task.cancel()
+            stats.active_connections -= 1
+            for writer in (client_writer, upstream_writer):
+                if writer is not None:
+                    writer.close()
+
+
+async def run_proxy(proxy, report_interval=5.0, duration=None):
+    """
+    Serve until cancelled or for a fixed duration, logging injected faults periodically
+
+    Args:
+        proxy (ChaosProxy): Proxy to run
+        report_interval (float, optional): Seconds between reports, 0 to disable
+        duration (float, optional): Stop after this many seconds
+
+    Returns:
+        dict: Final stats snapshot
+    """
+    await proxy.start()
+    deadline = time.monotonic() + duration if duration else None
+    try:
+        while deadline is None or time.monotonic() < deadline:
+            wait = report_interval or 1.0
+            if deadline is not None:
+                wait = max(0.0, min(wait, deadline - time.monotonic()))
+            await asyncio.sleep(wait)
+            if report_interval:
+                current = proxy.stats.snapshot()
+                faults = ', '.join(f"{name}={count}" for name, count in sorted(current['faults'].items()))
+                logger.info(f"{current['active_connections']} connections, {current['commands']} commands, "
+                            f"faults: {faults or 'none'}")
+    finally:
+        await proxy.close()
+    return proxy.stats.snapshot()
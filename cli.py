@@ -1,11 +1,31 @@
 #!/usr/bin/env python3
 import argparse
+import asyncio
 import sys
 import os
+import csv
+import hashlib
+import json
 import logging
-from smtp_tool import SMTPTool
+import socket
+import time
+from email.parser import BytesHeaderParser
+from email.utils import getaddresses, parseaddr
+from smtp_tool import PAYLOAD_KINDS, SMTPTool, SendScheduler, SyntheticPayload
 from config_manager import ConfigManager
-from email_validator import validate_email
+from email_validator import DUPLICATE_REASON, validate_email, validate_emails
+from batch_journal import BatchJournal
+from mail_spool import MailSpool
+from message_archive import MessageArchive, normalize_message_id
+from template_engine import TemplateEngine
+from domain_check import DomainChecker
+from security_sweep import SPECIAL_TESTS, run_sweep
+from tls_scan import TLS_VERSIONS, profile_targets, scan_tls
+from transfer_encoding import serialize_message
+from smtp_sink import SMTPSink, run_sink
+from chaos_proxy import DEFAULT_FAULT_COMMANDS, ChaosProxy, run_proxy
+from load_generator import CapacityFinder, LoadGenerator, format_latency_table
+from load_cluster import DEFAULT_WORKER_PORT, LoadCoordinator, LoadWorker, parse_worker_address, start_local_workers
 
 # Configure logging
 logging.basicConfig(
@@ -50,6 +70,198 @@ def main():
                            help='Email attachment file path (can be used multiple times)')
     send_parser.add_argument('--template', '-T', help='Use a saved email template')
     
+    # Batch campaign command
+    batch_parser = subparsers.add_parser('batch', help='Send a template to every recipient in a CSV/JSONL file')
+    batch_parser.add_argument('--profile', '-p', help='Profile name to use for sending')
+    batch_parser.add_argument('--template', '-T', help='Saved template to render for each recipient')
+    batch_parser.add_argument('--recipients', '-r',
+                            help='CSV (with an email column) or JSONL recipient file; other columns are merge fields')
+    batch_parser.add_argument('--from', '-f', dest='sender', help='Sender email address')
+    batch_parser.add_argument('--concurrency', '-c', type=int, default=4, help='Parallel SMTP sessions (default: 4)')
+    batch_parser.add_argument('--max-per-session', type=int, default=100,
+                            help='Messages per connection before reconnecting, 0 for no limit (default: 100)')
+    batch_parser.add_argument('--output', '-o', help='Write per-recipient outcomes to this CSV or JSONL file')
+    batch_parser.add_argument('--rate', type=float, help='Maximum messages per second for the profile')
+    batch_parser.add_argument('--domain-rate', type=float, help='Maximum messages per second per recipient domain')
+    batch_parser.add_argument('--domain-concurrency', type=int,
+                            help='Maximum messages in flight per recipient domain')
+    batch_parser.add_argument('--domain-limit', action='append', metavar='DOMAIN=RATE[/CONCURRENCY]',
+                            help='Override limits for one domain, e.g. gmail.com=5/2 (can be used multiple times)')
+    batch_parser.add_argument('--attachment', '-a', action='append',
+                            help='File to attach to every message (can be used multiple times)')
+    batch_parser.add_argument('--build-processes', type=int, default=0,
+                            help='Build and encode messages in this many worker processes (default: 0, in the sending threads)')
+    batch_parser.add_argument('--retries', type=int, default=0,
+                            help='Times to retry a message refused with a temporary 4xx reply (default: 0)')
+    batch_parser.add_argument('--resume', metavar='RUN_ID',
+                            help='Continue an interrupted run, skipping recipients already completed')
+    
+    # Bulk address validation command
+    validate_parser = subparsers.add_parser('validate', help='Validate a list of email addresses')
+    validate_parser.add_argument('input', help="Text file with one address per line, CSV with an email column, or '-' for stdin")
+    validate_parser.add_argument('--output', '-o', help='Write valid, deduplicated addresses to this file')
+    validate_parser.add_argument('--report', '-r', help='Write every address with its status and reason to this CSV file')
+    validate_parser.add_argument('--processes', '-j', type=int, help='Shard checks across this many processes')
+    validate_parser.add_argument('--keep-duplicates', action='store_true', help='Do not deduplicate addresses')
+    validate_parser.add_argument('--check-domains', action='store_true',
+                               help='Also require an MX (or A/AAAA) record for each domain')
+    validate_parser.add_argument('--nameserver', help='DNS server as HOST[:PORT] (default: from /etc/resolv.conf)')
+    validate_parser.add_argument('--dns-concurrency', type=int, default=32, help='Parallel DNS lookups (default: 32)')
+    
+    # Local SMTP sink command
+    sink_parser = subparsers.add_parser('sink', help='Run a local SMTP server that accepts and discards mail')
+    sink_parser.add_argument('--host', default='127.0.0.1', help='Address to listen on (default: 127.0.0.1)')
+    sink_parser.add_argument('--port', '-P', type=int, default=2525, help='SMTP/STARTTLS port (default: 2525)')
+    sink_parser.add_argument('--ssl-port', type=int, help='Also listen for implicit TLS on this port')
+    sink_parser.add_argument('--cert', help='TLS certificate file (default: generate a self-signed one)')
+    sink_parser.add_argument('--key', help='TLS private key file')
+    sink_parser.add_argument('--no-tls', action='store_true', help='Do not offer STARTTLS')
+    sink_parser.add_argument('--max-size', type=int, default=100 * 1024 * 1024,
+                           help='Maximum message size in bytes (default: 100 MiB)')
+    sink_parser.add_argument('--auth', metavar='USER:PASSWORD', help='Only accept these credentials')
+    sink_parser.add_argument('--require-auth', action='store_true', help='Refuse mail from unauthenticated clients')
+    sink_parser.add_argument('--report-interval', type=float, default=5.0,
+                           help='Seconds between throughput reports, 0 to disable (default: 5)')
+    sink_parser.add_argument('--duration', type=float, help='Stop after this many seconds')
+    sink_parser.add_argument('--json', action='store_true', help='Print final stats as JSON')
+    
+    # Fault-injecting proxy command
+    chaos_parser = subparsers.add_parser('chaos-proxy', help='Run a local proxy that injects SMTP faults and latency')
+    chaos_parser.add_argument('--upstream', '-u', required=True, help='SMTP server to forward to as HOST:PORT')
+    chaos_parser.add_argument('--host', default='127.0.0.1', help='Address to listen on (default: 127.0.0.1)')
+    chaos_parser.add_argument('--port', '-P', type=int, default=2526, help='Port to listen on (default: 2526)')
+    chaos_parser.add_argument('--delay', action='append', metavar='COMMAND=SECONDS',
+                            help="Hold a command before forwarding it; '*' for every command (repeatable)")
+    chaos_parser.add_argument('--jitter', type=float, default=0.0, help='Up to this many extra seconds per delay')
+    chaos_parser.add_argument('--bandwidth', type=int, help='Cap each direction of each connection to this many bytes/s')
+    chaos_parser.add_argument('--banner-delay', type=float, default=0.0, help="Seconds to hold the server's greeting")
+    chaos_parser.add_argument('--reply-421', type=float, default=0.0,
+                            help='Probability of replying 421 and hanging up instead of the real reply')
+    chaos_parser.add_argument('--reply-451', type=float, default=0.0,
+                            help='Probability of replying 451 instead of the real reply')
+    chaos_parser.add_argument('--fault-commands', default=','.join(DEFAULT_FAULT_COMMANDS),
+                            help=f"Commands whose replies may be replaced (default: {','.join(DEFAULT_FAULT_COMMANDS)})")
+    chaos_parser.add_argument('--disconnect-in-data', type=float, default=0.0,
+                            help='Probability of dropping the connection part way through message data')
+    chaos_parser.add_argument('--tls-stall', type=float, default=0.0, help='Seconds to hold each TLS handshake')
+    chaos_parser.add_argument('--implicit-tls', action='store_true', help='Upstream expects TLS from the first byte')
+    chaos_parser.add_argument('--seed', type=int, help='Seed for reproducible fault decisions')
+    chaos_parser.add_argument('--events', help='Append a JSON line per injected fault to this file')
+    chaos_parser.add_argument('--report-interval', type=float, default=5.0,
+                            help='Seconds between fault reports, 0 to disable (default: 5)')
+    chaos_parser.add_argument('--duration', type=float, help='Stop after this many seconds')
+    chaos_parser.add_argument('--json', action='store_true', help='Print final stats as JSON')
+    
+    # Load test command
+    load_parser = subparsers.add_parser('load', help='Drive a profile at a fixed message rate and report latencies')
+    load_parser.add_argument('--profile', '-p', required=True, help='Profile name to use for sending')
+    load_parser.add_argument('--from', '-f', dest='sender', required=True, help='Sender email address')
+    load_parser.add_argument('--to', '-t', dest='recipients', required=True, help='Recipient email addresses (comma-separated)')
+    load_parser.add_argument('--rate', '-r', type=float, required=True, help='Target messages per second')
+    load_parser.add_argument('--duration', '-d', type=float, default=30.0, help='Seconds to offer load for (default: 30)')
+    load_parser.add_argument('--sessions', '-c', type=int, default=4, help='Concurrent SMTP sessions (default: 4)')
+    load_parser.add_argument('--size', type=int, default=1024, help='Approximate message body size in bytes (default: 1024)')
+    load_parser.add_argument('--max-per-session', type=int, default=0,
+                           help='Reconnect after this many messages per session (default: no limit)')
+    load_parser.add_argument('--interval', type=float, default=1.0, help='Seconds between live reports (default: 1)')
+    load_parser.add_argument('--json', help='Write the full report, including histograms, to this JSON file')
+    load_parser.add_argument('--workers', help='Split the load across these load-worker addresses (comma-separated HOST[:PORT])')
+    load_parser.add_argument('--local-workers', type=int, help='Split the load across this many local worker processes')
+    load_parser.add_argument('--token', help='Shared secret expected by the workers')
+    
+    # Load worker command
+    load_worker_parser = subparsers.add_parser('load-worker', help='Run sessions for a distributed load test')
+    load_worker_parser.add_argument('--host', default='127.0.0.1', help='Address to listen on (default: 127.0.0.1)')
+    load_worker_parser.add_argument('--port', '-P', type=int, default=DEFAULT_WORKER_PORT,
+                                  help=f'Port to listen on (default: {DEFAULT_WORKER_PORT})')
+    load_worker_parser.add_argument('--token', help='Shared secret the coordinator must present '
+                                    '(required for non-loopback addresses; sent unencrypted)')
+    
+    # Capacity search command
+    capacity_parser = subparsers.add_parser('capacity', help='Ramp load to find the highest rate that meets a latency SLO')
+    capacity_parser.add_argument('--profile', '-p', required=True, help='Profile name to use for sending')
+    capacity_parser.add_argument('--from', '-f', dest='sender', required=True, help='Sender email address')
+    capacity_parser.add_argument('--to', '-t', dest='recipients', required=True, help='Recipient email addresses (comma-separated)')
+    capacity_parser.add_argument('--slo-p99', type=float, default=500.0, help='Highest acceptable p99 latency in ms (default: 500)')
+    capacity_parser.add_argument('--max-deferral-rate', type=float, default=0.01,
+                               help='Highest acceptable fraction of 4xx replies (default: 0.01)')
+    capacity_parser.add_argument('--max-error-rate', type=float, default=0.01,
+                               help='Highest acceptable fraction of connection errors (default: 0.01)')
+    capacity_parser.add_argument('--start-rate', type=float, default=10.0, help='First target rate in msg/s (default: 10)')
+    capacity_parser.add_argument('--step', type=float, help='Additive rate increase in msg/s (default: the start rate)')
+    capacity_parser.add_argument('--step-duration', type=float, default=10.0, help='Seconds per step (default: 10)')
+    capacity_parser.add_argument('--sessions', '-c', type=int, default=4, help='Initial concurrent sessions (default: 4)')
+    capacity_parser.add_argument('--max-sessions', type=int, default=64, help='Most sessions to ramp up to (default: 64)')
+    capacity_parser.add_argument('--max-steps', type=int, default=30, help='Most steps to run (default: 30)')
+    capacity_parser.add_argument('--size', type=int, default=1024, help='Approximate message body size in bytes (default: 1024)')
+    capacity_parser.add_argument('--json', help='Write the report with every step to this JSON file')
+    
+    # Replay command
+    replay_parser = subparsers.add_parser('replay', help='Re-send an archived message byte for byte')
+    replay_parser.add_argument('message_id', nargs='?', help='Message-ID of the archived message')
+    replay_parser.add_argument('--profile', '-p', help='Profile name to use for sending')
+    replay_parser.add_argument('--count', '-n', type=int, default=1, help='Copies to send (default: 1)')
+    replay_parser.add_argument('--concurrency', '-c', type=int, default=1, help='Parallel SMTP sessions (default: 1)')
+    replay_parser.add_argument('--from', '-f', dest='sender', help='Envelope sender (default: as originally sent)')
+    replay_parser.add_argument('--to', '-t', dest='recipients',
+                             help='Envelope recipients, comma-separated (default: as originally sent)')
+    replay_parser.add_argument('--new-message-id', action='store_true', help='Give each copy a fresh Message-ID')
+    replay_parser.add_argument('--max-per-session', type=int, default=0,
+                             help='Reconnect after this many messages per session (default: no limit)')
+    replay_parser.add_argument('--list', action='store_true', help='List archived messages instead of sending')
+    
+    # Synthetic payload command
+    payload_parser = subparsers.add_parser('payload', help='Generate or send a deterministic synthetic payload')
+    payload_parser.add_argument('--kind', '-k', choices=PAYLOAD_KINDS, default='binary', help='Payload kind (default: binary)')
+    payload_parser.add_argument('--size', '-s', default='1MB', help='Content size, 1KB to 100MB (default: 1MB)')
+    payload_parser.add_argument('--seed', type=int, default=0, help='Seed for the generated content (default: 0)')
+    payload_parser.add_argument('--part-size', default='1KB', help="Content per part for 'parts' (default: 1KB)")
+    payload_parser.add_argument('--depth', type=int, default=32, help="Multipart levels for 'nested' (default: 32)")
+    payload_parser.add_argument('--chunk-size', default='1MB', help='Bytes generated per chunk (default: 1MB)')
+    payload_parser.add_argument('--output', '-o', help='Write the message (or the raw payload with --raw) to this file')
+    payload_parser.add_argument('--raw', action='store_true', help='Write the payload without message headers')
+    payload_parser.add_argument('--profile', '-p', help='Send the payload through this profile')
+    payload_parser.add_argument('--to', '-t', dest='recipients', help='Recipient email addresses (comma-separated)')
+    payload_parser.add_argument('--from', '-f', dest='sender', help='Sender email address (default: default sender setting)')
+    payload_parser.add_argument('--count', '-n', type=int, default=1, help='Messages to send (default: 1)')
+    payload_parser.add_argument('--concurrency', '-c', type=int, default=1, help='Parallel SMTP sessions (default: 1)')
+    
+    # TLS scan command
+    tls_scan_parser = subparsers.add_parser('tls-scan', help='Probe every TLS version and cipher a profile accepts')
+    tls_scan_parser.add_argument('--profile', '-p', help='Profile names to scan (comma-separated)')
+    tls_scan_parser.add_argument('--all-profiles', action='store_true', help='Scan every saved profile')
+    tls_scan_parser.add_argument('--ssl-port', type=int, help='Also scan implicit TLS on this port')
+    tls_scan_parser.add_argument('--starttls-port', type=int, help='Also scan STARTTLS on this port')
+    tls_scan_parser.add_argument('--versions', default=','.join(TLS_VERSIONS),
+                               help=f"TLS versions to probe (default: {','.join(TLS_VERSIONS)})")
+    tls_scan_parser.add_argument('--concurrency', '-c', type=int, default=8, help='Parallel handshakes (default: 8)')
+    tls_scan_parser.add_argument('--timeout', type=float, default=10.0, help='Socket timeout in seconds (default: 10)')
+    tls_scan_parser.add_argument('--json', help='Write the matrix and every probe to this JSON file')
+    tls_scan_parser.add_argument('--csv', help='Write one row per probe to this CSV file')
+    
+    # Security sweep command
+    sweep_parser = subparsers.add_parser('sweep', help='Send every special test email through one or more profiles')
+    sweep_parser.add_argument('--profile', '-p', help='Profile names to test (comma-separated)')
+    sweep_parser.add_argument('--all-profiles', action='store_true', help='Test every saved profile')
+    sweep_parser.add_argument('--to', '-t', dest='recipients', required=True, help='Recipient email addresses (comma-separated)')
+    sweep_parser.add_argument('--from', '-f', dest='sender', help='Sender email address (default: default sender setting)')
+    sweep_parser.add_argument('--tests', default=','.join(SPECIAL_TESTS),
+                            help=f"Special tests to send (default: {','.join(SPECIAL_TESTS)})")
+    sweep_parser.add_argument('--expect-reject', default='',
+                            help='Tests that pass only when the relay rejects them (comma-separated)')
+    sweep_parser.add_argument('--concurrency', '-c', type=int, default=8, help='Parallel SMTP sessions (default: 8)')
+    sweep_parser.add_argument('--timeout', type=float, default=60.0, help='Socket timeout in seconds (default: 60)')
+    sweep_parser.add_argument('--json', help='Write the report to this JSON file')
+    
+    # Spool inspection and delivery command
+    queue_parser = subparsers.add_parser('queue', help='Inspect and deliver messages spooled after temporary failures')
+    queue_parser.add_argument('--json', action='store_true', help='Print stats and entries as JSON')
+    queue_parser.add_argument('--flush', action='store_true', help='Attempt every queued message now, once')
+    queue_parser.add_argument('--run', action='store_true', help='Run delivery workers until the queue is empty')
+    queue_parser.add_argument('--workers', type=int, default=2, help='Delivery workers for --run (default: 2)')
+    queue_parser.add_argument('--retry', metavar='ID', help='Make a queued or failed message due now')
+    queue_parser.add_argument('--delete', metavar='ID', help='Drop a queued or failed message')
+    
     # Test connection command
     test_parser = subparsers.add_parser('test', help='Test SMTP server connection')
     test_parser.add_argument('--profile', '-p', required=False, help='Profile name to test')
@@ -118,6 +330,12 @@ def main():
     # Initialize SMTP tool
     smtp_tool = SMTPTool()
     
+    # Initialize archive of sent messages used for replay
+    archive = MessageArchive(os.path.join(config_manager.config_dir, 'archive'))
+    
+    # Initialize spool of messages deferred by the server
+    spool = MailSpool(os.path.join(config_manager.config_dir, 'spool'), get_profile=config_manager.get_profile)
+    
     # No command specified, show help
     if not args.command:
         parser.print_help()
@@ -215,7 +433,11 @@ def main():
             subject=args.subject,
             body=body,
             body_type=body_type,
-            attachments=args.attachment
+            attachments=args.attachment,
+            archive=archive if config_manager.get_settings().get('archive_messages', True) else None,
+            optimize_encoding=config_manager.get_settings().get('optimize_transfer_encoding', True),
+            spool=spool if config_manager.get_settings().get('spool_deferred', True) else None,
+            profile_name=args.profile
         )
         
         if result['success']:
@@ -230,10 +452,29 @@ def main():
                 'cc': cc,
                 'bcc': bcc,
                 'subject': args.subject,
-                'status': 'Success'
+                'status': 'Success',
+                'message_id': result.get('message_id', '')
             }
             config_manager.add_log_entry(log_entry)
             return 0
+        elif result.get('queued'):
+            logger.warning(f"Server deferred the email: {result.get('error', 'Unknown error')}")
+            logger.info(f"Queued for retry as {result['queued']}; deliver with: python cli.py queue --run")
+            config_manager.add_log_entry({
+                'timestamp': None,  # Will be added by ConfigManager
+                'profile': args.profile if args.profile else 'CLI',
+                'server': server,
+                'sender': args.sender,
+                'recipients': recipients,
+                'cc': cc,
+                'bcc': bcc,
+                'subject': args.subject,
+                'status': 'Queued',
+                'error': result.get('error', 'Unknown error'),
+                'message_id': result.get('message_id', ''),
+                'spool_id': result['queued']
+            })
+            return 0
         else:
             logger.error(f"Failed to send email: {result.get('error', 'Unknown error')}")
             # Add to logs
@@ -247,11 +488,665 @@ def main():
                 'bcc': bcc,
                 'subject': args.subject,
                 'status': 'Failed',
-                'error': result.get('error', 'Unknown error')
+                'error': result.get('error', 'Unknown error'),
+                'message_id': result.get('message_id', '')
             }
             config_manager.add_log_entry(log_entry)
             return 1
     
+    # Handle batch command
+    elif args.command == 'batch':
+        runs_dir = os.path.join(config_manager.config_dir, 'runs')
+        journal = None
+        if args.resume:
+            try:
+                journal = BatchJournal.open(runs_dir, args.resume)
+            except (OSError, ValueError) as e:
+                logger.error(f"Cannot resume batch run: {str(e)}")
+                return 1
+            if args.recipients and os.path.abspath(args.recipients) != journal.meta['recipients']:
+                logger.error(f"Run {journal.run_id} reads {journal.meta['recipients']}, not {args.recipients}")
+                journal.close()
+                return 1
+            args.recipients = journal.meta['recipients']
+            args.profile = args.profile or journal.meta.get('profile')
+            args.template = args.template or journal.meta.get('template')
+            args.sender = args.sender or journal.meta.get('sender')
+            args.attachment = args.attachment or journal.meta.get('attachments')
+        elif not (args.profile and args.template and args.recipients and args.sender):
+            logger.error("--profile, --template, --recipients and --from are required unless resuming a run")
+            return 1
+        
+        profile = config_manager.get_profile(args.profile)
+        if not profile:
+            logger.error(f"Profile '{args.profile}' not found")
+            return 1
+        
+        template = TemplateEngine(config_manager).get(args.template)
+        if not template:
+            logger.error(f"Template '{args.template}' not found")
+            return 1
+        
+        try:
+            validate_email(args.sender)
+        except ValueError as e:
+            logger.error(f"Invalid email address '{args.sender}': {str(e)}")
+            return 1
+        
+        if not os.path.exists(args.recipients):
+            logger.error(f"Recipient file '{args.recipients}' not found")
+            return 1
+        
+        domain_limits = {}
+        for spec in args.domain_limit or []:
+            try:
+                domain, limits = spec.split('=', 1)
+                rate, _, concurrency = limits.partition('/')
+                domain_limits[domain.strip().lower()] = {
+                    'rate': float(rate) if rate else None,
+                    'concurrency': int(concurrency) if concurrency else None
+                }
+            except ValueError:
+                logger.error(f"Invalid domain limit '{spec}', expected DOMAIN=RATE[/CONCURRENCY]")
+                return 1
+        
+        scheduler = SendScheduler.from_profile(
+            profile,
+            rate=args.rate,
+            domain_rate=args.domain_rate,
+            domain_concurrency=args.domain_concurrency,
+            domain_limits=domain_limits,
+            max_pending=max(1, args.concurrency) * 100
+        )
+        
+        output = None
+        writer = None
+        if args.output:
+            output = open(args.output, 'w', newline='')
+            if not args.output.lower().endswith(('.jsonl', '.ndjson')):
+                writer = csv.DictWriter(output, fieldnames=['row', 'email', 'status', 'code', 'reply',
+                                                            'message_id', 'error', 'attempts', 'seconds'])
+                writer.writeheader()
+        
+        def write_outcome(outcome):
+            if writer:
+                writer.writerow(outcome)
+            else:
+                output.write(json.dumps(outcome) + '\n')
+        
+        if journal is None:
+            journal = BatchJournal.create(runs_dir, args.recipients, profile=args.profile,
+                                          template=args.template, sender=args.sender,
+                                          attachments=args.attachment)
+            logger.info(f"Batch run {journal.run_id} started (continue with --resume {journal.run_id})")
+        else:
+            logger.info(f"Resuming batch run {journal.run_id} from row {journal.checkpoint['row']}")
+        
+        try:
+            result = smtp_tool.send_batch(
+                profile=profile,
+                sender=args.sender,
+                template=template,
+                rows=journal.rows(),
+                concurrency=args.concurrency,
+                hostname=config_manager.get_settings().get('send_hostname'),
+                max_messages_per_session=args.max_per_session,
+                on_result=write_outcome if output else None,
+                collect_results=False,
+                scheduler=scheduler,
+                max_retries=args.retries,
+                attachments=args.attachment,
+                build_processes=args.build_processes,
+                journal=journal
+            )
+        finally:
+            journal.close()
+            if output:
+                output.close()
+        
+        stats = result['stats']
+        logger.info(f"Batch complete: {stats['sent']} sent, {stats['failed']} failed, "
+                    f"{stats['invalid']} invalid of {stats['total']} rows")
+        logger.info(f"Elapsed: {stats['elapsed_seconds']}s, throughput: {stats['messages_per_second']} msg/s, "
+                    f"connections: {stats['connections']}")
+        if stats['retried']:
+            logger.info(f"Retried {stats['retried']} deferred messages across {stats.get('backoffs', 0)} backoffs")
+        if stats['skipped']:
+            logger.info(f"Skipped {stats['skipped']} rows completed before the run was resumed")
+        
+        config_manager.add_log_entry({
+            'timestamp': None,  # Will be added by ConfigManager
+            'profile': args.profile,
+            'server': profile['server'],
+            'sender': args.sender,
+            'recipients': [f"batch of {stats['total']} recipients"],
+            'cc': [],
+            'bcc': [],
+            'subject': template.subject.source,
+            'status': 'Success' if result['success'] else 'Failed',
+            'error': '' if result['success'] else f"{stats['failed']} failed, {stats['invalid']} invalid",
+            'batch_stats': stats
+        })
+        return 0 if result['success'] else 1
+    
+    # Handle validate command
+    elif args.command == 'validate':
+        if args.input != '-' and not os.path.exists(args.input):
+            logger.error(f"Input file '{args.input}' not found")
+            return 1
+        
+        output = open(args.output, 'w') if args.output else None
+        report = open(args.report, 'w', newline='') if args.report else None
+        writer = csv.writer(report) if report else None
+        if writer:
+            writer.writerow(['email', 'status', 'reason'])
+        
+        domain_checker = None
+        if args.check_domains:
+            domain_checker = DomainChecker(nameserver=args.nameserver, concurrency=args.dns_concurrency)
+        
+        counts = {'valid': 0, 'invalid': 0, 'duplicate': 0}
+        start_time = time.perf_counter()
+        try:
+            for address, ok, reason in validate_emails(args.input, dedupe=not args.keep_duplicates,
+                                                       processes=args.processes,
+                                                       domain_checker=domain_checker):
+                if ok:
+                    status = 'valid'
+                    if output:
+                        output.write(address + '\n')
+                elif reason == DUPLICATE_REASON:
+                    status = 'duplicate'
+                else:
+                    status = 'invalid'
+                counts[status] += 1
+                if writer:
+                    writer.writerow([address, status, reason or ''])
+        finally:
+            if output:
+                output.close()
+            if report:
+                report.close()
+            if domain_checker:
+                domain_checker.close()
+        
+        elapsed = time.perf_counter() - start_time
+        total = sum(counts.values())
+        logger.info(f"Checked {total} addresses: {counts['valid']} valid, {counts['invalid']} invalid, "
+                    f"{counts['duplicate']} duplicates")
+        logger.info(f"Elapsed: {elapsed:.2f}s ({total / elapsed if elapsed > 0 else 0:.0f} addresses/s)")
+        if domain_checker:
+            logger.info(f"DNS lookups: {domain_checker.lookups}")
+        return 0 if counts['invalid'] == 0 else 1
+    
+    # Handle sink command
+    elif args.command == 'sink':
+        credentials = tuple(args.auth.split(':', 1)) if args.auth else None
+        if credentials is not None and len(credentials) != 2:
+            logger.error("--auth must be given as USER:PASSWORD")
+            return 1
+        
+        sink = SMTPSink(host=args.host, port=args.port, ssl_port=args.ssl_port, certfile=args.cert,
+                        keyfile=args.key, max_size=args.max_size, credentials=credentials,
+                        require_auth=args.require_auth, tls=not args.no_tls)
+        try:
+            stats = asyncio.run(run_sink(sink, report_interval=args.report_interval, duration=args.duration))
+        except KeyboardInterrupt:
+            stats = sink.stats.snapshot()
+        except (OSError, RuntimeError) as e:
+            logger.error(f"SMTP sink failed: {str(e)}")
+            return 1
+        
+        logger.info(f"Sink received {stats['messages']} messages ({stats['bytes']} bytes) for "
+                    f"{stats['recipients']} recipients over {stats['connections']} connections")
+        logger.info(f"Throughput: {stats['messages_per_second']} msg/s, "
+                    f"{stats['bytes_per_second'] / 1048576:.2f} MiB/s")
+        if args.json:
+            print(json.dumps(stats, indent=2))
+        return 0
+    
+    # Handle chaos-proxy command
+    elif args.command == 'chaos-proxy':
+        upstream_host, _, upstream_port = args.upstream.rpartition(':')
+        if not upstream_host or not upstream_port.isdigit():
+            logger.error("--upstream must be given as HOST:PORT")
+            return 1
+        
+        command_delay = {}
+        for spec in args.delay or []:
+            try:
+                command, seconds = spec.split('=', 1)
+                command_delay[command.strip()] = float(seconds)
+            except ValueError:
+                logger.error(f"Invalid delay '{spec}', expected COMMAND=SECONDS")
+                return 1
+        
+        proxy = ChaosProxy(upstream_host.strip('[]'), int(upstream_port), host=args.host, port=args.port,
+                           command_delay=command_delay, jitter=args.jitter, bandwidth=args.bandwidth,
+                           banner_delay=args.banner_delay, reply_421=args.reply_421, reply_451=args.reply_451,
+                           fault_commands=[c.strip() for c in args.fault_commands.split(',') if c.strip()],
+                           disconnect_in_data=args.disconnect_in_data, tls_stall=args.tls_stall,
+                           implicit_tls=args.implicit_tls, seed=args.seed, events=args.events)
+        try:
+            stats = asyncio.run(run_proxy(proxy, report_interval=args.report_interval, duration=args.duration))
+        except KeyboardInterrupt:
+            stats = proxy.stats.snapshot()
+        except OSError as e:
+            logger.error(f"Chaos proxy failed: {str(e)}")
+            return 1
+        
+        faults = ', '.join(f"{name}={count}" for name, count in sorted(stats['faults'].items()))
+        logger.info(f"Proxied {stats['connections']} connections and {stats['commands']} commands, "
+                    f"{stats['upstream_failures']} upstream failures")
+        logger.info(f"Injected faults: {faults or 'none'}")
+        if args.json:
+            print(json.dumps(stats, indent=2))
+        return 0
+    
+    # Handle load command
+    elif args.command == 'load':
+        profile = config_manager.get_profile(args.profile)
+        if not profile:
+            logger.error(f"Profile '{args.profile}' not found")
+            return 1
+        
+        recipients = [r.strip() for r in args.recipients.split(',') if r.strip()]
+        for email in [args.sender] + recipients:
+            try:
+                validate_email(email)
+            except ValueError as e:
+                logger.error(f"Invalid email address '{email}': {str(e)}")
+                return 1
+        
+        if args.rate <= 0 or args.duration <= 0:
+            logger.error("--rate and --duration must be positive")
+            return 1
+        
+        hostname = config_manager.get_settings().get('send_hostname')
+        body = ('Load test message body line.\n' * (args.size // 29 + 1))[:args.size]
+        message = serialize_message(smtp_tool.build_message(args.sender, recipients, subject='Load test',
+                                                            body=body, hostname=hostname))
+        
+        def report_interval(interval):
+            errors = ', '.join(f"{name}={count}" for name, count in interval['errors'].items())
+            logger.info(f"[{interval['elapsed']:7.1f}s] {interval['rate']:8.1f} msg/s, "
+                        f"p50 {interval['p50_ms']} ms, p99 {interval['p99_ms']} ms, "
+                        f"backlog {interval['backlog']}, failed {interval['failed']}"
+                        + (f" (p99 {interval['error_p99_ms']} ms; {errors})" if errors else ''))
+        
+        processes = []
+        workers = []
+        try:
+            if args.local_workers:
+                processes, workers = start_local_workers(args.local_workers, token=args.token)
+            elif args.workers:
+                workers = [parse_worker_address(address) for address in args.workers.split(',') if address.strip()]
+        except ValueError as e:
+            logger.error(f"Invalid worker address: {str(e)}")
+            return 1
+        
+        options = dict(rate=args.rate, duration=args.duration, sessions=args.sessions, hostname=hostname,
+                       max_messages_per_session=args.max_per_session, interval=args.interval,
+                       on_interval=report_interval)
+        try:
+            if workers:
+                logger.info(f"Coordinating {len(workers)} workers")
+                report = LoadCoordinator(workers, profile, args.sender, recipients, message,
+                                         token=args.token, **options).run()
+            else:
+                report = LoadGenerator(profile, args.sender, recipients, message, **options).run()
+        except OSError as e:
+            logger.error(f"Could not reach load worker: {str(e)}")
+            return 1
+        finally:
+            for process in processes:
+                process.join(timeout=5)
+                if process.is_alive():
+                    process.terminate()
+        
+        logger.info(f"Load complete: {report['sent']} sent, {report['failed']} failed in "
+                    f"{report['elapsed_seconds']}s ({report['achieved_rate']} of {report['target_rate']} msg/s "
+                    f"over {report['connections']} connections)")
+        for address, error in report.get('worker_errors', {}).items():
+            logger.error(f"Worker {address} failed: {error}")
+        if report['errors']:
+            logger.info("Errors: " + ', '.join(f"{name}={count}" for name, count in report['errors'].items()))
+        print(format_latency_table(report['latency']))
+        
+        if args.json:
+            report['histograms'] = report.pop('stats').to_dict()['histograms']
+            with open(args.json, 'w') as f:
+                json.dump(report, f, indent=2)
+            logger.info(f"Report written to {args.json}")
+        return 0 if report['failed'] == 0 and not report.get('worker_errors') else 1
+    
+    # Handle load-worker command
+    elif args.command == 'load-worker':
+        try:
+            LoadWorker(host=args.host, port=args.port, token=args.token).serve_forever()
+        except KeyboardInterrupt:
+            pass
+        except (OSError, ValueError) as e:
+            logger.error(f"Load worker failed: {str(e)}")
+            return 1
+        return 0
+    
+    # Handle capacity command
+    elif args.command == 'capacity':
+        profile = config_manager.get_profile(args.profile)
+        if not profile:
+            logger.error(f"Profile '{args.profile}' not found")
+            return 1
+        
+        recipients = [r.strip() for r in args.recipients.split(',') if r.strip()]
+        for email in [args.sender] + recipients:
+            try:
+                validate_email(email)
+            except ValueError as e:
+                logger.error(f"Invalid email address '{email}': {str(e)}")
+                return 1
+        
+        hostname = config_manager.get_settings().get('send_hostname')
+        body = ('Load test message body line.\n' * (args.size // 29 + 1))[:args.size]
+        message = serialize_message(smtp_tool.build_message(args.sender, recipients, subject='Capacity test',
+                                                            body=body, hostname=hostname))
+        
+        finder = CapacityFinder(profile, args.sender, recipients, message, slo_p99=args.slo_p99 / 1000.0,
+                                max_deferral_rate=args.max_deferral_rate, max_error_rate=args.max_error_rate,
+                                start_rate=args.start_rate, step=args.step, step_duration=args.step_duration,
+                                sessions=args.sessions, max_sessions=args.max_sessions,
+                                max_steps=args.max_steps, hostname=hostname)
+        try:
+            report = finder.run()
+        except KeyboardInterrupt:
+            logger.error("Capacity search interrupted")
+            return 1
+        
+        knee = report['knee']
+        if knee:
+            logger.info(f"Knee: {knee['achieved_rate']} msg/s with {knee['sessions']} sessions "
+                        f"(p99 {knee['p99_ms']} ms, deferrals {knee['deferral_rate']:.2%})")
+        else:
+            logger.info("No step met the SLO")
+        if report['limit']:
+            logger.info(f"SLO first missed at {report['limit']} msg/s"
+                        + ('' if report['converged'] else ' (not converged, raise --max-steps)'))
+        
+        if args.json:
+            with open(args.json, 'w') as f:
+                json.dump(report, f, indent=2)
+            logger.info(f"Report written to {args.json}")
+        return 0 if knee else 1
+    
+    # Handle replay command
+    elif args.command == 'replay':
+        if args.list:
+            for entry in archive.list():
+                logger.info(f"{entry['archived']}  {entry['message_id']}  {entry['size']} bytes")
+            stats = archive.stats()
+            logger.info(f"{stats['messages']} messages in {stats['objects']} objects, "
+                        f"{stats['original_bytes']} bytes stored as {stats['stored_bytes']}")
+            return 0
+        
+        if not args.message_id or not args.profile:
+            logger.error("A Message-ID and --profile are required")
+            return 1
+        
+        profile = config_manager.get_profile(args.profile)
+        if not profile:
+            logger.error(f"Profile '{args.profile}' not found")
+            return 1
+        
+        message = archive.get(args.message_id)
+        if message is None:
+            logger.error(f"Message '{args.message_id}' is not in the archive")
+            return 1
+        
+        # Default to the envelope of the logged send, falling back to the headers
+        message_id = normalize_message_id(args.message_id)
+        original = next((entry for entry in reversed(config_manager.get_logs())
+                         if entry.get('message_id') == message_id), None)
+        if original:
+            sender = original.get('sender')
+            recipients = original.get('recipients', []) + original.get('cc', []) + original.get('bcc', [])
+        else:
+            headers = BytesHeaderParser().parsebytes(message)
+            sender = parseaddr(headers.get('From', ''))[1]
+            recipients = [address for _, address in getaddresses(headers.get_all('To', []) + headers.get_all('Cc', []))]
+        if args.sender:
+            sender = args.sender
+        if args.recipients:
+            recipients = [r.strip() for r in args.recipients.split(',') if r.strip()]
+        
+        for email in [sender] + recipients:
+            try:
+                validate_email(email or '')
+            except ValueError as e:
+                logger.error(f"Invalid email address '{email}': {str(e)}")
+                return 1
+        
+        logger.info(f"Replaying {message_id} ({len(message)} bytes) {args.count} times to "
+                    f"{', '.join(recipients)} over {args.concurrency} sessions")
+        result = smtp_tool.replay_message(
+            profile=profile,
+            sender=sender,
+            recipients=recipients,
+            message=message,
+            count=args.count,
+            concurrency=args.concurrency,
+            hostname=config_manager.get_settings().get('send_hostname'),
+            new_message_id=args.new_message_id,
+            max_messages_per_session=args.max_per_session
+        )
+        
+        stats = result['stats']
+        logger.info(f"Replay complete: {stats['sent']} sent, {stats['failed']} failed in {stats['elapsed_seconds']}s "
+                    f"({stats['messages_per_second']} msg/s, p50 {stats['p50_ms']} ms, p99 {stats['p99_ms']} ms)")
+        if stats['errors']:
+            logger.info("Errors: " + ', '.join(f"{name}={count}" for name, count in stats['errors'].items()))
+        return 0 if result['success'] else 1
+    
+    # Handle payload command
+    elif args.command == 'payload':
+        try:
+            payload = SyntheticPayload(args.kind, args.size, seed=args.seed, chunk_size=args.chunk_size,
+                                       part_size=args.part_size, depth=args.depth)
+        except ValueError as e:
+            logger.error(str(e))
+            return 1
+        
+        settings = config_manager.get_settings()
+        sender = args.sender or settings.get('default_sender') or f'smtp@{socket.getfqdn()}'
+        recipients = [email.strip() for email in (args.recipients or '').split(',') if email.strip()]
+        
+        if args.profile:
+            profile = config_manager.get_profile(args.profile)
+            if not profile:
+                logger.error(f"Profile '{args.profile}' not found")
+                return 1
+            if not recipients:
+                logger.error("--to is required when sending")
+                return 1
+            result = smtp_tool.replay_message(profile, sender, recipients, payload, count=args.count,
+                                              concurrency=args.concurrency, hostname=settings.get('send_hostname'))
+            stats = result['stats']
+            logger.info(f"Sent {stats['sent']}/{stats['total']} {args.kind} messages of {stats['bytes']} bytes "
+                        f"in {stats['elapsed_seconds']}s ({stats['messages_per_second']} msg/s, "
+                        f"{stats['megabytes_per_second']} MB/s, p50 {stats['p50_ms']} ms, p99 {stats['p99_ms']} ms)")
+            if stats['errors']:
+                logger.info("Errors: " + ', '.join(f"{name}={count}" for name, count in stats['errors'].items()))
+            return 0 if result['success'] else 1
+        
+        chunks = payload if args.raw else payload.message(sender, recipients or [sender],
+                                                          hostname=settings.get('send_hostname'))
+        digest = hashlib.sha256()
+        length = 0
+        output = open(args.output, 'wb') if args.output else None
+        try:
+            for chunk in chunks:
+                digest.update(chunk)
+                length += len(chunk)
+                if output:
+                    output.write(chunk)
+        finally:
+            if output:
+                output.close()
+        # Message headers carry a fresh Date and Message-ID; the raw digest is the reproducible one
+        logger.info(f"{args.kind} payload, seed {args.seed}: {length} bytes{' raw' if args.raw else ''}, "
+                    f"sha256 {digest.hexdigest()}" + (f" -> {args.output}" if args.output else ''))
+        return 0
+    
+    # Handle tls-scan command
+    elif args.command == 'tls-scan':
+        profiles = config_manager.get_profiles()
+        if args.all_profiles:
+            names = list(profiles)
+        elif args.profile:
+            names = [name.strip() for name in args.profile.split(',') if name.strip()]
+        else:
+            logger.error("Give --profile or --all-profiles")
+            return 1
+        
+        versions = [version.strip() for version in args.versions.split(',') if version.strip()]
+        unknown = [version for version in versions if version not in TLS_VERSIONS]
+        if unknown:
+            logger.error(f"Unknown TLS versions: {', '.join(unknown)}")
+            return 1
+        
+        targets = []
+        for name in names:
+            if name not in profiles:
+                logger.error(f"Profile '{name}' not found")
+                return 1
+            targets += profile_targets(name, profiles[name], ssl_port=args.ssl_port,
+                                       starttls_port=args.starttls_port)
+        
+        report = scan_tls(targets, versions=versions, concurrency=args.concurrency,
+                          hostname=config_manager.get_settings().get('send_hostname'), timeout=args.timeout)
+        
+        for name, modes in report['matrix'].items():
+            for mode, by_version in modes.items():
+                logger.info(f"{name} ({mode}):")
+                for version in versions:
+                    cell = by_version.get(version)
+                    if not cell:
+                        continue
+                    if cell['accepted']:
+                        logger.info(f"  {version}: {len(cell['accepted'])} ciphers, handshake {cell['handshake_ms']} ms - "
+                                    f"{', '.join(cell['groups'])}")
+                    else:
+                        errors = ', '.join(cell['errors'])
+                        logger.info(f"  {version}: not accepted ({errors})")
+        
+        if args.csv:
+            with open(args.csv, 'w', newline='') as f:
+                writer = csv.DictWriter(f, fieldnames=['target', 'server', 'mode', 'version', 'offered', 'group',
+                                                       'accepted', 'protocol', 'cipher', 'bits', 'handshake_ms',
+                                                       'error'])
+                writer.writeheader()
+                writer.writerows(report['results'])
+        if args.json:
+            with open(args.json, 'w') as f:
+                json.dump(report, f, indent=2)
+        logger.info(f"{len(report['results'])} handshakes in {report['elapsed_seconds']}s")
+        return 0
+    
+    # Handle sweep command
+    elif args.command == 'sweep':
+        profiles = config_manager.get_profiles()
+        if args.all_profiles:
+            names = list(profiles)
+        elif args.profile:
+            names = [name.strip() for name in args.profile.split(',') if name.strip()]
+        else:
+            logger.error("Give --profile or --all-profiles")
+            return 1
+        missing = [name for name in names if name not in profiles]
+        if missing:
+            logger.error(f"Profiles not found: {', '.join(missing)}")
+            return 1
+        
+        tests = [test.strip() for test in args.tests.split(',') if test.strip()]
+        expect_reject = [test.strip() for test in args.expect_reject.split(',') if test.strip()]
+        unknown = [test for test in tests + expect_reject if test not in SPECIAL_TESTS]
+        if unknown:
+            logger.error(f"Unknown test types: {', '.join(unknown)}")
+            return 1
+        
+        settings = config_manager.get_settings()
+        sender = args.sender or settings.get('default_sender') or f'smtp@{socket.getfqdn()}'
+        recipients = [email.strip() for email in args.recipients.split(',') if email.strip()]
+        for email in [sender] + recipients:
+            try:
+                validate_email(email)
+            except ValueError as e:
+                logger.error(f"Invalid email address: {email} - {str(e)}")
+                return 1
+        
+        report = run_sweep([(name, profiles[name]) for name in names], sender, recipients, tests=tests,
+                           expect_reject=expect_reject, concurrency=args.concurrency,
+                           hostname=settings.get('send_hostname'), timeout=args.timeout, tool=smtp_tool)
+        
+        for name in names:
+            summary = report['summary']['targets'][name]
+            logger.info(f"{name}: {summary['passed']} passed, {summary['failed']} failed, "
+                        f"mean {summary['mean_ms']} ms, max {summary['max_ms']} ms")
+            for row in report['results']:
+                if row['target'] != name:
+                    continue
+                status = 'PASS' if row['passed'] else 'FAIL'
+                detail = row.get('reply') or row.get('error') or ''
+                logger.info(f"  {status} {row['test']}: {row['outcome']} {row['code'] or ''} "
+                            f"({row['latency_ms']} ms) {detail}")
+        
+        if args.json:
+            with open(args.json, 'w') as f:
+                json.dump(report, f, indent=2)
+        logger.info(f"Sweep: {report['passed']}/{len(report['results'])} checks passed in {report['elapsed_seconds']}s")
+        return 0 if report['success'] else 1
+    
+    # Handle queue command
+    elif args.command == 'queue':
+        for entry_id, action, done in ((args.retry, spool.retry_now, 'due now'), (args.delete, spool.delete, 'deleted')):
+            if entry_id:
+                if not action(entry_id):
+                    logger.error(f"Spool entry '{entry_id}' not found")
+                    return 1
+                logger.info(f"Spool entry {entry_id} {done}")
+        
+        if args.flush:
+            counts = spool.flush(force=True)
+            logger.info(f"Flushed spool: {counts['delivered']} delivered, {counts['deferred']} deferred again, "
+                        f"{counts['failed']} failed")
+        elif args.run:
+            spool.start(workers=args.workers)
+            try:
+                while True:
+                    stats = spool.stats()
+                    if not stats['queued'] and not stats['active']:
+                        break
+                    logger.info(f"Spool: {stats['queued']} queued, {stats['active']} delivering, "
+                                f"next retry in {stats['next_due_seconds'] or 0:.0f}s")
+                    time.sleep(min(30, max(1, stats['next_due_seconds'] or 1)))
+            except KeyboardInterrupt:
+                logger.info("Interrupted, stopping delivery workers")
+            finally:
+                spool.stop()
+        
+        stats = spool.stats()
+        entries = spool.list()
+        if args.json:
+            print(json.dumps({'stats': stats, 'entries': entries}, indent=2))
+            return 0
+        logger.info(f"Spool: {stats['queued']} queued ({stats['due']} due), {stats['active']} delivering, "
+                    f"{stats['failed']} failed, oldest {stats['oldest_age_seconds']:.0f}s")
+        for entry in entries:
+            due = f"retry in {entry['due_in_seconds']:.0f}s" if entry['state'] == 'queue' else entry['state']
+            logger.info(f"{entry['id']}  {due}  attempts {entry['attempts']}  age {entry['age_seconds']:.0f}s  "
+                        f"{entry['server']}  {entry['sender']} -> {', '.join(entry['recipients'])}  "
+                        f"{entry.get('last_code') or ''} {entry.get('last_error') or ''}")
+        return 0
+    
     # Handle test command
     elif args.command == 'test':
         # Get server details from profile or command line
@@ -437,6 +1332,8 @@ def main():
                 status_str = log.get('status', 'Unknown')
                 if status_str == 'Success':
                     status_display = 'SUCCESS'
+                elif status_str == 'Queued':
+                    status_display = f"QUEUED: {log.get('error', 'Unknown error')}"
                 else:
                     status_display = f"FAILED: {log.get('error', 'Unknown error')}"
                 
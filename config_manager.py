@@ -1,3 +1,4 @@
+import hashlib
 import json
 import os
 import logging
@@ -64,11 +65,37 @@ class ConfigManager:
                 "log_retention_days": 30,
                 "log_smtp_traffic": True,
                 "log_message_content": False,
+                "archive_messages": True,
+                "optimize_transfer_encoding": True,
+                "spool_deferred": True,
                 "max_attachment_size_mb": 10
             }
             with open(self.settings_file, 'w') as f:
                 json.dump(default_settings, f, indent=2)
     
+    def version(self, *names):
+        """
+        Identify the current state of configuration files without reading them
+        
+        The version changes whenever one of the files is rewritten, so it can
+        be used as an HTTP validator for anything rendered from them.
+        
+        Args:
+            *names (str): Files to include: 'profiles', 'templates', 'logs' or 'settings'
+            
+        Returns:
+            str: Version string
+        """
+        state = []
+        for name in names:
+            try:
+                stat = os.stat(getattr(self, f"{name}_file"))
+            except OSError:
+                state.append((name, None))
+                continue
+            state.append((name, stat.st_ino, stat.st_size, stat.st_mtime_ns))
+        return hashlib.sha1(repr(state).encode('utf-8')).hexdigest()[:16]
+    
     def get_profiles(self):
         """
         Get all saved SMTP profiles
@@ -114,6 +141,10 @@ class ConfigManager:
                 'username': profile_data['username'],
                 'password': profile_data['password']
             }
+            # Optional sending limits used by the batch scheduler
+            for key in ('rate_limit', 'max_concurrency', 'domain_limits'):
+                if profile_data.get(key):
+                    profiles[profile_data['name']][key] = profile_data[key]
             
             with open(self.profiles_file, 'w') as f:
                 json.dump(profiles, f, indent=2)
@@ -311,6 +342,9 @@ class ConfigManager:
                 "log_retention_days": 30,
                 "log_smtp_traffic": True,
                 "log_message_content": False,
+                "archive_messages": True,
+                "optimize_transfer_encoding": True,
+                "spool_deferred": True,
                 "max_attachment_size_mb": 10
             }
             return default_settings
@@ -0,0 +1,306 @@
+import logging
+import random
+import socket
+import struct
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# DNS record types used by the deliverability check
+TYPE_A = 1
+TYPE_SOA = 6
+TYPE_MX = 15
+TYPE_AAAA = 28
+
+# DNS response codes
+RCODE_NOERROR = 0
+RCODE_NXDOMAIN = 3
+
+
+class DNSError(Exception):
+    """Raised when a DNS query fails without a usable answer"""
+
+
+def default_nameserver():
+    """
+    Get the first nameserver configured in /etc/resolv.conf
+
+    Returns:
+        tuple: (host, port), defaulting to the local resolver
+    """
+    try:
+        with open('/etc/resolv.conf', 'r') as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) >= 2 and parts[0] == 'nameserver':
+                    return parts[1], 53
+    except OSError:
+        pass
+    return '127.0.0.1', 53
+
+
+def parse_nameserver(value):
+    """
+    Parse a HOST[:PORT] nameserver specification
+
+    Args:
+        value (str): Nameserver, e.g. '127.0.0.1:5353'
+
+    Returns:
+        tuple: (host, port)
+    """
+    host, sep, port = value.rpartition(':')
+    if sep and port.isdigit() and ':' not in host:
+        return host, int(port)
+    return value, 53
+
+
+def _encode_name(name):
+    encoded = b''
+    for label in name.rstrip('.').split('.'):
+        data = label.encode('idna')
+        if not data or len(data) > 63:
+            raise DNSError(f"Invalid domain name {name}")
+        encoded += bytes([len(data)]) + data
+    return encoded + b'\x00'
+
+
+def _read_name(data, offset):
+    """Read a possibly compressed domain name, returning (name, next offset)"""
+    labels = []
+    end = None
+    for _ in range(128):
+        length = data[offset]
+        if length & 0xC0 == 0xC0:
+            if end is None:
+                end = offset + 2
+            offset = ((length & 0x3F) << 8) | data[offset + 1]
+            continue
+        offset += 1
+        if length == 0:
+            break
+        labels.append(data[offset:offset + length].decode('ascii', errors='replace'))
+        offset += length
+    else:
+        raise DNSError("DNS name compression loop")
+    return '.'.join(labels), (end if end is not None else offset)
+
+
+def query(name, record_type, nameserver=None, timeout=2.0, retries=2):
+    """
+    Send a single DNS query over UDP
+
+    Args:
+        name (str): Domain name to look up
+        record_type (int): Record type, e.g. TYPE_MX
+        nameserver (tuple, optional): (host, port), defaults to resolv.conf
+        timeout (float, optional): Seconds to wait for each attempt
+        retries (int, optional): Additional attempts after a timeout
+
+    Returns:
+        dict: 'rcode', 'answers' as a list of (ttl, value) for the requested
+        type (MX values are (preference, exchange)) and 'negative_ttl' from the
+        SOA record of a negative answer, if any
+
+    Raises:
+        DNSError: If no valid response was received
+    """
+    host, port = nameserver or default_nameserver()
+    query_id = random.randint(0, 0xFFFF)
+    packet = struct.pack('>HHHHHH', query_id, 0x0100, 1, 0, 0, 0) + _encode_name(name)
+    packet += struct.pack('>HH', record_type, 1)
+
+    family = socket.AF_INET6 if ':' in host else socket.AF_INET
+    with socket.socket(family, socket.SOCK_DGRAM) as sock:
+        sock.settimeout(timeout)
+        for attempt in range(retries + 1):
+            sock.sendto(packet, (host, port))
+            deadline = time.monotonic() + timeout
+            try:
+                while True:
+                    sock.settimeout(max(0.001, deadline - time.monotonic()))
+                    data, _ = sock.recvfrom(4096)
+                    if len(data) >= 12 and struct.unpack('>H', data[:2])[0] == query_id:
+                        return _parse_response(data, record_type)
+            except socket.timeout:
+                continue
+    raise DNSError(f"Timed out querying {host}:{port} for {name}")
+
+
+def _parse_response(data, record_type):
+    """Decode the answer and authority sections of a DNS response"""
+    _, flags, qdcount, ancount, nscount, _ = struct.unpack('>HHHHHH', data[:12])
+    if flags & 0x0200:
+        raise DNSError("Truncated DNS response")
+    offset = 12
+    for _ in range(qdcount):
+        _, offset = _read_name(data, offset)
+        offset += 4
+
+    answers = []
+    negative_ttl = None
+    for index in range(ancount + nscount):
+        _, offset = _read_name(data, offset)
+        rtype, _, ttl, length = struct.unpack('>HHIH', data[offset:offset + 10])
+        offset += 10
+        rdata_offset = offset
+        offset += length
+        if index < ancount and rtype == record_type:
+            if rtype == TYPE_MX:
+                preference = struct.unpack('>H', data[rdata_offset:rdata_offset + 2])[0]
+                exchange, _ = _read_name(data, rdata_offset + 2)
+                answers.append((ttl, (preference, exchange)))
+            elif rtype == TYPE_A:
+                answers.append((ttl, socket.inet_ntop(socket.AF_INET, data[rdata_offset:offset])))
+            elif rtype == TYPE_AAAA:
+                answers.append((ttl, socket.inet_ntop(socket.AF_INET6, data[rdata_offset:offset])))
+        elif index >= ancount and rtype == TYPE_SOA:
+            # The SOA minimum field caps how long a negative answer may be cached
+            _, soa_offset = _read_name(data, rdata_offset)
+            _, soa_offset = _read_name(data, soa_offset)
+            minimum = struct.unpack('>I', data[soa_offset + 16:soa_offset + 20])[0]
+            negative_ttl = min(ttl, minimum)
+
+    return {'rcode': flags & 0x000F, 'answers': answers, 'negative_ttl': negative_ttl}
+
+
+class DomainChecker:
+    """Concurrent, cached check that email domains can receive mail
+
+    Each domain is resolved at most once per TTL: MX records first, falling
+    back to A/AAAA (the implicit MX of RFC 5321). Positive answers are cached
+    for the record TTL, non-existent domains and domains without mail hosts
+    for the negative TTL, and lookup failures briefly so an outage is not
+    hammered. Lookups for distinct domains run on a thread pool.
+    """
+
+    def __init__(self, nameserver=None, concurrency=32, timeout=2.0, retries=2,
+                 min_ttl=60, max_ttl=86400, negative_ttl=300, error_ttl=30, max_entries=100000):
+        """
+        Initialize the checker
+
+        Args:
+            nameserver (tuple or str, optional): (host, port) or 'HOST[:PORT]',
+                defaults to the first nameserver in /etc/resolv.conf
+            concurrency (int, optional): Parallel lookups
+            timeout (float, optional): Seconds per DNS query attempt
+            retries (int, optional): Additional attempts after a timeout
+            min_ttl (int, optional): Lower bound for cached positive answers
+            max_ttl (int, optional): Upper bound for any cached answer
+            negative_ttl (int, optional): Cache time for missing domains when the
+                server gives no SOA minimum
+            error_ttl (int, optional): Cache time for failed lookups
+            max_entries (int, optional): Cached domains before the oldest are evicted
+        """
+        if isinstance(nameserver, str):
+            nameserver = parse_nameserver(nameserver)
+        self.nameserver = nameserver or default_nameserver()
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.retries = retries
+        self.min_ttl = min_ttl
+        self.max_ttl = max_ttl
+        self.negative_ttl = negative_ttl
+        self.error_ttl = error_ttl
+        self.max_entries = max_entries
+        self.lookups = 0
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def _query(self, domain, record_type):
+        with self._lock:
+            self.lookups += 1
+        return query(domain, record_type, self.nameserver, self.timeout, self.retries)
+
+    def _resolve(self, domain):
+        """Look up one domain, returning (ok, reason, ttl)"""
+        try:
+            response = self._query(domain, TYPE_MX)
+            if response['rcode'] == RCODE_NXDOMAIN:
+                return False, f"Domain {domain} does not exist", response['negative_ttl']
+            if response['rcode'] != RCODE_NOERROR:
+                return False, f"Domain lookup failed for {domain} (rcode {response['rcode']})", self.error_ttl
+
+            if response['answers']:
+                ttl = min(ttl for ttl, _ in response['answers'])
+                exchanges = [exchange for _, (_, exchange) in response['answers']]
+                if exchanges == ['']:
+                    return False, f"Domain {domain} does not accept email (null MX)", ttl
+                return True, None, ttl
+
+            negative_ttl = response['negative_ttl']
+            for record_type in (TYPE_A, TYPE_AAAA):
+                response = self._query(domain, record_type)
+                if response['answers']:
+                    return True, None, min(ttl for ttl, _ in response['answers'])
+            return False, f"Domain {domain} has no mail server", negative_ttl
+        except (DNSError, OSError, struct.error, IndexError) as e:
+            logger.warning(f"DNS lookup for {domain} failed: {str(e)}")
+            return False, f"Domain lookup failed for {domain}: {str(e)}", self.error_ttl
+
+    def _store(self, domain, ok, reason, ttl, now):
+        if ttl is None:
+            ttl = self.negative_ttl
+        elif ok:
+            ttl = max(ttl, self.min_ttl)
+        ttl = min(ttl, self.max_ttl)
+        with self._lock:
+            self._cache[domain] = (now + ttl, ok, reason)
+            self._cache.move_to_end(domain)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+
+    def check_domains(self, domains):
+        """
+        Check many domains, resolving each uncached domain once and concurrently
+
+        Args:
+            domains (iterable): Domain names, duplicates allowed
+
+        Returns:
+            dict: Lower-case domain mapped to (ok, reason)
+        """
+        now = time.monotonic()
+        results = {}
+        missing = []
+        with self._lock:
+            for domain in domains:
+                domain = domain.lower().rstrip('.')
+                if domain in results:
+                    continue
+                cached = self._cache.get(domain)
+                if cached and cached[0] > now:
+                    results[domain] = cached[1:]
+                else:
+                    results[domain] = None
+                    missing.append(domain)
+
+        if missing:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='dns')
+            for domain, (ok, reason, ttl) in zip(missing, self._executor.map(self._resolve, missing)):
+                self._store(domain, ok, reason, ttl, now)
+                results[domain] = (ok, reason)
+        return results
+
+    def check_domain(self, domain):
+        """
+        Check a single domain
+
+        Args:
+            domain (str): Domain name
+
+        Returns:
+            tuple: (ok, reason)
+        """
+        return self.check_domains([domain])[domain.lower().rstrip('.')]
+
+    def close(self):
+        """Stop the lookup threads"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
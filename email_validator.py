@@ -1,58 +1,187 @@
+import csv
 import re
-import socket
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 
-def validate_email(email):
+# Basic address pattern, compiled once for bulk validation
+EMAIL_PATTERN = re.compile(r'[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}')
+
+# Reason reported for repeated addresses by validate_emails
+DUPLICATE_REASON = "Duplicate address"
+
+def check_email(email):
     """
-    Validate an email address format
-    
+    Check an email address format without raising
+
     Args:
-        email (str): Email address to validate
-        
+        email (str): Email address to check, already stripped of whitespace
+
     Returns:
-        bool: True if valid
-        
-    Raises:
-        ValueError: If email is invalid with detailed reason
+        str: Reason the address is invalid, or None if it is valid
     """
-    # Strip whitespace
-    email = email.strip()
-    
     # Check for empty string
     if not email:
-        raise ValueError("Email address cannot be empty")
-    
+        return "Email address cannot be empty"
+
     # Check maximum length
     if len(email) > 254:
-        raise ValueError("Email address is too long")
-    
+        return "Email address is too long"
+
     # Basic pattern matching
-    pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
-    if not re.match(pattern, email):
-        raise ValueError("Email address format is invalid")
-    
+    if EMAIL_PATTERN.fullmatch(email) is None:
+        return "Email address format is invalid"
+
     # Split into local and domain parts
-    try:
-        local_part, domain = email.rsplit('@', 1)
-    except ValueError:
-        raise ValueError("Email address must contain exactly one @ symbol")
-    
+    local_part, _, domain = email.rpartition('@')
+
     # Check local part length
     if len(local_part) > 64:
-        raise ValueError("Local part of email address is too long")
-    
+        return "Local part of email address is too long"
+
     # Check for consecutive dots
-    if '..' in local_part or '..' in domain:
-        raise ValueError("Email address cannot contain consecutive dots")
-    
-    # Check if domain has at least one dot
-    if '.' not in domain:
-        raise ValueError("Domain must contain at least one dot")
-    
-    # Optional: Check if domain exists (DNS check)
-    # This is commented out to avoid network requests during validation
-    # try:
-    #     socket.gethostbyname(domain)
-    # except socket.gaierror:
-    #     raise ValueError(f"Domain {domain} does not exist")
-    
+    if '..' in email:
+        return "Email address cannot contain consecutive dots"
+
+    return None
+
+def validate_email(email):
+    """
+    Validate an email address format
+
+    Args:
+        email (str): Email address to validate
+
+    Returns:
+        bool: True if valid
+
+    Raises:
+        ValueError: If email is invalid with detailed reason
+    """
+    reason = check_email(email.strip())
+    if reason:
+        raise ValueError(reason)
+
     return True
+
+def iter_addresses(source):
+    """
+    Read addresses lazily from a file or iterable
+
+    Args:
+        source (str or file or iterable): Path to a text file with one address
+            per line (or a CSV file with an email column), '-' for stdin, an open
+            file, or any iterable of strings
+
+    Yields:
+        str: Addresses with surrounding whitespace removed, blank lines skipped
+    """
+    if isinstance(source, str):
+        if source == '-':
+            yield from iter_addresses(sys.stdin)
+            return
+        with open(source, 'r', newline='', encoding='utf-8-sig') as f:
+            if source.lower().endswith('.csv'):
+                reader = csv.reader(f)
+                header = next(reader, [])
+                names = [name.strip().lower() for name in header]
+                column = next((names.index(name) for name in ('email', 'to', 'recipient') if name in names), 0)
+                for row in reader:
+                    if len(row) > column and row[column].strip():
+                        yield row[column].strip()
+            else:
+                yield from iter_addresses(f)
+        return
+
+    for line in source:
+        line = line.strip()
+        if line:
+            yield line
+
+def _check_chunk(addresses):
+    """Check a chunk of addresses in a worker process"""
+    return [check_email(address) for address in addresses]
+
+def _chunks(items, size):
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def validate_emails(addresses, dedupe=True, processes=None, chunk_size=10000, domain_checker=None):
+    """
+    Validate a stream of addresses without raising per item
+
+    Addresses are read lazily, so arbitrarily large lists are processed in
+    constant memory apart from the set used for deduplication. Duplicates are
+    detected case-insensitively and reported instead of being checked again.
+    With ``processes`` the format checks are sharded across a process pool in
+    chunks, keeping only a few chunks in flight; output order always follows
+    the input. With a ``domain_checker`` (see domain_check.DomainChecker) the
+    unique domains of each chunk's well-formed addresses are also resolved,
+    concurrently and through its cache, and the result is merged back onto
+    every address of that domain.
+
+    Args:
+        addresses (str or iterable): Source accepted by iter_addresses
+        dedupe (bool, optional): Report repeated addresses as duplicates
+        processes (int, optional): Worker processes, None to check in-process
+        chunk_size (int, optional): Addresses per chunk sent to a worker
+        domain_checker (DomainChecker, optional): Also require a resolvable mail domain
+
+    Yields:
+        tuple: (address, ok, reason) where reason is None for valid addresses
+    """
+    seen = set()
+
+    def checked(chunk):
+        """Split a chunk into duplicates and addresses still to check"""
+        results = []
+        pending = []
+        for address in chunk:
+            if dedupe:
+                key = address.lower()
+                if key in seen:
+                    results.append((address, DUPLICATE_REASON))
+                    continue
+                seen.add(key)
+            results.append((address, False))
+            pending.append(address)
+        return results, pending
+
+    def merged(results, reasons):
+        reasons = iter(reasons)
+        results = [(address, next(reasons) if reason is False else reason) for address, reason in results]
+        if domain_checker is not None:
+            domains = domain_checker.check_domains(
+                address.rpartition('@')[2] for address, reason in results if reason is None)
+            for address, reason in results:
+                if reason is None:
+                    reason = domains[address.rpartition('@')[2].lower()][1]
+                yield address, reason is None, reason
+            return
+        for address, reason in results:
+            yield address, reason is None, reason
+
+    chunks = _chunks(iter_addresses(addresses), chunk_size)
+    if not processes or processes <= 1:
+        for chunk in chunks:
+            results, pending = checked(chunk)
+            yield from merged(results, map(check_email, pending))
+        return
+
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        in_flight = deque()
+        for chunk in chunks:
+            results, pending = checked(chunk)
+            in_flight.append((results, executor.submit(_check_chunk, pending)))
+            if len(in_flight) >= processes * 2:
+                results, future = in_flight.popleft()
+                yield from merged(results, future.result())
+        while in_flight:
+            results, future = in_flight.popleft()
+            yield from merged(results, future.result())
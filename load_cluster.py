@@ -0,0 +1,391 @@
+import base64
+import hmac
+import ipaddress
+import json
+import logging
+import multiprocessing
+import socket
+import threading
+import time
+
+from load_generator import LoadGenerator, LoadStats, interval_summary
+
+logger = logging.getLogger(__name__)
+
+# Default TCP port load workers listen on
+DEFAULT_WORKER_PORT = 7070
+
+
+def parse_worker_address(address):
+    """
+    Parse a worker address given as HOST[:PORT]
+
+    Args:
+        address (str): Worker address
+
+    Returns:
+        tuple: (host, port)
+
+    Raises:
+        ValueError: If the port is not a number
+    """
+    host, _, port = address.strip().rpartition(':')
+    if not host:
+        return port, DEFAULT_WORKER_PORT
+    return host.strip('[]'), int(port)
+
+
+def is_loopback(host):
+    """
+    Check whether a listen address is only reachable from this machine
+
+    Args:
+        host (str): Host name or IP address
+
+    Returns:
+        bool: True for 'localhost' and loopback IP addresses
+    """
+    if host.lower() == 'localhost':
+        return True
+    try:
+        return ipaddress.ip_address(host.strip('[]')).is_loopback
+    except ValueError:
+        return False
+
+
+def _send(stream, lock, message):
+    """Write one newline-delimited JSON message"""
+    data = json.dumps(message).encode('utf-8') + b'\n'
+    with lock:
+        stream.write(data)
+        stream.flush()
+
+
+class LoadWorker:
+    """TCP server that runs its share of a distributed load test
+
+    The coordinator sends a JSON test plan (profile, envelope, base64 message
+    and this worker's rate and session count). The worker waits for the
+    plan's start time, runs a LoadGenerator and streams each interval's
+    mergeable LoadStats back, followed by a final result. Messages are
+    newline-delimited JSON in both directions; a {"type": "stop"} message
+    from the coordinator ends the run early.
+
+    The connection is plain, unencrypted TCP: the plan, including the SMTP
+    profile's password and the token, crosses the network in clear text.
+    Anyone who can reach the worker can make it send mail, so listening on a
+    non-loopback address requires a token; use it only on trusted networks.
+    """
+
+    def __init__(self, host='127.0.0.1', port=DEFAULT_WORKER_PORT, token=None):
+        """
+        Initialize the worker
+
+        Args:
+            host (str, optional): Address to listen on
+            port (int, optional): Port to listen on, 0 for any free port
+            token (str, optional): Shared secret the coordinator must present,
+                required unless host is a loopback address
+
+        Raises:
+            ValueError: If host is not a loopback address and no token is given
+        """
+        if not token and not is_loopback(host):
+            raise ValueError(f"Refusing to listen on {host or 'all interfaces'} without a token; "
+                             f"anyone who can connect could send mail through this worker")
+        self.host = host
+        self.port = port
+        self.token = token
+        self.server = None
+
+    def bind(self):
+        """Open the listening socket; the bound port is written back to self.port"""
+        self.server = socket.create_server((self.host, self.port))
+        self.port = self.server.getsockname()[1]
+        return self
+
+    def serve_forever(self, max_runs=None):
+        """
+        Accept coordinators one at a time and run their plans
+
+        Args:
+            max_runs (int, optional): Return after this many runs
+        """
+        if self.server is None:
+            self.bind()
+        logger.info(f"Load worker listening on {self.host}:{self.port}")
+        runs = 0
+        try:
+            while max_runs is None or runs < max_runs:
+                conn, peer = self.server.accept()
+                with conn:
+                    try:
+                        self.handle(conn, peer)
+                    except Exception as e:
+                        logger.error(f"Load run from {peer[0]}:{peer[1]} failed: {str(e)}")
+                runs += 1
+        finally:
+            self.server.close()
+
+    def handle(self, conn, peer):
+        reader = conn.makefile('rb')
+        writer = conn.makefile('wb')
+        lock = threading.Lock()
+        line = reader.readline()
+        if not line:
+            return
+        plan = json.loads(line)
+        if self.token and not hmac.compare_digest(str(plan.get('token', '')), self.token):
+            _send(writer, lock, {'type': 'error', 'error': 'Invalid token'})
+            logger.error(f"Rejected load plan from {peer[0]}:{peer[1]}: invalid token")
+            return
+
+        logger.info(f"Load plan from {peer[0]}:{peer[1]}: {plan['rate']} msg/s for {plan['duration']}s "
+                    f"over {plan['sessions']} sessions")
+
+        def on_interval(interval):
+            stats = interval.pop('stats')
+            _send(writer, lock, {'type': 'interval', 'backlog': interval['backlog'], 'stats': stats.to_dict()})
+
+        generator = LoadGenerator(plan['profile'], plan['sender'], plan['recipients'],
+                                  base64.b64decode(plan['message']), rate=plan['rate'],
+                                  duration=plan['duration'], sessions=plan['sessions'],
+                                  hostname=plan.get('hostname'),
+                                  max_messages_per_session=plan.get('max_messages_per_session', 0),
+                                  interval=plan.get('interval', 1.0), on_interval=on_interval)
+
+        def watch():
+            for line in reader:
+                if json.loads(line).get('type') == 'stop':
+                    break
+            # Coordinator asked to stop or went away
+            generator.stop()
+
+        threading.Thread(target=watch, name='load-worker-control', daemon=True).start()
+        delay = plan.get('start_at', 0) - time.time()
+        if delay > 0:
+            time.sleep(delay)
+
+        report = generator.run()
+        stats = report.pop('stats')
+        report.pop('latency', None)
+        _send(writer, lock, {'type': 'result', 'report': report, 'stats': stats.to_dict()})
+
+
+def _run_local_worker(token, ports):
+    """Child process entry point for a local worker"""
+    worker = LoadWorker(port=0, token=token).bind()
+    ports.send(worker.port)
+    worker.serve_forever(max_runs=1)
+
+
+def start_local_workers(count, token=None):
+    """
+    Start load workers in child processes on this machine
+
+    Args:
+        count (int): Number of worker processes
+        token (str, optional): Shared secret for the workers
+
+    Returns:
+        tuple: (processes, addresses) where addresses are (host, port) tuples
+    """
+    context = multiprocessing.get_context('fork')
+    processes = []
+    addresses = []
+    for _ in range(count):
+        receive, send = context.Pipe(duplex=False)
+        process = context.Process(target=_run_local_worker, args=(token, send), daemon=True)
+        process.start()
+        processes.append(process)
+        addresses.append(('127.0.0.1', receive.recv()))
+    return processes, addresses
+
+
+class LoadCoordinator:
+    """Split a load test across workers and merge their results
+
+    The target rate is divided evenly and sessions as evenly as possible.
+    Each worker's open-loop schedule is offset by a fraction of the message
+    interval so the combined schedule stays evenly spaced. Interval stats
+    from all workers are merged for live updates, and the final per-worker
+    histograms are merged into one report shaped like LoadGenerator.run().
+    Start times are wall-clock, so remote workers need synchronized clocks.
+    """
+
+    def __init__(self, workers, profile, sender, recipients, message, rate, duration, sessions=4,
+                 hostname=None, max_messages_per_session=0, interval=1.0, on_interval=None,
+                 token=None, start_delay=1.0, connect_timeout=10):
+        """
+        Initialize the coordinator
+
+        Args:
+            workers (list): (host, port) tuples of running LoadWorkers
+            profile (dict): SMTP profile as stored by ConfigManager
+            sender (str): Envelope sender
+            recipients (list): Envelope recipients for every message
+            message (bytes): Serialized message sent each time
+            rate (float): Total target messages per second
+            duration (float): Seconds to offer load for
+            sessions (int, optional): Total concurrent sessions, at least one per worker
+            hostname (str, optional): Hostname to use for SMTP connection
+            max_messages_per_session (int, optional): Messages per connection, 0 for no limit
+            interval (float, optional): Seconds between live updates
+            on_interval (callable, optional): Called with a merged dict for each interval
+            token (str, optional): Shared secret expected by the workers
+            start_delay (float, optional): Seconds between sending plans and starting
+            connect_timeout (float, optional): Seconds to wait when connecting to a worker
+        """
+        self.workers = list(workers)
+        self.profile = profile
+        self.sender = sender
+        self.recipients = recipients
+        self.message = message
+        self.rate = float(rate)
+        self.duration = float(duration)
+        self.sessions = max(len(self.workers), int(sessions))
+        self.hostname = hostname
+        self.max_messages_per_session = max_messages_per_session
+        self.interval = interval
+        self.on_interval = on_interval
+        self.token = token
+        self.start_delay = start_delay
+        self.connect_timeout = connect_timeout
+        self._lock = threading.Lock()
+        self._interval_stats = LoadStats()
+        self._backlogs = {}
+        self._connections = []
+
+    def _plan(self, index, start_at):
+        count = len(self.workers)
+        return {
+            'type': 'plan',
+            'token': self.token,
+            'profile': self.profile,
+            'sender': self.sender,
+            'recipients': self.recipients,
+            'message': base64.b64encode(self.message).decode('ascii'),
+            'rate': self.rate / count,
+            'duration': self.duration,
+            'sessions': self.sessions // count + (1 if index < self.sessions % count else 0),
+            'hostname': self.hostname,
+            'max_messages_per_session': self.max_messages_per_session,
+            'interval': self.interval,
+            'start_at': start_at + index / self.rate
+        }
+
+    def _read(self, index, reader, results):
+        address = '%s:%s' % self.workers[index]
+        try:
+            for line in reader:
+                message = json.loads(line)
+                if message['type'] == 'interval':
+                    with self._lock:
+                        self._interval_stats.merge(LoadStats.from_dict(message['stats']))
+                        self._backlogs[index] = message.get('backlog', 0)
+                elif message['type'] == 'result':
+                    message['report']['worker'] = address
+                    results[index] = message
+                    return
+                elif message['type'] == 'error':
+                    results[index] = {'error': message.get('error', 'Unknown error')}
+                    return
+            results[index] = {'error': 'Worker closed the connection'}
+        except (OSError, ValueError) as e:
+            results[index] = {'error': str(e)}
+
+    def stop(self):
+        """Ask every worker to stop releasing new messages"""
+        for writer, lock in self._connections:
+            try:
+                _send(writer, lock, {'type': 'stop'})
+            except OSError:
+                pass
+
+    def run(self):
+        """
+        Run the plan on every worker and wait for their results
+
+        Returns:
+            dict: Same shape as LoadGenerator.run(), plus per-worker reports in
+            'workers' and connection or run failures in 'worker_errors'
+
+        Raises:
+            OSError: If a worker cannot be reached
+        """
+        sockets = []
+        try:
+            for host, port in self.workers:
+                conn = socket.create_connection((host, port), timeout=self.connect_timeout)
+                conn.settimeout(None)
+                sockets.append(conn)
+        except OSError:
+            for conn in sockets:
+                conn.close()
+            raise
+
+        results = [None] * len(sockets)
+        readers = []
+        start_at = time.time() + self.start_delay
+        for index, conn in enumerate(sockets):
+            writer = conn.makefile('wb')
+            lock = threading.Lock()
+            self._connections.append((writer, lock))
+            _send(writer, lock, self._plan(index, start_at))
+            thread = threading.Thread(target=self._read, args=(index, conn.makefile('rb'), results),
+                                      name=f'load-coordinator-{index}', daemon=True)
+            thread.start()
+            readers.append(thread)
+
+        time.sleep(max(0, start_at - time.time()))
+        start = time.perf_counter()
+        # Tick half an interval after the workers so each update holds one report per worker
+        last = start + self.interval / 2
+        while any(thread.is_alive() for thread in readers):
+            try:
+                deadline = last + self.interval
+                for thread in readers:
+                    thread.join(timeout=max(0.01, deadline - time.perf_counter()))
+                    if time.perf_counter() >= deadline:
+                        break
+            except KeyboardInterrupt:
+                logger.info("Interrupted, stopping workers")
+                self.stop()
+                continue
+            now = time.perf_counter()
+            with self._lock:
+                interval_stats, self._interval_stats = self._interval_stats, LoadStats()
+                backlog = sum(self._backlogs.values())
+            if self.on_interval:
+                summary = interval_summary(interval_stats, now - start, self.interval, backlog)
+                summary['workers'] = sum(1 for thread in readers if thread.is_alive())
+                self.on_interval(summary)
+            last = now
+        for conn in sockets:
+            conn.close()
+        elapsed = time.perf_counter() - start
+
+        stats = LoadStats()
+        workers = []
+        worker_errors = {}
+        for index, result in enumerate(results):
+            address = '%s:%s' % self.workers[index]
+            if not result or 'error' in result:
+                worker_errors[address] = result['error'] if result else 'No result'
+                continue
+            stats.merge(LoadStats.from_dict(result['stats']))
+            workers.append(result['report'])
+
+        report = {
+            'target_rate': self.rate,
+            'duration': self.duration,
+            'sessions': self.sessions,
+            'elapsed_seconds': round(elapsed, 3),
+            'achieved_rate': round(stats.sent / elapsed, 2) if elapsed > 0 else 0,
+            'connections': sum(worker['connections'] for worker in workers)
+        }
+        report.update(stats.summary())
+        report['workers'] = workers
+        report['worker_errors'] = worker_errors
+        report['stats'] = stats
+        return report
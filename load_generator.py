@@ -0,0 +1,621 @@
+import logging
+import math
+import queue
+import smtplib
+import socket
+import ssl
+import threading
+import time
+
+from smtp_tool import SMTPSession
+
+logger = logging.getLogger(__name__)
+
+# Percentiles shown in the final latency tables
+REPORT_PERCENTILES = (50, 90, 99, 99.9)
+
+# Order in which phase histograms are reported; 'error_total' is the total
+# latency of failed sends, kept apart so failures do not skew 'total'
+PHASES = ('total', 'error_total', 'schedule_lag', 'connect', 'ehlo', 'starttls', 'auth', 'envelope', 'data')
+
+
+class LatencyHistogram:
+    """Log-linear latency histogram in the style of HdrHistogram
+
+    Values are recorded in microseconds. Below 256us every value has its own
+    bucket; above that each power of two is split into 128 buckets, so any
+    recorded value is reproduced within 0.8% while the histogram stays a few
+    kilobytes regardless of how many values it holds. Histograms from
+    different threads, intervals or machines merge by adding bucket counts.
+    """
+
+    SUB_BUCKET_BITS = 8
+
+    def __init__(self):
+        self.counts = {}
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = 0
+
+    @classmethod
+    def _index(cls, value):
+        if value < (1 << cls.SUB_BUCKET_BITS):
+            return value
+        shift = value.bit_length() - cls.SUB_BUCKET_BITS
+        return (shift << cls.SUB_BUCKET_BITS) + (value >> shift)
+
+    @classmethod
+    def _value(cls, index):
+        """Midpoint of the values that fall into a bucket"""
+        shift = index >> cls.SUB_BUCKET_BITS
+        if shift == 0:
+            return index
+        mantissa = index & ((1 << cls.SUB_BUCKET_BITS) - 1)
+        return (mantissa << shift) + ((1 << shift) >> 1)
+
+    def record(self, seconds):
+        """
+        Record one latency
+
+        Args:
+            seconds (float): Latency in seconds
+        """
+        value = max(0, int(seconds * 1000000))
+        index = self._index(value)
+        self.counts[index] = self.counts.get(index, 0) + 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    def merge(self, other):
+        """
+        Add another histogram's counts into this one
+
+        Args:
+            other (LatencyHistogram): Histogram to merge
+
+        Returns:
+            LatencyHistogram: self
+        """
+        for index, count in other.counts.items():
+            self.counts[index] = self.counts.get(index, 0) + count
+        self.count += other.count
+        self.total += other.total
+        if other.min is not None and (self.min is None or other.min < self.min):
+            self.min = other.min
+        self.max = max(self.max, other.max)
+        return self
+
+    def percentile(self, pct):
+        """
+        Get a percentile in seconds
+
+        Args:
+            pct (float): Percentile between 0 and 100
+
+        Returns:
+            float: Latency in seconds, 0 when empty
+        """
+        if not self.count:
+            return 0.0
+        target = max(1, math.ceil(pct / 100.0 * self.count))
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= target:
+                return min(self._value(index), self.max) / 1000000.0
+        return self.max / 1000000.0
+
+    def summary(self):
+        """
+        Get count, mean, max and the report percentiles in milliseconds
+
+        Returns:
+            dict: Summary statistics
+        """
+        data = {'count': self.count}
+        if self.count:
+            data['mean_ms'] = round(self.total / self.count / 1000.0, 3)
+            data['min_ms'] = round(self.min / 1000.0, 3)
+            data['max_ms'] = round(self.max / 1000.0, 3)
+            for pct in REPORT_PERCENTILES:
+                data[f'p{pct:g}_ms'] = round(self.percentile(pct) * 1000, 3)
+        return data
+
+    def to_dict(self):
+        """Serialize for JSON export or transfer between processes"""
+        return {'unit': 'us', 'counts': {str(index): count for index, count in self.counts.items()},
+                'count': self.count, 'total': self.total, 'min': self.min, 'max': self.max}
+
+    @classmethod
+    def from_dict(cls, data):
+        """Rebuild a histogram serialized with to_dict"""
+        histogram = cls()
+        histogram.counts = {int(index): count for index, count in data.get('counts', {}).items()}
+        histogram.count = data.get('count', 0)
+        histogram.total = data.get('total', 0)
+        histogram.min = data.get('min')
+        histogram.max = data.get('max', 0)
+        return histogram
+
+
+def classify_error(error):
+    """
+    Map a send failure to a short error class for reporting
+
+    Args:
+        error (Exception): Exception raised while sending
+
+    Returns:
+        str: Error class such as 'rcpt_550', 'data_451', 'timeout' or 'disconnected'
+    """
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        codes = sorted({code for code, _ in error.recipients.values()})
+        return 'rcpt_' + '_'.join(str(code) for code in codes)
+    if isinstance(error, smtplib.SMTPSenderRefused):
+        return f'mail_{error.smtp_code}'
+    if isinstance(error, smtplib.SMTPDataError):
+        return f'data_{error.smtp_code}'
+    if isinstance(error, smtplib.SMTPAuthenticationError):
+        return 'auth'
+    if isinstance(error, smtplib.SMTPConnectError):
+        return f'connect_{error.smtp_code}'
+    if isinstance(error, smtplib.SMTPResponseException):
+        return f'reply_{error.smtp_code}'
+    if isinstance(error, smtplib.SMTPServerDisconnected):
+        return 'disconnected'
+    if isinstance(error, (socket.timeout, TimeoutError)):
+        return 'timeout'
+    if isinstance(error, ConnectionRefusedError):
+        return 'connection_refused'
+    if isinstance(error, ssl.SSLError):
+        return 'tls'
+    if isinstance(error, OSError):
+        return 'network'
+    return type(error).__name__
+
+
+class LoadStats:
+    """Latency histograms and counters for a load run or one interval of it"""
+
+    def __init__(self):
+        self.histograms = {}
+        self.sent = 0
+        self.errors = {}
+
+    def record(self, timings):
+        for phase, seconds in timings.items():
+            histogram = self.histograms.get(phase)
+            if histogram is None:
+                histogram = self.histograms[phase] = LatencyHistogram()
+            histogram.record(seconds)
+
+    def merge(self, other):
+        """Add another LoadStats into this one and return self"""
+        for phase, histogram in other.histograms.items():
+            self.histograms.setdefault(phase, LatencyHistogram()).merge(histogram)
+        self.sent += other.sent
+        for name, count in other.errors.items():
+            self.errors[name] = self.errors.get(name, 0) + count
+        return self
+
+    @property
+    def failed(self):
+        return sum(self.errors.values())
+
+    def error_rate(self, prefix=None):
+        """
+        Fraction of attempts that failed, optionally only errors of one class
+
+        Args:
+            prefix (str, optional): Count only error classes containing this
+                text, e.g. '_4' for 4xx replies
+
+        Returns:
+            float: Error rate between 0 and 1
+        """
+        attempts = self.sent + self.failed
+        if not attempts:
+            return 0.0
+        if prefix is None:
+            return self.failed / attempts
+        return sum(count for name, count in self.errors.items() if prefix in name) / attempts
+
+    def summary(self):
+        """
+        Get counts and per-phase latency summaries
+
+        Returns:
+            dict: 'sent', 'failed', 'errors' and 'latency' by phase
+        """
+        ordered = [phase for phase in PHASES if phase in self.histograms]
+        ordered += sorted(phase for phase in self.histograms if phase not in PHASES)
+        return {
+            'sent': self.sent,
+            'failed': self.failed,
+            'errors': dict(sorted(self.errors.items(), key=lambda item: -item[1])),
+            'latency': {phase: self.histograms[phase].summary() for phase in ordered}
+        }
+
+    def to_dict(self):
+        return {'sent': self.sent, 'errors': dict(self.errors),
+                'histograms': {phase: h.to_dict() for phase, h in self.histograms.items()}}
+
+    @classmethod
+    def from_dict(cls, data):
+        stats = cls()
+        stats.sent = data.get('sent', 0)
+        stats.errors = dict(data.get('errors', {}))
+        stats.histograms = {phase: LatencyHistogram.from_dict(h) for phase, h in data.get('histograms', {}).items()}
+        return stats
+
+
+def interval_summary(stats, elapsed, seconds, backlog):
+    """
+    Build the live update for one reporting interval
+
+    Args:
+        stats (LoadStats): Stats recorded during the interval
+        elapsed (float): Seconds since the run started
+        seconds (float): Length of the interval
+        backlog (int): Messages released but not yet picked up by a session
+
+    Returns:
+        dict: Interval rate, counts, p50/p99 total latency, p99 latency of
+        failed sends and error classes; 'stats' holds the interval's LoadStats
+        for merging
+    """
+    total = stats.histograms.get('total', LatencyHistogram())
+    error_total = stats.histograms.get('error_total', LatencyHistogram())
+    return {
+        'elapsed': round(elapsed, 3),
+        'rate': round(stats.sent / seconds, 2) if seconds > 0 else 0,
+        'sent': stats.sent,
+        'failed': stats.failed,
+        'backlog': backlog,
+        'p50_ms': round(total.percentile(50) * 1000, 3),
+        'p99_ms': round(total.percentile(99) * 1000, 3),
+        'error_p99_ms': round(error_total.percentile(99) * 1000, 3),
+        'errors': dict(stats.errors),
+        'stats': stats
+    }
+
+
+class LoadGenerator:
+    """Open-loop, fixed-rate SMTP load generator
+
+    A scheduler thread releases messages at their intended start times
+    (start + i / rate) regardless of how fast earlier messages complete, and
+    ``sessions`` worker threads with their own reused SMTP connections send
+    them. The total latency of each message is measured from its intended
+    start, so time spent waiting for a free session is included and stalls
+    are not hidden by coordinated omission.
+    """
+
+    def __init__(self, profile, sender, recipients, message, rate, duration, sessions=4,
+                 hostname=None, max_messages_per_session=0, interval=1.0, on_interval=None):
+        """
+        Initialize the generator
+
+        Args:
+            profile (dict): SMTP profile as stored by ConfigManager
+            sender (str): Envelope sender
+            recipients (list): Envelope recipients for every message
+            message (bytes): Serialized message sent each time
+            rate (float): Target messages per second
+            duration (float): Seconds to offer load for
+            sessions (int, optional): Concurrent SMTP sessions
+            hostname (str, optional): Hostname to use for SMTP connection
+            max_messages_per_session (int, optional): Messages per connection, 0 for no limit
+            interval (float, optional): Seconds between live updates
+            on_interval (callable, optional): Called with a dict for each interval
+        """
+        self.profile = profile
+        self.sender = sender
+        self.recipients = recipients
+        self.message = message
+        self.rate = float(rate)
+        self.duration = float(duration)
+        self.sessions = max(1, int(sessions))
+        self.hostname = hostname
+        self.max_messages_per_session = max_messages_per_session
+        self.interval = interval
+        self.on_interval = on_interval
+        self.stats = LoadStats()
+        self._interval_stats = LoadStats()
+        self._lock = threading.Lock()
+        self._work = queue.Queue()
+        self._stopped = threading.Event()
+        self.connections = 0
+
+    def _schedule(self, start):
+        """Release messages at their intended times until the duration ends"""
+        total = int(self.rate * self.duration)
+        for index in range(total):
+            intended = start + index / self.rate
+            delay = intended - time.perf_counter()
+            if delay > 0 and self._stopped.wait(delay):
+                break
+            self._work.put(intended)
+        for _ in range(self.sessions):
+            self._work.put(None)
+
+    def _worker(self):
+        session = SMTPSession.from_profile(self.profile, hostname=self.hostname,
+                                           max_messages=self.max_messages_per_session)
+        try:
+            while True:
+                intended = self._work.get()
+                if intended is None:
+                    return
+                started = time.perf_counter()
+                try:
+                    session.send(self.sender, self.recipients, self.message)
+                    error = None
+                except Exception as e:
+                    error = classify_error(e)
+                    if not isinstance(e, (smtplib.SMTPResponseException, smtplib.SMTPRecipientsRefused)):
+                        session.close()
+                finished = time.perf_counter()
+
+                timings = dict(session.timings)
+                timings['schedule_lag'] = started - intended
+                timings['total'] = finished - intended
+                with self._lock:
+                    for stats in (self.stats, self._interval_stats):
+                        if error is None:
+                            stats.sent += 1
+                            stats.record(timings)
+                        else:
+                            stats.errors[error] = stats.errors.get(error, 0) + 1
+                            # Phase timings may be left over from an earlier send
+                            stats.record({'error_total': timings['total']})
+        finally:
+            with self._lock:
+                self.connections += session.connections
+            session.close()
+
+    def _wait_interval(self, threads, start, last):
+        """Wait for the next live update or for the workers to finish"""
+        while any(thread.is_alive() for thread in threads) and time.perf_counter() < last + self.interval:
+            for thread in threads:
+                thread.join(timeout=max(0.01, last + self.interval - time.perf_counter()))
+                if time.perf_counter() >= last + self.interval:
+                    break
+        now = time.perf_counter()
+        with self._lock:
+            interval_stats, self._interval_stats = self._interval_stats, LoadStats()
+        if self.on_interval:
+            self.on_interval(interval_summary(interval_stats, now - start, now - last, self._work.qsize()))
+        return now
+
+    def stop(self):
+        """Stop releasing new messages; queued ones are still sent"""
+        self._stopped.set()
+
+    def run(self):
+        """
+        Offer load for the configured duration and wait for it to drain
+
+        Returns:
+            dict: Target and achieved rates, counts, error classes and per-phase
+            latency summaries; 'stats' holds the mergeable LoadStats
+        """
+        threads = [threading.Thread(target=self._worker, name=f'load-{i}', daemon=True)
+                   for i in range(self.sessions)]
+        for thread in threads:
+            thread.start()
+        start = time.perf_counter()
+        scheduler = threading.Thread(target=self._schedule, args=(start,), name='load-scheduler', daemon=True)
+        scheduler.start()
+
+        last = start
+        while any(thread.is_alive() for thread in threads):
+            try:
+                last = self._wait_interval(threads, start, last)
+            except KeyboardInterrupt:
+                logger.info("Interrupted, waiting for queued messages")
+                self.stop()
+        scheduler.join()
+
+        elapsed = time.perf_counter() - start
+        report = {
+            'target_rate': self.rate,
+            'duration': self.duration,
+            'sessions': self.sessions,
+            'elapsed_seconds': round(elapsed, 3),
+            'achieved_rate': round(self.stats.sent / elapsed, 2) if elapsed > 0 else 0,
+            'connections': self.connections
+        }
+        report.update(self.stats.summary())
+        report['stats'] = self.stats
+        return report
+
+
+def format_latency_table(latency):
+    """
+    Render per-phase latency summaries as a fixed-width table
+
+    Args:
+        latency (dict): Phase to summary, as in LoadStats.summary()['latency']
+
+    Returns:
+        str: Table text
+    """
+    columns = ['count', 'mean_ms'] + [f'p{pct:g}_ms' for pct in REPORT_PERCENTILES] + ['max_ms']
+    lines = ['phase'.ljust(14) + ''.join(column.rjust(12) for column in columns)]
+    for phase, summary in latency.items():
+        lines.append(phase.ljust(14) + ''.join(str(summary.get(column, '')).rjust(12) for column in columns))
+    return '\n'.join(lines)
+
+
+# Error classes counted as connection-level failures rather than SMTP replies
+CONNECTION_ERRORS = ('connection_refused', 'disconnected', 'timeout', 'tls', 'network', 'connect_')
+
+
+class CapacityFinder:
+    """Find the highest rate a relay sustains within a latency SLO
+
+    Runs a series of fixed-rate LoadGenerator steps under AIMD control: while
+    a step meets the SLO (p99 total latency, 4xx deferral rate, connection
+    error rate and achieved rate) the target rate grows additively; when it
+    misses, the rate is cut multiplicatively and the additive step is halved,
+    so the search settles between the best passing and lowest failing rates.
+    When a step falls short only because every session is busy, sessions are
+    added and the same rate is tried again.
+    """
+
+    def __init__(self, profile, sender, recipients, message, slo_p99=0.5, max_deferral_rate=0.01,
+                 max_error_rate=0.01, start_rate=10.0, step=None, step_duration=10.0, sessions=4,
+                 max_sessions=64, decrease=0.5, tolerance=0.05, max_steps=30, hostname=None,
+                 on_step=None):
+        """
+        Initialize the finder
+
+        Args:
+            profile (dict): SMTP profile as stored by ConfigManager
+            sender (str): Envelope sender
+            recipients (list): Envelope recipients for every message
+            message (bytes): Serialized message sent each time
+            slo_p99 (float, optional): Highest acceptable p99 total latency in seconds
+            max_deferral_rate (float, optional): Highest acceptable fraction of 4xx replies
+            max_error_rate (float, optional): Highest acceptable fraction of connection errors
+            start_rate (float, optional): First target rate in messages per second
+            step (float, optional): Additive increase in messages per second, defaults to start_rate
+            step_duration (float, optional): Seconds each step offers load for
+            sessions (int, optional): Initial concurrent sessions
+            max_sessions (int, optional): Upper bound when adding sessions
+            decrease (float, optional): Factor applied to the rate after a failed step
+            tolerance (float, optional): Stop once the gap between passing and failing
+                rates is below this fraction of the passing rate
+            max_steps (int, optional): Upper bound on steps run
+            hostname (str, optional): Hostname to use for SMTP connection
+            on_step (callable, optional): Called with each step's result dict
+        """
+        self.profile = profile
+        self.sender = sender
+        self.recipients = recipients
+        self.message = message
+        self.slo_p99 = slo_p99
+        self.max_deferral_rate = max_deferral_rate
+        self.max_error_rate = max_error_rate
+        self.start_rate = float(start_rate)
+        self.step = float(step or start_rate)
+        self.step_duration = step_duration
+        self.sessions = max(1, int(sessions))
+        self.max_sessions = max(self.sessions, int(max_sessions))
+        self.decrease = decrease
+        self.tolerance = tolerance
+        self.max_steps = max_steps
+        self.hostname = hostname
+        self.on_step = on_step
+        self._generator = None
+        self._stopped = False
+
+    def _run_step(self, rate, sessions):
+        self._generator = LoadGenerator(self.profile, self.sender, self.recipients, self.message,
+                                        rate=rate, duration=self.step_duration, sessions=sessions,
+                                        hostname=self.hostname, interval=self.step_duration)
+        report = self._generator.run()
+        stats = report.pop('stats')
+        total = stats.histograms.get('total', LatencyHistogram())
+        error_total = stats.histograms.get('error_total', LatencyHistogram())
+        lag = stats.histograms.get('schedule_lag', LatencyHistogram())
+        attempts = stats.sent + stats.failed
+        connection_errors = sum(count for name, count in stats.errors.items()
+                                if name.startswith(CONNECTION_ERRORS))
+
+        result = {
+            'rate': round(rate, 2),
+            'sessions': sessions,
+            'achieved_rate': report['achieved_rate'],
+            'sent': stats.sent,
+            'failed': stats.failed,
+            'p50_ms': round(total.percentile(50) * 1000, 3),
+            'p99_ms': round(total.percentile(99) * 1000, 3),
+            'error_p99_ms': round(error_total.percentile(99) * 1000, 3),
+            'schedule_lag_p99_ms': round(lag.percentile(99) * 1000, 3),
+            'deferral_rate': round(stats.error_rate('_4'), 4),
+            'connection_error_rate': round(connection_errors / attempts, 4) if attempts else 0.0,
+            'errors': report['errors']
+        }
+
+        reasons = []
+        if total.percentile(99) > self.slo_p99:
+            reasons.append('p99')
+        if result['deferral_rate'] > self.max_deferral_rate:
+            reasons.append('deferrals')
+        if result['connection_error_rate'] > self.max_error_rate:
+            reasons.append('connection_errors')
+        if result['achieved_rate'] < rate * 0.95:
+            reasons.append('throughput')
+        result['passed'] = not reasons
+        result['reasons'] = reasons
+        # Slow only because messages waited for a free session rather than for the server
+        result['session_bound'] = bool(reasons) and not (set(reasons) - {'p99', 'throughput'}) and \
+            lag.percentile(99) > total.percentile(99) / 2
+        return result
+
+    def stop(self):
+        """Finish the current step and stop searching"""
+        self._stopped = True
+        if self._generator:
+            self._generator.stop()
+
+    def run(self):
+        """
+        Search for the knee
+
+        Returns:
+            dict: 'knee' (the best passing step, or None), 'limit' (the lowest
+            failing rate above it), 'converged' and every step in 'steps'
+        """
+        rate = self.start_rate
+        step = self.step
+        sessions = self.sessions
+        best = None
+        lowest_failing = None
+        steps = []
+        converged = False
+
+        while len(steps) < self.max_steps and not self._stopped:
+            result = self._run_step(rate, sessions)
+            steps.append(result)
+            logger.info(f"Capacity step {len(steps)}: {result['rate']} msg/s target, "
+                        f"{result['achieved_rate']} achieved with {sessions} sessions, "
+                        f"p99 {result['p99_ms']} ms, {'pass' if result['passed'] else 'fail'}")
+            if self.on_step:
+                self.on_step(result)
+
+            if result['passed']:
+                if best is None or rate > best['rate']:
+                    best = result
+                rate += step
+                if lowest_failing is not None and rate >= lowest_failing:
+                    step /= 2
+                    rate = best['rate'] + step
+            elif result['session_bound'] and sessions < self.max_sessions:
+                sessions = min(self.max_sessions, sessions * 2)
+                continue
+            else:
+                if lowest_failing is None or rate < lowest_failing:
+                    lowest_failing = rate
+                step /= 2
+                rate = max(rate * self.decrease, best['rate'] + step if best else 0.1)
+
+            if best and lowest_failing and lowest_failing - best['rate'] <= best['rate'] * self.tolerance:
+                converged = True
+                break
+
+        return {
+            'slo': {'p99_ms': self.slo_p99 * 1000, 'max_deferral_rate': self.max_deferral_rate,
+                    'max_connection_error_rate': self.max_error_rate},
+            'knee': best,
+            'limit': round(lowest_failing, 2) if lowest_failing else None,
+            'converged': converged,
+            'steps': steps
+        }
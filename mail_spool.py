@@ -0,0 +1,438 @@
+import json
+import logging
+import os
+import random
+import smtplib
+import tempfile
+import threading
+import time
+import uuid
+from email.parser import BytesHeaderParser
+
+from smtp_tool import SMTPSession, get_reply_code, is_transient_error
+
+logger = logging.getLogger(__name__)
+
+# Connection settings stored with each entry, as accepted by SMTPSession; the
+# password is never written to the spool
+CONNECTION_KEYS = ('server', 'port', 'use_tls', 'use_ssl', 'username', 'hostname', 'no_tls_verify')
+# Settings read from the saved profile at each attempt, so edits and rotated passwords apply
+PROFILE_KEYS = ('server', 'port', 'use_tls', 'use_ssl', 'username', 'password')
+
+
+def _parse_name(name):
+    """Split a queue file name '<due ms>-<created ms>-<random>' into (due, created, id)"""
+    due, created, suffix = name.split('-', 2)
+    return int(due) / 1000, int(created) / 1000, f'{created}-{suffix}'
+
+
+class MailSpool:
+    """Maildir-like spool of messages waiting to be retried
+
+    Entries move between directories by atomic rename: ``tmp`` while being
+    written, ``queue`` while waiting, ``active`` while a delivery worker holds
+    them and ``failed`` once retries are exhausted. Queue file names start
+    with the next attempt time, so workers find due entries from a directory
+    listing alone. Each file holds one JSON line with the envelope, the
+    profile name, the connection settings other than the password and the
+    retry state, followed by the message bytes exactly as first sent. Retries back off exponentially with random jitter so that
+    entries deferred together do not retry in lockstep.
+    """
+
+    def __init__(self, directory, base_delay=60, max_delay=3600, jitter=0.25, max_attempts=10,
+                 max_age=5 * 24 * 3600, on_result=None, get_profile=None):
+        """
+        Initialize the spool
+
+        Args:
+            directory (str): Spool directory
+            base_delay (float, optional): Seconds before the first retry
+            max_delay (float, optional): Longest delay between retries
+            jitter (float, optional): Fraction by which each delay is randomly varied
+            max_attempts (int, optional): Attempts before an entry is moved to failed
+            max_age (float, optional): Seconds after which an entry is no longer retried
+            on_result (callable, optional): Called with (entry, status, error) after each
+                delivery attempt; status is 'delivered', 'deferred' or 'failed'
+            get_profile (callable, optional): Returns the saved profile dict for a name,
+                or None; required to deliver entries queued with a profile
+        """
+        self.directory = directory
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.jitter = jitter
+        self.max_attempts = max_attempts
+        self.max_age = max_age
+        self.on_result = on_result
+        self.get_profile = get_profile
+        self._dirs = {state: os.path.join(directory, state) for state in ('tmp', 'queue', 'active', 'failed')}
+        for path in self._dirs.values():
+            os.makedirs(path, exist_ok=True)
+        self._stop = threading.Event()
+        self._threads = []
+
+    def retry_delay(self, attempts):
+        """
+        Seconds to wait after a given number of failed attempts
+
+        Args:
+            attempts (int): Attempts made so far
+
+        Returns:
+            float: Delay with jitter applied
+        """
+        delay = min(self.max_delay, self.base_delay * 2 ** max(0, attempts - 1))
+        return delay * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def _write(self, entry, message, state, name):
+        """Write an entry to tmp and rename it into place"""
+        fd, temp_path = tempfile.mkstemp(dir=self._dirs['tmp'])
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(json.dumps(entry).encode('utf-8') + b'\n')
+                f.write(message)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, os.path.join(self._dirs[state], name))
+        except Exception:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+    @staticmethod
+    def _read(path, headers_only=False):
+        with open(path, 'rb') as f:
+            entry = json.loads(f.readline())
+            return entry, None if headers_only else f.read()
+
+    def enqueue(self, message, sender, recipients, connection, profile=None, mail_options=None, error=None,
+                code=None, attempts=1):
+        """
+        Queue a message for redelivery
+
+        Args:
+            message (bytes): Serialized message exactly as it was sent
+            sender (str): Envelope sender
+            recipients (list): Envelope recipients still to deliver to
+            connection (dict): Server settings (server, port, use_tls, use_ssl, username,
+                password, hostname, no_tls_verify); the password is not stored
+            profile (str, optional): Saved profile to take the server settings and password
+                from at each attempt; required when the connection has a password
+            mail_options (list, optional): ESMTP options for MAIL FROM
+            error (str, optional): Error from the failed attempt
+            code (int, optional): Reply code from the failed attempt
+            attempts (int, optional): Attempts already made
+
+        Returns:
+            str: Spool entry ID
+
+        Raises:
+            ValueError: If the connection has a password but no profile is given
+        """
+        if connection.get('password') and not profile:
+            raise ValueError("Only sends from a saved profile can be queued when they authenticate")
+        now = time.time()
+        created = int(now * 1000)
+        entry_id = f'{created}-{uuid.uuid4().hex[:8]}'
+        headers = BytesHeaderParser().parsebytes(message)
+        entry = {
+            'id': entry_id,
+            'sender': sender,
+            'recipients': list(recipients),
+            'mail_options': list(mail_options or []),
+            'profile': profile,
+            'connection': {key: connection.get(key) for key in CONNECTION_KEYS},
+            'subject': str(headers.get('Subject', '')),
+            'message_id': str(headers.get('Message-ID', '')),
+            'size': len(message),
+            'created': now,
+            'attempts': attempts,
+            'last_error': error,
+            'last_code': code
+        }
+        due = now + self.retry_delay(attempts)
+        self._write(entry, message, 'queue', f'{int(due * 1000):013d}-{entry_id}')
+        logger.info(f"Queued {entry_id} for {len(recipients)} recipients, retry in {due - now:.0f}s: {error}")
+        return entry_id
+
+    def claim(self, force=False):
+        """
+        Take the next due entry for delivery
+
+        Args:
+            force (bool, optional): Take entries that are not due yet as well
+
+        Returns:
+            str: Path of the claimed entry in active, or None if nothing is due
+        """
+        now = time.time()
+        for name in sorted(os.listdir(self._dirs['queue'])):
+            if _parse_name(name)[0] > now and not force:
+                break
+            path = self._claim(name)
+            if path:
+                return path
+        return None
+
+    def _claim(self, name):
+        target = os.path.join(self._dirs['active'], name)
+        try:
+            os.rename(os.path.join(self._dirs['queue'], name), target)
+        except FileNotFoundError:
+            # Another worker claimed it first
+            return None
+        os.utime(target)
+        return target
+
+    def deliver(self, path):
+        """
+        Attempt delivery of a claimed entry
+
+        Accepted recipients are done; recipients deferred with 4xx replies
+        and transient connection errors are retried later, anything else
+        moves the entry to failed.
+
+        Args:
+            path (str): Path returned by claim()
+
+        Returns:
+            str: 'delivered', 'deferred' or 'failed'
+        """
+        entry, message = self._read(path)
+        entry['attempts'] += 1
+        entry['last_attempt'] = time.time()
+        connection = dict(entry['connection'])
+        if entry.get('profile'):
+            profile = self.get_profile(entry['profile']) if self.get_profile else None
+            if not profile:
+                return self._fail(path, entry, message, f"Profile '{entry['profile']}' not found", None)
+            connection.update({key: profile.get(key) for key in PROFILE_KEYS})
+        try:
+            with SMTPSession(timeout=60, max_messages=1, **connection) as session:
+                reply = session.send(entry['sender'], entry['recipients'], message, entry['mail_options'])
+            deferred = {recipient: refusal for recipient, refusal in reply['refused'].items()
+                        if 400 <= refusal[0] < 500}
+            if not deferred:
+                os.remove(path)
+                logger.info(f"Delivered spooled {entry['id']} to {connection['server']} "
+                            f"after {entry['attempts']} attempts")
+                return self._report(entry, 'delivered', None)
+            entry['recipients'] = list(deferred)
+            code, text = next(iter(deferred.values()))
+            if isinstance(text, bytes):
+                text = text.decode('utf-8', errors='replace')
+            error = f"{len(deferred)} recipients deferred: {code} {text}"
+            return self._retry(path, entry, message, error, code)
+        except Exception as e:
+            code = get_reply_code(e)
+            if not is_transient_error(e):
+                return self._fail(path, entry, message, str(e), code)
+            if isinstance(e, smtplib.SMTPRecipientsRefused):
+                entry['recipients'] = [recipient for recipient, refusal in e.recipients.items()
+                                       if 400 <= refusal[0] < 500]
+            return self._retry(path, entry, message, str(e) or type(e).__name__, code)
+
+    def _retry(self, path, entry, message, error, code):
+        entry['last_error'] = error
+        entry['last_code'] = code
+        now = time.time()
+        if entry['attempts'] >= self.max_attempts or now - entry['created'] >= self.max_age:
+            return self._fail(path, entry, message, f"Gave up after {entry['attempts']} attempts: {error}", code)
+        due = now + self.retry_delay(entry['attempts'])
+        self._write(entry, message, 'queue', f"{int(due * 1000):013d}-{entry['id']}")
+        os.remove(path)
+        logger.info(f"Spooled {entry['id']} deferred again (attempt {entry['attempts']}), retry in {due - now:.0f}s: {error}")
+        return self._report(entry, 'deferred', error)
+
+    def _fail(self, path, entry, message, error, code):
+        entry['last_error'] = error
+        entry['last_code'] = code
+        self._write(entry, message, 'failed', entry['id'])
+        os.remove(path)
+        logger.error(f"Spooled {entry['id']} failed: {error}")
+        return self._report(entry, 'failed', error)
+
+    def _report(self, entry, status, error):
+        if self.on_result:
+            try:
+                self.on_result(entry, status, error)
+            except Exception as e:
+                logger.warning(f"Spool result callback failed: {str(e)}")
+        return status
+
+    def recover(self, stale_after=600):
+        """
+        Return entries left in active by a crashed worker to the queue
+
+        Args:
+            stale_after (float, optional): Seconds since claiming before an entry counts as abandoned
+
+        Returns:
+            int: Number of entries recovered
+        """
+        recovered = 0
+        now = time.time()
+        for name in os.listdir(self._dirs['active']):
+            path = os.path.join(self._dirs['active'], name)
+            try:
+                if now - os.path.getmtime(path) >= stale_after:
+                    os.rename(path, os.path.join(self._dirs['queue'], name))
+                    recovered += 1
+            except FileNotFoundError:
+                continue
+        if recovered:
+            logger.info(f"Recovered {recovered} abandoned spool entries")
+        return recovered
+
+    def _find(self, entry_id):
+        for state in ('queue', 'active', 'failed'):
+            for name in os.listdir(self._dirs[state]):
+                if name == entry_id or name.endswith(f'-{entry_id}'):
+                    return state, name
+        return None, None
+
+    def retry_now(self, entry_id):
+        """
+        Make a waiting or failed entry due immediately
+
+        Args:
+            entry_id (str): Spool entry ID
+
+        Returns:
+            bool: True if the entry was found
+        """
+        state, name = self._find(entry_id)
+        if state not in ('queue', 'failed'):
+            return False
+        target = os.path.join(self._dirs['queue'], f'{0:013d}-{entry_id}')
+        try:
+            os.rename(os.path.join(self._dirs[state], name), target)
+        except FileNotFoundError:
+            return False
+        return True
+
+    def delete(self, entry_id):
+        """
+        Remove a waiting or failed entry
+
+        Args:
+            entry_id (str): Spool entry ID
+
+        Returns:
+            bool: True if the entry was removed
+        """
+        state, name = self._find(entry_id)
+        if state not in ('queue', 'failed'):
+            return False
+        try:
+            os.remove(os.path.join(self._dirs[state], name))
+        except FileNotFoundError:
+            return False
+        return True
+
+    def list(self, include_failed=True):
+        """
+        List spool entries without their message bodies
+
+        Args:
+            include_failed (bool, optional): Include entries that gave up
+
+        Returns:
+            list: Entry dicts with 'state', 'age_seconds' and, when waiting, 'due_in_seconds'
+        """
+        now = time.time()
+        entries = []
+        for state in ('active', 'queue') + (('failed',) if include_failed else ()):
+            for name in sorted(os.listdir(self._dirs[state])):
+                try:
+                    entry, _ = self._read(os.path.join(self._dirs[state], name), headers_only=True)
+                except (FileNotFoundError, ValueError):
+                    continue
+                connection = entry.pop('connection')
+                entry['server'] = f"{connection['server']}:{connection['port']}"
+                entry['state'] = state
+                entry['age_seconds'] = round(now - entry['created'], 1)
+                if state == 'queue':
+                    entry['due_in_seconds'] = round(max(0, _parse_name(name)[0] - now), 1)
+                entries.append(entry)
+        return entries
+
+    def stats(self):
+        """
+        Get queue depth and age from the directory listings alone
+
+        Returns:
+            dict: Counts per state, entries due now and the oldest waiting entry's age
+        """
+        now = time.time()
+        queued = os.listdir(self._dirs['queue'])
+        active = os.listdir(self._dirs['active'])
+        times = [_parse_name(name) for name in queued + active]
+        return {
+            'queued': len(queued),
+            'active': len(active),
+            'failed': len(os.listdir(self._dirs['failed'])),
+            'due': sum(1 for name in queued if _parse_name(name)[0] <= now),
+            'oldest_age_seconds': round(now - min(created for _, created, _ in times), 1) if times else 0,
+            'next_due_seconds': round(max(0, min(_parse_name(name)[0] for name in queued) - now), 1) if queued else None
+        }
+
+    def flush(self, force=False):
+        """
+        Deliver every due entry once in the calling thread
+
+        Args:
+            force (bool, optional): Also attempt entries that are not due yet
+
+        Returns:
+            dict: Number of entries per outcome
+        """
+        counts = {'delivered': 0, 'deferred': 0, 'failed': 0}
+        now = time.time()
+        # Work from one listing so entries deferred again are not retried in the same pass
+        for name in sorted(os.listdir(self._dirs['queue'])):
+            if _parse_name(name)[0] > now and not force:
+                break
+            path = self._claim(name)
+            if path:
+                counts[self.deliver(path)] += 1
+        return counts
+
+    def _work(self, poll_interval):
+        while not self._stop.is_set():
+            try:
+                path = self.claim()
+            except OSError as e:
+                logger.error(f"Spool worker cannot read the queue: {str(e)}")
+                path = None
+            if path is None:
+                self._stop.wait(poll_interval)
+                continue
+            try:
+                self.deliver(path)
+            except Exception as e:
+                logger.error(f"Spool delivery of {path} failed unexpectedly: {str(e)}")
+
+    def start(self, workers=2, poll_interval=1.0):
+        """
+        Start delivery worker threads
+
+        Args:
+            workers (int, optional): Concurrent deliveries
+            poll_interval (float, optional): Seconds between checks when nothing is due
+        """
+        if self._threads:
+            return
+        self.recover()
+        self._stop.clear()
+        self._threads = [threading.Thread(target=self._work, args=(poll_interval,), name=f'spool-{i}', daemon=True)
+                         for i in range(max(1, workers))]
+        for thread in self._threads:
+            thread.start()
+        logger.info(f"Spool {self.directory} started with {len(self._threads)} delivery workers")
+
+    def stop(self):
+        """Stop the delivery workers after their current attempt"""
+        self._stop.set()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
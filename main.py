@@ -1,4 +1,11 @@
-from app import app
+import os
+
+from app import app, start_spool
+
+# Start spool delivery in the process that serves requests: gunicorn imports this
+# module in each worker, the debug reloader runs it again in its child process
+if __name__ != "__main__" or os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+    start_spool()
 
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=5000, debug=True)
@@ -0,0 +1,205 @@
+import gzip
+import hashlib
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+from email.parser import BytesHeaderParser
+from email.utils import make_msgid
+
+logger = logging.getLogger(__name__)
+
+# Matches the Message-ID header line, including folded continuation lines
+MESSAGE_ID_HEADER = re.compile(rb'^Message-ID:[^\r\n]*(?:\r?\n[ \t][^\r\n]*)*', re.IGNORECASE | re.MULTILINE)
+
+
+def normalize_message_id(message_id):
+    """
+    Normalize a Message-ID for lookups
+
+    Args:
+        message_id (str): Message-ID with or without angle brackets
+
+    Returns:
+        str: Message-ID in angle brackets with surrounding whitespace removed
+    """
+    message_id = message_id.strip()
+    if not message_id.startswith('<'):
+        message_id = f'<{message_id}>'
+    return message_id
+
+
+def _header_end(message):
+    """Offset where the header section of a serialized message ends"""
+    match = re.search(rb'\r?\n\r?\n', message)
+    return match.start() if match else len(message)
+
+
+def replace_message_id(message, message_id=None, domain=None):
+    """
+    Give a serialized message a new Message-ID without touching anything else
+
+    Args:
+        message (bytes): Serialized message
+        message_id (str, optional): Message-ID to use, generated when omitted
+        domain (str, optional): Domain for a generated Message-ID
+
+    Returns:
+        tuple: (message bytes, new Message-ID)
+    """
+    message_id = normalize_message_id(message_id) if message_id else make_msgid(domain=domain)
+    end = _header_end(message)
+    header = f'Message-ID: {message_id}'.encode('ascii')
+    headers, count = MESSAGE_ID_HEADER.subn(lambda match: header, message[:end], count=1)
+    if not count:
+        newline = b'\r\n' if b'\r\n' in message[:end + 2] else b'\n'
+        headers = header + newline + headers
+    return headers + message[end:], message_id
+
+
+class MessageArchive:
+    """Compressed, deduplicated store of sent messages keyed by Message-ID
+
+    Each distinct serialized message is written once as a gzip file named by
+    the SHA-256 of its bytes, so resending identical content costs nothing.
+    An append-only JSON-lines index maps Message-IDs to content hashes; it
+    is loaded lazily and kept in memory for lookups.
+    """
+
+    def __init__(self, directory):
+        """
+        Initialize the archive
+
+        Args:
+            directory (str): Directory holding the objects and the index
+        """
+        self.directory = directory
+        self.objects_dir = os.path.join(directory, 'objects')
+        self.index_file = os.path.join(directory, 'index.jsonl')
+        self._index = None
+        self._lock = threading.Lock()
+        os.makedirs(self.objects_dir, exist_ok=True)
+
+    def _object_path(self, digest):
+        return os.path.join(self.objects_dir, digest[:2], f'{digest}.eml.gz')
+
+    def _load_index(self):
+        if self._index is not None:
+            return self._index
+        index = {}
+        try:
+            with open(self.index_file, 'r') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # A torn last line from an interrupted write
+                        continue
+                    index[entry['message_id']] = entry
+        except FileNotFoundError:
+            pass
+        self._index = index
+        return index
+
+    def store(self, message, message_id=None):
+        """
+        Archive a serialized message
+
+        Args:
+            message (bytes): Message exactly as sent
+            message_id (str, optional): Message-ID, read from the headers when omitted
+
+        Returns:
+            str: Message-ID the message was stored under, or None if it has none
+        """
+        if not message_id:
+            message_id = BytesHeaderParser().parsebytes(message).get('Message-ID')
+            if not message_id:
+                logger.warning("Not archiving message without a Message-ID")
+                return None
+        message_id = normalize_message_id(str(message_id))
+        digest = hashlib.sha256(message).hexdigest()
+        path = self._object_path(digest)
+
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    with gzip.GzipFile(fileobj=f, mode='wb', compresslevel=6, mtime=0) as gz:
+                        gz.write(message)
+                os.replace(temp_path, path)
+            except Exception:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+                raise
+
+        entry = {'message_id': message_id, 'sha256': digest, 'size': len(message),
+                 'archived': time.strftime('%Y-%m-%d %H:%M:%S')}
+        with self._lock:
+            index = self._load_index()
+            if index.get(message_id, {}).get('sha256') != digest:
+                with open(self.index_file, 'a') as f:
+                    f.write(json.dumps(entry) + '\n')
+                index[message_id] = entry
+        return message_id
+
+    def get(self, message_id):
+        """
+        Read an archived message
+
+        Args:
+            message_id (str): Message-ID with or without angle brackets
+
+        Returns:
+            bytes: The message exactly as sent, or None if it is not archived
+        """
+        with self._lock:
+            entry = self._load_index().get(normalize_message_id(message_id))
+        if not entry:
+            return None
+        try:
+            with gzip.open(self._object_path(entry['sha256']), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            logger.error(f"Archived object for {message_id} is missing")
+            return None
+
+    def __contains__(self, message_id):
+        with self._lock:
+            return normalize_message_id(message_id) in self._load_index()
+
+    def list(self):
+        """
+        List archived messages
+
+        Returns:
+            list: Index entries, oldest first
+        """
+        with self._lock:
+            return list(self._load_index().values())
+
+    def stats(self):
+        """
+        Get archive size and deduplication savings
+
+        Returns:
+            dict: Message and object counts, original and stored bytes
+        """
+        entries = self.list()
+        objects = {entry['sha256']: entry['size'] for entry in entries}
+        stored = 0
+        for digest in objects:
+            try:
+                stored += os.path.getsize(self._object_path(digest))
+            except OSError:
+                pass
+        return {
+            'messages': len(entries),
+            'objects': len(objects),
+            'original_bytes': sum(entry['size'] for entry in entries),
+            'stored_bytes': stored
+        }
@@ -0,0 +1,136 @@
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+
+from transfer_encoding import serialize_message
+
+logger = logging.getLogger(__name__)
+
+
+class SharedMessage:
+    """Serialized message held in a shared memory block
+
+    ``data`` is a memoryview over the block, so the bytes built in a worker
+    process are sent without being pickled or copied. Release the message
+    (or use it as a context manager) once it has been sent; the block is
+    unlinked then.
+    """
+
+    def __init__(self, name, size, message_id):
+        """
+        Attach to a block created by a build worker
+
+        Args:
+            name (str): Shared memory block name
+            size (int): Message length in bytes; the block may be larger
+            message_id (str): Message-ID header of the message
+        """
+        self.message_id = message_id
+        self.size = size
+        self._shm = SharedMemory(name=name)
+        self.data = self._shm.buf[:size]
+
+    def release(self):
+        """Drop the view and free the shared memory block"""
+        if self._shm is None:
+            return
+        self.data.release()
+        self._shm.close()
+        self._shm.unlink()
+        self._shm = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+
+
+def _build_shared(sender, recipients, subject, body, body_type, attachments, hostname):
+    """Worker process entry point: build, serialize and place a message in shared memory"""
+    from smtp_tool import SMTPTool
+
+    msg = SMTPTool().build_message(sender, recipients, subject=subject, body=body, body_type=body_type,
+                                   attachments=attachments, hostname=hostname)
+    # The block is sent as is, so it must already have CRLF line endings
+    data = serialize_message(msg)
+    shm = SharedMemory(create=True, size=max(1, len(data)))
+    try:
+        shm.buf[:len(data)] = data
+    except Exception:
+        shm.close()
+        shm.unlink()
+        raise
+    shm.close()
+    return shm.name, len(data), msg['Message-ID']
+
+
+class MessageBuildPool:
+    """Process pool that builds and serializes messages off the main process
+
+    Reading attachments, base64 encoding and serialization are CPU-bound and
+    hold the GIL, so threads sending through many sessions would otherwise
+    queue behind each other. Each worker process writes the finished message
+    into a shared memory block and only its name, size and Message-ID come
+    back through the pool.
+    """
+
+    def __init__(self, processes=None):
+        """
+        Initialize the pool
+
+        Args:
+            processes (int, optional): Worker processes, default one per CPU
+        """
+        self.processes = max(1, int(processes or os.cpu_count() or 1))
+        self._executor = None
+
+    def start(self):
+        """Fork the worker processes; call before starting sender threads"""
+        if self._executor is not None:
+            return self
+        # Workers must share the parent's tracker so blocks they create are freed with unlink()
+        resource_tracker.ensure_running()
+        self._executor = ProcessPoolExecutor(max_workers=self.processes,
+                                             mp_context=multiprocessing.get_context('fork'))
+        # Forking happens on first submit; do it now, before other threads exist
+        self._executor.submit(os.getpid).result()
+        logger.debug(f"Message build pool started with {self.processes} processes")
+        return self
+
+    def build(self, sender, recipients, subject='', body='', body_type='plain', attachments=None,
+              hostname=None):
+        """
+        Build a message in a worker process and wait for it
+
+        Args:
+            sender (str): Email sender address
+            recipients (list): List of recipient email addresses
+            subject (str, optional): Email subject
+            body (str, optional): Email body
+            body_type (str, optional): Email body type ('plain' or 'html')
+            attachments (list, optional): Attachment file paths, read by the worker
+            hostname (str, optional): Domain used for the Message-ID
+
+        Returns:
+            SharedMessage: The serialized message; release it after sending
+        """
+        self.start()
+        future = self._executor.submit(_build_shared, sender, list(recipients), subject, body,
+                                       body_type, list(attachments or []), hostname)
+        return SharedMessage(*future.result())
+
+    def close(self):
+        """Shut down the worker processes"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
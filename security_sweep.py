@@ -0,0 +1,250 @@
+import logging
+import smtplib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from smtp_tool import SMTPSession, SMTPTool, get_reply_code
+from transfer_encoding import serialize_message
+
+logger = logging.getLogger(__name__)
+
+EICAR_BODY = """This email contains the EICAR antivirus test file as an attachment.
+
+The EICAR test file is a standard test file developed by the European Institute for Computer Antivirus Research to safely test antivirus software without using actual malware.
+
+When this email is delivered, most antivirus systems should detect the attachment as a threat, even though it's completely harmless.
+
+Note: Your email system or antivirus might block this email entirely."""
+
+# Special test emails, in sweep order; 'spf' is built by SMTPTool.create_spf_test_email
+SPECIAL_TESTS = {
+    'pdf': {
+        'subject': 'PDF Attachment Test',
+        'body': 'This email contains a standard PDF attachment generated for testing purposes.',
+        'special_attachment': {'type': 'pdf', 'malformed': False, 'active_content': False}
+    },
+    'pdf-malformed': {
+        'subject': 'Malformed PDF Test',
+        'body': 'This email contains a malformed PDF attachment intended for testing how systems handle invalid PDFs.',
+        'special_attachment': {'type': 'pdf', 'malformed': True, 'active_content': False}
+    },
+    'pdf-active': {
+        'subject': 'PDF with Active Content Test',
+        'body': 'This email contains a PDF with simulated active content (JavaScript) for testing security policies.',
+        'special_attachment': {'type': 'pdf', 'malformed': False, 'active_content': True}
+    },
+    'eicar': {
+        'subject': 'EICAR Antivirus Test File',
+        'body': EICAR_BODY,
+        'special_attachment': {'type': 'eicar'}
+    },
+    'spf': None
+}
+
+
+def special_test_data(tool, test_type, sender, recipient):
+    """
+    Describe one special test email the way the send form submits it
+
+    Args:
+        tool (SMTPTool): Tool that creates the SPF test data
+        test_type (str): Key of SPECIAL_TESTS
+        sender (str): Sender for tests that do not set their own
+        recipient (str): Recipient email address
+
+    Returns:
+        dict: sender, recipients, subject, body, body_type and either a
+        'special_attachment' spec or 'custom_headers'
+
+    Raises:
+        ValueError: If the test type is unknown
+    """
+    if test_type not in SPECIAL_TESTS:
+        raise ValueError(f'Unknown test type: {test_type}')
+    test_data = {
+        'sender': sender,
+        'recipients': [recipient],
+        'cc': [],
+        'bcc': [],
+        'body_type': 'plain'
+    }
+    if test_type == 'spf':
+        test_data.update(tool.create_spf_test_email(recipient))
+    else:
+        test_data.update(SPECIAL_TESTS[test_type])
+    return test_data
+
+
+def create_special_attachment(tool, spec):
+    """
+    Create the attachment described by a 'special_attachment' spec
+
+    Args:
+        tool (SMTPTool): Tool that creates the attachment
+        spec (dict): 'type' ('pdf' or 'eicar'), and 'malformed' and
+            'active_content' for PDFs
+
+    Returns:
+        tuple: (filename, attachment_data), or None for an unknown type
+    """
+    if spec.get('type') == 'pdf':
+        return tool.create_pdf_attachment(malformed=spec.get('malformed', False),
+                                          active_content=spec.get('active_content', False))
+    if spec.get('type') == 'eicar':
+        return tool.create_eicar_attachment()
+    return None
+
+
+def build_special_test(tool, test_type, sender, recipients, hostname=None):
+    """
+    Build and serialize one special test email
+
+    Args:
+        tool (SMTPTool): Tool that builds the message
+        test_type (str): Key of SPECIAL_TESTS
+        sender (str): Sender for tests that do not set their own
+        recipients (list): Recipient email addresses
+        hostname (str, optional): Domain used for the Message-ID
+
+    Returns:
+        dict: 'test', envelope 'sender', 'subject', 'message_id' and the
+        serialized 'message' bytes
+    """
+    test_data = special_test_data(tool, test_type, sender, recipients[0])
+    msg = tool.build_message(test_data['sender'], recipients, subject=test_data['subject'],
+                             body=test_data['body'], body_type=test_data['body_type'],
+                             custom_headers=test_data.get('custom_headers'), hostname=hostname)
+    if test_data.get('special_attachment'):
+        attachment = create_special_attachment(tool, test_data['special_attachment'])
+        if attachment:
+            tool.attach_data(msg, *attachment)
+    return {
+        'test': test_type,
+        'sender': test_data['sender'],
+        'subject': test_data['subject'],
+        'message_id': msg['Message-ID'],
+        'message': serialize_message(msg)
+    }
+
+
+def _outcome(code):
+    if code is None:
+        return 'error'
+    return 'deferred' if 400 <= code < 500 else 'rejected'
+
+
+def run_sweep(targets, sender, recipients, tests=None, expect_reject=(), concurrency=4, hostname=None,
+              timeout=60, tool=None, on_result=None):
+    """
+    Send every special test email through every target in parallel
+
+    Each message is built once and the same bytes are sent to all targets.
+    Worker threads keep one session per target, so a target's connection is
+    reused for the tests that worker sends there.
+
+    A test passes when the target accepts it, or, for tests listed in
+    ``expect_reject``, when the target rejects it with a 5xx reply.
+
+    Args:
+        targets (list): (name, profile) pairs of the relays to test
+        sender (str): Sender for tests that do not set their own
+        recipients (list): Recipient email addresses
+        tests (list, optional): Keys of SPECIAL_TESTS, default all
+        expect_reject (list, optional): Tests the relays should refuse
+        concurrency (int, optional): Parallel SMTP sessions across all targets
+        hostname (str, optional): Hostname for EHLO and the Message-IDs
+        timeout (float, optional): Socket timeout in seconds
+        tool (SMTPTool, optional): Tool that builds the messages
+        on_result (callable, optional): Called with each result as it completes
+
+    Returns:
+        dict: 'success', 'results' with one row per target and test,
+        'summary' with pass/fail counts and latency per target and per test,
+        and 'elapsed_seconds'
+    """
+    tool = tool or SMTPTool()
+    tests = list(tests or SPECIAL_TESTS)
+    unknown = [test for test in tests if test not in SPECIAL_TESTS]
+    if unknown:
+        raise ValueError(f"Unknown test types: {', '.join(unknown)}")
+    expect_reject = set(expect_reject or ())
+
+    messages = {test: build_special_test(tool, test, sender, recipients, hostname=hostname) for test in tests}
+    # Interleave targets so every relay is busy from the start
+    probes = [(name, profile, test) for test in tests for name, profile in targets]
+
+    local = threading.local()
+    sessions = []
+    lock = threading.Lock()
+
+    def session_for(name, profile):
+        if not hasattr(local, 'sessions'):
+            local.sessions = {}
+        if name not in local.sessions:
+            session = SMTPSession.from_profile(profile, hostname=hostname, timeout=timeout)
+            local.sessions[name] = session
+            with lock:
+                sessions.append(session)
+        return local.sessions[name]
+
+    def run(probe):
+        name, profile, test = probe
+        built = messages[test]
+        session = session_for(name, profile)
+        expected = 'rejected' if test in expect_reject else 'accepted'
+        row = {'target': name, 'server': f"{profile['server']}:{profile['port']}", 'test': test,
+               'subject': built['subject'], 'expected': expected}
+        started = time.perf_counter()
+        try:
+            result = session.send(built['sender'], recipients, built['message'])
+            row.update(outcome='accepted', code=result['code'], reply=result['reply'])
+            if result['refused']:
+                row['refused'] = {address: code for address, (code, _) in result['refused'].items()}
+        except Exception as e:
+            code = get_reply_code(e)
+            reply = getattr(e, 'smtp_error', None)
+            if isinstance(reply, bytes):
+                reply = reply.decode('utf-8', errors='replace')
+            row.update(outcome=_outcome(code), code=code, error=reply or str(e) or type(e).__name__)
+            if not isinstance(e, (smtplib.SMTPResponseException, smtplib.SMTPRecipientsRefused)):
+                session.close()
+        row['latency_ms'] = round((time.perf_counter() - started) * 1000, 3)
+        row['passed'] = row['outcome'] == expected
+        if on_result:
+            on_result(row)
+        return row
+
+    started = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(probes) or 1))) as executor:
+            results = list(executor.map(run, probes))
+    finally:
+        for session in sessions:
+            session.close()
+    elapsed = time.perf_counter() - started
+
+    summary = {'targets': {}, 'tests': {}}
+    for row in results:
+        for group, key in (('targets', row['target']), ('tests', row['test'])):
+            cell = summary[group].setdefault(key, {'passed': 0, 'failed': 0, 'outcomes': {}, 'latencies': []})
+            cell['passed' if row['passed'] else 'failed'] += 1
+            cell['outcomes'][row['outcome']] = cell['outcomes'].get(row['outcome'], 0) + 1
+            cell['latencies'].append(row['latency_ms'])
+    for group in summary.values():
+        for cell in group.values():
+            latencies = cell.pop('latencies')
+            cell['mean_ms'] = round(sum(latencies) / len(latencies), 3)
+            cell['max_ms'] = max(latencies)
+
+    passed = sum(1 for row in results if row['passed'])
+    logger.info(f"Security sweep of {len(targets)} targets finished: {passed}/{len(results)} passed "
+                f"in {elapsed:.2f}s")
+    return {
+        'success': passed == len(results),
+        'results': results,
+        'summary': summary,
+        'passed': passed,
+        'failed': len(results) - passed,
+        'elapsed_seconds': round(elapsed, 3)
+    }
@@ -0,0 +1,221 @@
+import logging
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# Maximum number of undelivered live events buffered per job
+EVENT_QUEUE_SIZE = 1000
+
+
+class SendJob:
+    """A unit of background work (an email send or connection test) and its outcome"""
+
+    def __init__(self, kind, description=''):
+        """
+        Initialize the job
+
+        Args:
+            kind (str): Type of job, e.g. 'send' or 'test_connection'
+            description (str, optional): Short human readable summary
+        """
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.description = description
+        self.status = 'queued'
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.result = None
+        self.transcript = []
+        self.outcomes = []
+        self.events = queue.Queue(maxsize=EVENT_QUEUE_SIZE)
+        self.dropped_events = 0
+
+    def publish(self, event):
+        """
+        Offer a live event (transcript line, phase timing, status) to subscribers
+
+        Events are buffered in a bounded queue. When nobody is consuming and the
+        queue is full the event is dropped rather than blocking the send; the full
+        transcript is still available from the job once it finishes.
+
+        Args:
+            event (dict): Event with at least a 'type' key
+        """
+        try:
+            self.events.put_nowait(event)
+        except queue.Full:
+            self.dropped_events += 1
+
+    def _publish_final(self, event):
+        """Publish an event that must not be lost, evicting the oldest if needed"""
+        while True:
+            try:
+                self.events.put_nowait(event)
+                return
+            except queue.Full:
+                try:
+                    self.events.get_nowait()
+                    self.dropped_events += 1
+                except queue.Empty:
+                    pass
+
+    @property
+    def done(self):
+        """bool: True once the job has completed or failed"""
+        return self.status in ('completed', 'failed')
+
+    def to_dict(self, include_transcript=False):
+        """
+        Serialize the job for the JSON API
+
+        Args:
+            include_transcript (bool, optional): Whether to include transcript lines
+
+        Returns:
+            dict: Job status, timings and result
+        """
+        data = {
+            'job_id': self.id,
+            'kind': self.kind,
+            'description': self.description,
+            'status': self.status,
+            'created': self.created,
+            'started': self.started,
+            'finished': self.finished,
+            'result': self.result
+        }
+        if self.started:
+            data['queue_seconds'] = round(self.started - self.created, 3)
+        if self.finished and self.started:
+            data['run_seconds'] = round(self.finished - self.started, 3)
+        if self.outcomes:
+            data['outcome_count'] = len(self.outcomes)
+        if self.dropped_events:
+            data['dropped_events'] = self.dropped_events
+        if include_transcript:
+            data['transcript'] = list(self.transcript)
+        return data
+
+
+class SendJobQueue:
+    """Bounded worker pool that runs sends outside of the HTTP request"""
+
+    def __init__(self, max_workers=4, max_pending=100, retention=3600, max_jobs=1000):
+        """
+        Initialize the job queue
+
+        Args:
+            max_workers (int): Number of concurrent worker threads
+            max_pending (int): Number of jobs allowed to wait for a worker
+            retention (float): Seconds a finished job is kept for status queries
+            max_jobs (int): Maximum number of finished jobs kept in memory
+        """
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.retention = retention
+        self.max_jobs = max_jobs
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='send-job')
+        self._slots = threading.BoundedSemaphore(max_workers + max_pending)
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, func, kind='send', description='', **kwargs):
+        """
+        Queue a function to run on the worker pool
+
+        The function is called as ``func(job, **kwargs)`` and its return value is
+        stored as the job result.
+
+        Args:
+            func (callable): Work to perform
+            kind (str, optional): Type of job
+            description (str, optional): Short human readable summary
+            **kwargs: Keyword arguments passed to func
+
+        Returns:
+            SendJob: The queued job, or None if the queue is full
+        """
+        if not self._slots.acquire(blocking=False):
+            logger.warning(f"Send queue full, rejecting {kind} job")
+            return None
+
+        job = SendJob(kind, description)
+        job.publish({'type': 'status', 'status': job.status})
+        with self._lock:
+            self._prune(time.time())
+            self._jobs[job.id] = job
+
+        try:
+            self._executor.submit(self._run, job, func, kwargs)
+        except Exception:
+            self._slots.release()
+            with self._lock:
+                self._jobs.pop(job.id, None)
+            raise
+        logger.info(f"Queued {kind} job {job.id}")
+        return job
+
+    def _run(self, job, func, kwargs):
+        """Execute a job on a worker thread and record its outcome"""
+        job.status = 'running'
+        job.started = time.time()
+        job.publish({'type': 'status', 'status': job.status})
+        try:
+            result = func(job, **kwargs)
+            status = 'completed'
+        except Exception as e:
+            logger.exception(f"Job {job.id} failed")
+            result = {'success': False, 'message': f'Job failed: {str(e)}'}
+            status = 'failed'
+        # Set the finish time before the status so a done job always has one
+        job.result = result
+        job.finished = time.time()
+        job.status = status
+        self._slots.release()
+        job._publish_final({'type': 'done', 'status': job.status, 'result': job.result})
+
+    def _prune(self, now):
+        """Drop finished jobs past their retention period or beyond the size limit"""
+        finished = [job_id for job_id, job in self._jobs.items() if job.done]
+        excess = len(finished) - self.max_jobs
+        for job_id in finished:
+            job = self._jobs[job_id]
+            if excess > 0 or now - job.finished > self.retention:
+                del self._jobs[job_id]
+                excess -= 1
+
+    def get(self, job_id):
+        """
+        Get a job by id
+
+        Args:
+            job_id (str): Job identifier
+
+        Returns:
+            SendJob: The job or None if unknown or expired
+        """
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def stats(self):
+        """
+        Get queue depth information
+
+        Returns:
+            dict: Counts of jobs by status and configured limits
+        """
+        with self._lock:
+            counts = {}
+            for job in self._jobs.values():
+                counts[job.status] = counts.get(job.status, 0) + 1
+        return {
+            'max_workers': self.max_workers,
+            'max_pending': self.max_pending,
+            'jobs': counts
+        }
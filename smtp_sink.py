@@ -0,0 +1,438 @@
+import asyncio
+import base64
+import logging
+import os
+import ssl
+import subprocess
+import tempfile
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Default maximum message size advertised with the SIZE extension
+DEFAULT_MAX_SIZE = 100 * 1024 * 1024
+
+# Longest command line accepted outside of message data
+MAX_COMMAND_LINE = 4096
+
+
+def generate_self_signed_cert(directory=None, hostname='localhost'):
+    """
+    Create a throwaway self-signed certificate with the openssl command
+
+    Args:
+        directory (str, optional): Where to write the files, defaults to a new temp dir
+        hostname (str, optional): Certificate common name
+
+    Returns:
+        tuple: (certfile, keyfile) paths
+
+    Raises:
+        RuntimeError: If openssl is missing or fails
+    """
+    directory = directory or tempfile.mkdtemp(prefix='smtp-sink-')
+    certfile = os.path.join(directory, 'sink-cert.pem')
+    keyfile = os.path.join(directory, 'sink-key.pem')
+    command = ['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '365',
+               '-keyout', keyfile, '-out', certfile, '-subj', f'/CN={hostname}']
+    try:
+        subprocess.run(command, check=True, capture_output=True, timeout=60)
+    except (OSError, subprocess.SubprocessError) as e:
+        raise RuntimeError(f"Could not generate a self-signed certificate with openssl: {str(e)}")
+    return certfile, keyfile
+
+
+class SinkStats:
+    """Counters kept by the sink; updated only from the event loop thread"""
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.connections = 0
+        self.active_connections = 0
+        self.tls_connections = 0
+        self.auth_successes = 0
+        self.auth_failures = 0
+        self.messages = 0
+        self.recipients = 0
+        self.bytes = 0
+        self.rejected = 0
+        self.commands = 0
+
+    def snapshot(self):
+        """
+        Get the counters with throughput since the sink started
+
+        Returns:
+            dict: Counters, elapsed seconds, messages/s and bytes/s
+        """
+        elapsed = time.monotonic() - self.started
+        data = {key: value for key, value in vars(self).items() if key != 'started'}
+        data['elapsed_seconds'] = round(elapsed, 3)
+        data['messages_per_second'] = round(self.messages / elapsed, 2) if elapsed > 0 else 0
+        data['bytes_per_second'] = round(self.bytes / elapsed, 1) if elapsed > 0 else 0
+        return data
+
+
+class SMTPSink:
+    """Asyncio SMTP server that accepts and discards mail
+
+    Supports EHLO/HELO, STARTTLS, implicit TLS, AUTH PLAIN/LOGIN, PIPELINING,
+    SIZE, 8BITMIME, SMTPUTF8 and CHUNKING (BDAT, including BINARYMIME). Message
+    data is counted and dropped, so the sink can absorb far more traffic than a
+    real relay and report server-side throughput for benchmarks.
+    """
+
+    def __init__(self, host='127.0.0.1', port=2525, ssl_port=None, certfile=None, keyfile=None,
+                 hostname='smtp-sink.local', max_size=DEFAULT_MAX_SIZE, credentials=None,
+                 require_auth=False, on_message=None, tls=True):
+        """
+        Initialize the sink
+
+        Args:
+            host (str, optional): Address to listen on
+            port (int, optional): Plain/STARTTLS port, 0 for an ephemeral port
+            ssl_port (int, optional): Implicit TLS port, None to disable
+            certfile (str, optional): TLS certificate; a self-signed one is generated if omitted
+            keyfile (str, optional): TLS private key
+            hostname (str, optional): Name used in the banner and EHLO reply
+            max_size (int, optional): Largest message accepted, advertised with SIZE
+            credentials (tuple, optional): (username, password) to require; any
+                credentials are accepted when None
+            require_auth (bool, optional): Refuse MAIL until the client authenticates
+            on_message (callable, optional): Called as on_message(sender, recipients, size)
+            tls (bool, optional): Offer STARTTLS and allow ssl_port
+        """
+        self.host = host
+        self.port = port
+        self.ssl_port = ssl_port
+        self.certfile = certfile
+        self.keyfile = keyfile
+        self.hostname = hostname
+        self.max_size = max_size
+        self.credentials = credentials
+        self.require_auth = require_auth
+        self.on_message = on_message
+        self.tls = tls
+        self.stats = SinkStats()
+        self.ssl_context = None
+        self._servers = []
+        self._loop = None
+        self._thread = None
+        self._ready = threading.Event()
+
+    def _create_ssl_context(self):
+        if not self.certfile:
+            self.certfile, self.keyfile = generate_self_signed_cert(hostname=self.hostname)
+        context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+        context.load_cert_chain(self.certfile, self.keyfile)
+        return context
+
+    async def start(self):
+        """Start listening; ports chosen by the OS are stored back on the sink"""
+        if self.tls and self.ssl_context is None:
+            self.ssl_context = self._create_ssl_context()
+        self.stats = SinkStats()
+        limit = self.max_size + 65536
+        server = await asyncio.start_server(self._handle, self.host, self.port, limit=limit)
+        self.port = server.sockets[0].getsockname()[1]
+        self._servers.append(server)
+        if self.ssl_port is not None and self.ssl_context is not None:
+            server = await asyncio.start_server(
+                lambda reader, writer: self._handle(reader, writer, implicit_tls=True),
+                self.host, self.ssl_port, ssl=self.ssl_context, limit=limit)
+            self.ssl_port = server.sockets[0].getsockname()[1]
+            self._servers.append(server)
+        logger.info(f"SMTP sink listening on {self.host}:{self.port}"
+                    + (f" (implicit TLS on {self.ssl_port})" if len(self._servers) > 1 else ""))
+
+    async def close(self):
+        """Stop accepting connections"""
+        for server in self._servers:
+            server.close()
+            await server.wait_closed()
+        self._servers = []
+
+    def start_in_thread(self):
+        """
+        Run the sink on its own event loop in a daemon thread
+
+        Returns:
+            SMTPSink: self, once the sink is listening
+        """
+        def run():
+            self._loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(self._loop)
+            try:
+                self._loop.run_until_complete(self.start())
+            finally:
+                self._ready.set()
+            self._loop.run_forever()
+            self._loop.run_until_complete(self.close())
+            self._loop.close()
+
+        self._thread = threading.Thread(target=run, name='smtp-sink', daemon=True)
+        self._thread.start()
+        self._ready.wait()
+        if not self._servers:
+            raise RuntimeError("SMTP sink failed to start")
+        return self
+
+    def stop(self):
+        """Stop a sink started with start_in_thread"""
+        if self._loop is not None and self._thread is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    async def _handle(self, reader, writer, implicit_tls=False):
+        """Serve one client connection"""
+        stats = self.stats
+        stats.connections += 1
+        stats.active_connections += 1
+        if implicit_tls:
+            stats.tls_connections += 1
+        session = {'tls': implicit_tls, 'ehlo': None, 'auth': False, 'sender': None,
+                   'recipients': [], 'chunks': 0, 'chunk_failed': False}
+
+        def reply(text):
+            writer.write(text.encode('utf-8') + b'\r\n')
+
+        def reset():
+            session['sender'] = None
+            session['recipients'] = []
+            session['chunks'] = 0
+            session['chunk_failed'] = False
+
+        try:
+            reply(f"220 {self.hostname} ESMTP sink ready")
+            while True:
+                await writer.drain()
+                line = await reader.readline()
+                if not line:
+                    break
+                if len(line) > MAX_COMMAND_LINE:
+                    reply("500 5.5.2 Line too long")
+                    continue
+                stats.commands += 1
+                text = line.decode('utf-8', errors='replace').rstrip('\r\n')
+                verb, _, arg = text.partition(' ')
+                verb = verb.upper()
+
+                if verb in ('EHLO', 'HELO'):
+                    reset()
+                    session['ehlo'] = arg or 'unknown'
+                    if verb == 'HELO':
+                        reply(f"250 {self.hostname}")
+                        continue
+                    lines = [self.hostname, 'PIPELINING', f'SIZE {self.max_size}', '8BITMIME',
+                             'SMTPUTF8', 'CHUNKING', 'BINARYMIME', 'ENHANCEDSTATUSCODES']
+                    if not session['tls'] and self.ssl_context is not None:
+                        lines.append('STARTTLS')
+                    lines.append('AUTH PLAIN LOGIN')
+                    for extension in lines[:-1]:
+                        reply(f"250-{extension}")
+                    reply(f"250 {lines[-1]}")
+
+                elif verb == 'STARTTLS':
+                    if session['tls'] or self.ssl_context is None:
+                        reply("503 5.5.1 TLS already active")
+                        continue
+                    reply("220 2.0.0 Ready to start TLS")
+                    await writer.drain()
+                    await writer.start_tls(self.ssl_context)
+                    session.update({'tls': True, 'ehlo': None, 'auth': False})
+                    reset()
+                    stats.tls_connections += 1
+
+                elif verb == 'AUTH':
+                    await self._authenticate(reader, writer, session, arg, reply)
+
+                elif verb == 'MAIL':
+                    if session['ehlo'] is None:
+                        reply("503 5.5.1 Send EHLO first")
+                    elif self.require_auth and not session['auth']:
+                        reply("530 5.7.0 Authentication required")
+                    elif session['sender'] is not None:
+                        reply("503 5.5.1 Nested MAIL command")
+                    else:
+                        size = self._size_parameter(arg)
+                        if size is not None and size > self.max_size:
+                            stats.rejected += 1
+                            reply("552 5.3.4 Message size exceeds fixed maximum message size")
+                            continue
+                        session['sender'] = arg[5:].split(' ', 1)[0] if arg.upper().startswith('FROM:') else arg
+                        reply("250 2.1.0 OK")
+
+                elif verb == 'RCPT':
+                    if session['sender'] is None:
+                        reply("503 5.5.1 Need MAIL command")
+                    else:
+                        session['recipients'].append(arg[3:].split(' ', 1)[0] if arg.upper().startswith('TO:') else arg)
+                        reply("250 2.1.5 OK")
+
+                elif verb == 'DATA':
+                    if not session['recipients']:
+                        reply("503 5.5.1 Need RCPT command")
+                        continue
+                    reply("354 End data with <CR><LF>.<CR><LF>")
+                    await writer.drain()
+                    # Every read ends at a ".\r\n"; it terminates the data when the
+                    # dot starts a line (each read begins at a line start)
+                    size = 0
+                    try:
+                        while True:
+                            part = await reader.readuntil(b'.\r\n')
+                            size += len(part)
+                            if len(part) == 3 or part[-4:-3] == b'\n':
+                                break
+                    except asyncio.LimitOverrunError:
+                        stats.rejected += 1
+                        reply("552 5.3.4 Message size exceeds fixed maximum message size")
+                        break
+                    size -= 3
+                    if size > self.max_size:
+                        stats.rejected += 1
+                        reply("552 5.3.4 Message size exceeds fixed maximum message size")
+                    else:
+                        self._deliver(session, size)
+                        reply("250 2.0.0 OK: queued")
+                    reset()
+
+                elif verb == 'BDAT':
+                    parts = arg.split()
+                    if not parts or not parts[0].isdigit():
+                        reply("501 5.5.4 Syntax: BDAT <size> [LAST]")
+                        continue
+                    size = int(parts[0])
+                    last = len(parts) > 1 and parts[1].upper() == 'LAST'
+                    # The chunk must be consumed even when the command is refused
+                    remaining = size
+                    while remaining:
+                        chunk = await reader.read(min(remaining, 1024 * 1024))
+                        if not chunk:
+                            raise ConnectionResetError("Client closed during BDAT")
+                        remaining -= len(chunk)
+                    if not session['recipients'] or session['chunk_failed']:
+                        session['chunk_failed'] = True
+                        reply("503 5.5.1 Need RCPT command" if not session['recipients']
+                              else "552 5.3.4 Message size exceeds fixed maximum message size")
+                        if last:
+                            reset()
+                        continue
+                    session['chunks'] += size
+                    if session['chunks'] > self.max_size:
+                        session['chunk_failed'] = True
+                        stats.rejected += 1
+                        reply("552 5.3.4 Message size exceeds fixed maximum message size")
+                    elif last:
+                        self._deliver(session, session['chunks'])
+                        reply(f"250 2.0.0 OK: {session['chunks']} octets queued")
+                        reset()
+                    else:
+                        reply(f"250 2.0.0 {size} octets received")
+
+                elif verb == 'RSET':
+                    reset()
+                    reply("250 2.0.0 OK")
+                elif verb == 'NOOP':
+                    reply("250 2.0.0 OK")
+                elif verb == 'QUIT':
+                    reply("221 2.0.0 Bye")
+                    break
+                elif verb in ('VRFY', 'EXPN'):
+                    reply("252 2.1.5 Cannot verify user")
+                else:
+                    reply("502 5.5.2 Command not recognized")
+            await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, ssl.SSLError, OSError) as e:
+            logger.debug(f"Sink connection ended: {str(e)}")
+        finally:
+            stats.active_connections -= 1
+            writer.close()
+
+    async def _authenticate(self, reader, writer, session, arg, reply):
+        """Handle AUTH PLAIN and AUTH LOGIN"""
+        mechanism, _, initial = arg.partition(' ')
+        mechanism = mechanism.upper()
+
+        async def challenge(prompt):
+            reply(f"334 {prompt}")
+            await writer.drain()
+            line = await reader.readline()
+            return line.strip()
+
+        try:
+            if mechanism == 'PLAIN':
+                data = initial or await challenge('')
+                _, username, password = base64.b64decode(data).split(b'\x00', 2)
+            elif mechanism == 'LOGIN':
+                username = base64.b64decode(initial or await challenge('VXNlcm5hbWU6'))
+                password = base64.b64decode(await challenge('UGFzc3dvcmQ6'))
+            else:
+                reply("504 5.5.4 Unrecognized authentication type")
+                return
+        except (ValueError, TypeError):
+            reply("501 5.5.2 Cannot decode response")
+            return
+
+        expected = self.credentials
+        if expected is None or (username.decode('utf-8', errors='replace'),
+                                password.decode('utf-8', errors='replace')) == tuple(expected):
+            session['auth'] = True
+            self.stats.auth_successes += 1
+            reply("235 2.7.0 Authentication successful")
+        else:
+            self.stats.auth_failures += 1
+            reply("535 5.7.8 Authentication credentials invalid")
+
+    @staticmethod
+    def _size_parameter(arg):
+        for parameter in arg.split()[1:]:
+            name, _, value = parameter.partition('=')
+            if name.upper() == 'SIZE' and value.isdigit():
+                return int(value)
+        return None
+
+    def _deliver(self, session, size):
+        stats = self.stats
+        stats.messages += 1
+        stats.recipients += len(session['recipients'])
+        stats.bytes += size
+        if self.on_message:
+            self.on_message(session['sender'], list(session['recipients']), size)
+
+
+async def run_sink(sink, report_interval=5.0, duration=None):
+    """
+    Serve until cancelled or for a fixed duration, logging throughput periodically
+
+    Args:
+        sink (SMTPSink): Sink to run
+        report_interval (float, optional): Seconds between throughput reports, 0 to disable
+        duration (float, optional): Stop after this many seconds
+
+    Returns:
+        dict: Final stats snapshot
+    """
+    await sink.start()
+    deadline = time.monotonic() + duration if duration else None
+    last = sink.stats.snapshot()
+    try:
+        while deadline is None or time.monotonic() < deadline:
+            wait = report_interval or 1.0
+            if deadline is not None:
+                wait = max(0.0, min(wait, deadline - time.monotonic()))
+            await asyncio.sleep(wait)
+            if report_interval:
+                current = sink.stats.snapshot()
+                interval = current['elapsed_seconds'] - last['elapsed_seconds']
+                if interval > 0:
+                    messages = current['messages'] - last['messages']
+                    octets = current['bytes'] - last['bytes']
+                    logger.info(f"{messages / interval:.1f} msg/s, {octets / interval / 1048576:.2f} MiB/s, "
+                                f"{current['active_connections']} connections, {current['messages']} total messages")
+                last = current
+    finally:
+        await sink.close()
+    return sink.stats.snapshot()
@@ -1,10 +1,21 @@
 import smtplib
 import ssl
 import os
+import base64
+import csv
+import json
 import logging
+import itertools
+import math
 import mimetypes
+import heapq
+import random
+import re
 import socket
+import string
+import threading
 import time
+from collections import deque
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 from email.mime.application import MIMEApplication
@@ -14,6 +25,12 @@ from email import encoders
 from io import BytesIO
 from reportlab.pdfgen import canvas
 from reportlab.lib.pagesizes import letter
+from email_validator import check_email
+from message_archive import replace_message_id
+from message_pool import MessageBuildPool
+from template_engine import compile_template
+from transfer_encoding import (apply_transfer_encoding, bdat, bdat_stream, data_stream, plan_transfer_encoding,
+                               send_message, serialize_message)
 
 # Configure logging
 logger = logging.getLogger(__name__)
@@ -29,6 +46,1111 @@ file_handler = logging.FileHandler(log_file)
 file_handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
 logger.addHandler(file_handler)
 
+# RFC 5321 requires servers to accept at least 100 recipients per transaction
+DEFAULT_RECIPIENT_LIMIT = 100
+
+class SMTPTranscript(list):
+    """List of SMTP transcript lines that also records phase timings
+
+    Every line appended is forwarded to an optional listener as it happens, which
+    lets callers stream the conversation live instead of waiting for the result.
+    Listener events are dicts with a 'type' of 'line' or 'phase'.
+    """
+
+    def __init__(self, listener=None):
+        """
+        Initialize the transcript
+
+        Args:
+            listener (callable, optional): Called with each event as it is recorded
+        """
+        super().__init__()
+        self.listener = listener
+        self.timings = {}
+        self._phase = None
+        self._phase_start = None
+
+    def append(self, line):
+        """Record a transcript line and forward it to the listener"""
+        super().append(line)
+        if self.listener:
+            self.listener({'type': 'line', 'line': line})
+
+    def phase(self, name):
+        """
+        Start timing a new phase of the SMTP conversation, ending the current one
+
+        Args:
+            name (str): Phase name, e.g. 'connect', 'ehlo', 'starttls', 'auth', 'data'
+        """
+        self.end_phase()
+        self._phase = name
+        self._phase_start = time.perf_counter()
+
+    def end_phase(self):
+        """Finish the current phase and record its duration"""
+        if self._phase is None:
+            return
+        seconds = time.perf_counter() - self._phase_start
+        self.timings[self._phase] = round(self.timings.get(self._phase, 0) + seconds, 6)
+        if self.listener:
+            self.listener({'type': 'phase', 'phase': self._phase, 'seconds': round(seconds, 6)})
+        self._phase = None
+
+
+def _format_debug_message(message):
+    """Make an smtplib debug message readable by unescaping the byte string"""
+    for marker, label in (("send: b'", "send: "), ("reply: b'", "reply: "), ("data: b'", "data: ")):
+        if message.startswith(marker) and message.endswith("'"):
+            # Extract content between b' and ' and decode escape sequences
+            content = message[len(marker):-1]
+            content = content.replace('\\r\\n', '\n').replace('\\n', '\n')
+            return f"{label}{content}"
+    return message
+
+
+def capture_smtp_log(smtp_instance, smtp_log, prefix=""):
+    """
+    Copy an SMTP connection's debug output into a transcript
+
+    Args:
+        smtp_instance (smtplib.SMTP): Connection with debugging enabled
+        smtp_log (list): Transcript to append lines to
+        prefix (str, optional): Prefix added to every captured line
+    """
+    original_debug = smtp_instance._print_debug
+
+    def custom_debug(*args):
+        message = " ".join(str(a) for a in args)
+        smtp_log.append(f"{prefix}{_format_debug_message(message)}")
+        return original_debug(*args)
+
+    smtp_instance._print_debug = custom_debug
+
+
+def create_ssl_context(no_tls_verify=False):
+    """
+    Create the TLS context used for SSL and STARTTLS connections
+    
+    Args:
+        no_tls_verify (bool, optional): Disable TLS certificate verification
+        
+    Returns:
+        ssl.SSLContext: Configured context
+    """
+    context = ssl.create_default_context()
+    if no_tls_verify:
+        context.check_hostname = False
+        context.verify_mode = ssl.CERT_NONE
+    return context
+
+
+class SMTPSession:
+    """Reusable SMTP connection for sending many messages through one server
+
+    The connection is opened lazily, reused for up to ``max_messages`` messages
+    and transparently re-opened if the server dropped an idle connection before
+    a new transaction started. Each transaction is driven command by command so
+    that per-recipient RCPT replies are available to the caller.
+    """
+
+    def __init__(self, server, port, use_tls=False, use_ssl=False, username=None, password=None,
+                 hostname=None, no_tls_verify=False, timeout=60, max_messages=100, transcript=None):
+        """
+        Initialize the session
+        
+        Args:
+            server (str): SMTP server address
+            port (int): SMTP server port
+            use_tls (bool, optional): Whether to use STARTTLS
+            use_ssl (bool, optional): Whether to use SSL/TLS connection
+            username (str, optional): SMTP username for authentication
+            password (str, optional): SMTP password for authentication
+            hostname (str, optional): Hostname to use for SMTP connection
+            no_tls_verify (bool, optional): Disable TLS certificate verification
+            timeout (float, optional): Socket timeout in seconds
+            max_messages (int, optional): Messages per connection before reconnecting, 0 for no limit
+            transcript (list, optional): Transcript to record the conversation into
+        """
+        self.server = server
+        self.port = port
+        self.use_tls = use_tls
+        self.use_ssl = use_ssl
+        self.username = username
+        self.password = password
+        self.hostname = hostname
+        self.no_tls_verify = no_tls_verify
+        self.timeout = timeout
+        self.max_messages = max_messages
+        self.transcript = transcript
+        self.smtp = None
+        self.connections = 0
+        self.messages_on_connection = 0
+        # Seconds spent in each protocol phase of the most recent send
+        self.timings = {}
+
+    @classmethod
+    def from_profile(cls, profile, **kwargs):
+        """
+        Create a session from a saved SMTP profile
+        
+        Args:
+            profile (dict): Profile as stored by ConfigManager
+            **kwargs: Additional session options
+            
+        Returns:
+            SMTPSession: New unopened session
+        """
+        return cls(
+            server=profile['server'],
+            port=profile['port'],
+            use_tls=profile.get('use_tls', False),
+            use_ssl=profile.get('use_ssl', False),
+            username=profile.get('username'),
+            password=profile.get('password'),
+            no_tls_verify=profile.get('no_tls_verify', False),
+            **kwargs
+        )
+
+    def open(self):
+        """Connect, negotiate TLS and authenticate"""
+        self.close()
+        context = None
+        if self.use_ssl or self.use_tls:
+            context = create_ssl_context(self.no_tls_verify)
+        
+        started = time.perf_counter()
+        if self.use_ssl:
+            smtp = smtplib.SMTP_SSL(self.server, self.port, local_hostname=self.hostname,
+                                    context=context, timeout=self.timeout)
+        else:
+            smtp = smtplib.SMTP(self.server, self.port, local_hostname=self.hostname,
+                                timeout=self.timeout)
+        now = time.perf_counter()
+        self.timings['connect'] = now - started
+        
+        try:
+            if self.transcript is not None:
+                smtp.set_debuglevel(1)
+                capture_smtp_log(smtp, self.transcript)
+            
+            smtp.ehlo()
+            started, now = now, time.perf_counter()
+            self.timings['ehlo'] = now - started
+            if self.use_tls and not self.use_ssl:
+                smtp.starttls(context=context)
+                smtp.ehlo()
+                started, now = now, time.perf_counter()
+                self.timings['starttls'] = now - started
+            
+            if self.username and self.password:
+                smtp.login(self.username, self.password)
+                self.timings['auth'] = time.perf_counter() - now
+        except Exception:
+            smtp.close()
+            raise
+        
+        self.smtp = smtp
+        self.connections += 1
+        self.messages_on_connection = 0
+
+    def close(self):
+        """Close the connection politely, ignoring errors from a dead peer"""
+        if self.smtp is None:
+            return
+        try:
+            self.smtp.quit()
+        except Exception:
+            self.smtp.close()
+        self.smtp = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def recipient_limit(self):
+        """int: RCPTMAX advertised by the server's LIMITS extension, or None"""
+        if self.smtp is None:
+            return None
+        for limit in self.smtp.esmtp_features.get('limits', '').split():
+            name, _, value = limit.partition('=')
+            if name.upper() == 'RCPTMAX' and value.isdigit():
+                return int(value)
+        return None
+
+    def send(self, sender, recipients, message, mail_options=None, rcpt_options=None):
+        """
+        Send one message in a single SMTP transaction
+        
+        Args:
+            sender (str): Envelope sender
+            recipients (list): Envelope recipients
+            message (bytes, str or iterable): Serialized message, or an iterable
+                of bytes-like chunks with CRLF line endings (such as a
+                SyntheticMessage) that is streamed without being joined
+            mail_options (list, optional): ESMTP options for MAIL FROM; with
+                BODY=BINARYMIME the data is sent with BDAT
+            rcpt_options (list, optional): ESMTP options for RCPT TO
+            
+        Returns:
+            dict: 'refused' maps refused recipients to (code, reply), 'code' and
+            'reply' hold the server's final response to the message data
+            
+        Raises:
+            smtplib.SMTPException: If the message was not accepted for any recipient
+        """
+        self.timings = {}
+        if self.smtp is None or (self.max_messages and self.messages_on_connection >= self.max_messages):
+            self.open()
+        
+        started = time.perf_counter()
+        try:
+            code, reply = self.smtp.mail(sender, mail_options or [])
+        except smtplib.SMTPServerDisconnected:
+            if self.messages_on_connection == 0:
+                raise
+            # The server closed an idle reused connection; nothing was sent yet
+            self.open()
+            started = time.perf_counter()
+            code, reply = self.smtp.mail(sender, mail_options or [])
+        
+        if code != 250:
+            self._abort(code)
+            raise smtplib.SMTPSenderRefused(code, reply, sender)
+        
+        refused = {}
+        for index, recipient in enumerate(recipients):
+            code, reply = self.smtp.rcpt(recipient, rcpt_options or [])
+            if code not in (250, 251):
+                refused[recipient] = (code, reply)
+                if code == 421:
+                    self._abort(code)
+                    raise smtplib.SMTPRecipientsRefused(refused)
+                if code == 452 and len(refused) <= index:
+                    # Recipient limit reached; the rest belong in a later transaction
+                    for remaining in recipients[index + 1:]:
+                        refused[remaining] = (code, reply)
+                    break
+        
+        if len(refused) == len(recipients):
+            self._abort(0)
+            raise smtplib.SMTPRecipientsRefused(refused)
+        
+        now = time.perf_counter()
+        self.timings['envelope'] = now - started
+        streamed = not isinstance(message, (bytes, bytearray, memoryview, str))
+        if any(option.upper() == 'BODY=BINARYMIME' for option in mail_options or []):
+            if streamed:
+                code, reply = bdat_stream(self.smtp, message)
+            else:
+                code, reply = bdat(self.smtp, message.encode('utf-8') if isinstance(message, str) else message)
+        elif streamed:
+            code, reply = data_stream(self.smtp, message)
+        else:
+            code, reply = self.smtp.data(message)
+        self.timings['data'] = time.perf_counter() - now
+        if code != 250:
+            self._abort(code)
+            raise smtplib.SMTPDataError(code, reply)
+        
+        self.messages_on_connection += 1
+        return {
+            'refused': refused,
+            'code': code,
+            'reply': reply.decode('utf-8', errors='replace') if isinstance(reply, bytes) else reply
+        }
+
+    def _abort(self, code):
+        """Reset a failed transaction, dropping the connection if the server is closing it"""
+        if code == 421:
+            self.close()
+            return
+        try:
+            self.smtp.rset()
+        except smtplib.SMTPServerDisconnected:
+            self.smtp = None
+
+
+def iter_recipient_rows(path, start=None, offsets=False):
+    """
+    Read recipient rows from a CSV or JSON Lines file
+    
+    CSV files need a header row; the address is taken from an ``email`` column
+    (or ``to``/``recipient``, otherwise the first column). JSON Lines files hold
+    one object per line with an ``email`` key. All other columns or keys are
+    available as merge fields. Rows are yielded lazily so large files are not
+    loaded into memory.
+    
+    Args:
+        path (str): Path to a .csv or .jsonl file
+        start (int, optional): Byte offset of the first row to read, as
+            reported with offsets; the CSV header is still read from the top
+        offsets (bool, optional): Also yield the byte offset just past each row
+        
+    Yields:
+        dict: Row fields with the address under 'email', or (row, offset)
+        tuples when offsets is set
+    """
+    with open(path, 'rb') as f:
+        position = 0
+        
+        def lines():
+            nonlocal position
+            for line in f:
+                position += len(line)
+                yield line.decode('utf-8')
+        
+        if path.lower().endswith(('.jsonl', '.ndjson', '.json')):
+            if start:
+                f.seek(start)
+                position = start
+            for line in lines():
+                line = line.strip().lstrip('\ufeff')
+                if not line:
+                    continue
+                row = json.loads(line)
+                if isinstance(row, str):
+                    row = {'email': row}
+                yield (row, position) if offsets else row
+            return
+        
+        reader = csv.DictReader(lines())
+        fieldnames = reader.fieldnames or []
+        if fieldnames:
+            fieldnames[0] = fieldnames[0].lstrip('\ufeff')
+        email_column = None
+        for name in fieldnames:
+            if name.strip().lower() in ('email', 'to', 'recipient'):
+                email_column = name
+                break
+        if email_column is None and fieldnames:
+            email_column = fieldnames[0]
+        if start:
+            f.seek(start)
+            position = start
+        
+        for row in reader:
+            row['email'] = (row.get(email_column) or '').strip()
+            yield (row, position) if offsets else row
+
+
+def get_reply_code(error):
+    """
+    Extract the SMTP reply code from an smtplib exception
+    
+    Args:
+        error (Exception): Exception raised while sending
+        
+    Returns:
+        int: Reply code or None if the error did not carry one
+    """
+    code = getattr(error, 'smtp_code', None)
+    if code is None and isinstance(error, smtplib.SMTPRecipientsRefused) and error.recipients:
+        code = next(iter(error.recipients.values()))[0]
+    return code
+
+
+def is_transient_error(error):
+    """
+    Check whether a send failure is worth retrying later
+    
+    4xx replies, dropped connections and network errors are transient;
+    5xx replies, TLS failures and other protocol errors are not.
+    
+    Args:
+        error (Exception): Exception raised while sending
+        
+    Returns:
+        bool: True if the same message may succeed on a later attempt
+    """
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return any(400 <= code < 500 for code, _ in error.recipients.values())
+    code = get_reply_code(error)
+    if code is not None:
+        return 400 <= code < 500
+    if isinstance(error, smtplib.SMTPServerDisconnected):
+        return True
+    if isinstance(error, (smtplib.SMTPException, ssl.SSLError)):
+        return False
+    return isinstance(error, OSError)
+
+
+def group_recipients_by_domain(recipients):
+    """
+    Deduplicate addresses case-insensitively and group them by domain
+    
+    Args:
+        recipients (iterable): Email addresses
+        
+    Returns:
+        tuple: (dict mapping lower-case domain to its addresses in input order,
+        list of addresses dropped as duplicates)
+    """
+    seen = set()
+    groups = {}
+    duplicates = []
+    for address in recipients:
+        address = address.strip()
+        if not address:
+            continue
+        key = address.lower()
+        if key in seen:
+            duplicates.append(address)
+            continue
+        seen.add(key)
+        domain = key.rpartition('@')[2]
+        groups.setdefault(domain, []).append(address)
+    return groups, duplicates
+
+
+def pack_recipient_transactions(groups, max_recipients=DEFAULT_RECIPIENT_LIMIT):
+    """
+    Pack domain groups into transactions of at most max_recipients addresses
+    
+    A domain is kept in one transaction whenever it fits, starting a new
+    transaction rather than splitting it; domains larger than the limit are
+    split into full transactions.
+    
+    Args:
+        groups (dict): Domain to address list, as from group_recipients_by_domain
+        max_recipients (int, optional): Recipients allowed per transaction
+        
+    Returns:
+        list: Lists of addresses, one per transaction
+    """
+    max_recipients = max(1, int(max_recipients))
+    transactions = []
+    current = []
+    for addresses in groups.values():
+        if current and len(current) + len(addresses) > max_recipients and len(addresses) <= max_recipients:
+            transactions.append(current)
+            current = []
+        for address in addresses:
+            if len(current) >= max_recipients:
+                transactions.append(current)
+                current = []
+            current.append(address)
+    if current:
+        transactions.append(current)
+    return transactions
+
+
+class TokenBucket:
+    """Token bucket rate limiter whose rate can be lowered and restored at runtime"""
+
+    def __init__(self, rate, burst=None):
+        """
+        Initialize the bucket
+        
+        Args:
+            rate (float): Tokens added per second
+            burst (float, optional): Bucket capacity, defaults to one second of tokens
+        """
+        self.max_rate = float(rate)
+        self.rate = float(rate)
+        self.capacity = float(burst) if burst else max(1.0, self.rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def delay(self, now):
+        """Seconds until a token is available"""
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self, now):
+        """Consume one token"""
+        self._refill(now)
+        self.tokens -= 1
+
+    def slow_down(self, factor, min_rate):
+        """Multiply the rate by factor, not going below min_rate"""
+        self.rate = max(min_rate, self.rate * factor)
+
+    def speed_up(self, fraction):
+        """Raise the rate by a fraction of its configured maximum"""
+        self.rate = min(self.max_rate, self.rate + self.max_rate * fraction)
+
+
+class _DestinationState:
+    """Scheduling state for one recipient domain"""
+
+    __slots__ = ('pending', 'active', 'concurrency', 'bucket', 'paused_until', 'failures', 'scheduled')
+
+    def __init__(self, rate, concurrency):
+        self.pending = deque()
+        self.active = 0
+        self.concurrency = concurrency
+        self.bucket = TokenBucket(rate) if rate else None
+        self.paused_until = 0.0
+        self.failures = 0
+        self.scheduled = False
+
+    def ready_time(self, now):
+        """Earliest time this domain may start another message"""
+        ready = max(now, self.paused_until)
+        if self.bucket:
+            ready = max(ready, now + self.bucket.delay(now))
+        return ready
+
+
+class SendScheduler:
+    """Rate and concurrency limiter for bulk sends through one profile
+
+    Work items are queued per recipient domain. Each domain has its own token
+    bucket and concurrency limit, on top of an overall limit for the profile.
+    Domains are kept in a heap ordered by the time they may next send, so a
+    throttled domain never blocks workers from serving the others. Temporary
+    4xx replies slow a domain's rate and pause it with exponential backoff,
+    and successes gradually restore the configured rate.
+    """
+
+    def __init__(self, rate=None, concurrency=None, domain_rate=None, domain_concurrency=None,
+                 domain_limits=None, backoff_factor=0.5, recovery=0.1, base_backoff=1.0,
+                 max_backoff=300.0, max_pending=10000):
+        """
+        Initialize the scheduler
+        
+        Args:
+            rate (float, optional): Messages per second for the whole profile
+            concurrency (int, optional): Messages in flight for the whole profile
+            domain_rate (float, optional): Default messages per second per recipient domain
+            domain_concurrency (int, optional): Default messages in flight per recipient domain
+            domain_limits (dict, optional): Per-domain overrides, e.g.
+                {'gmail.com': {'rate': 5, 'concurrency': 2}}
+            backoff_factor (float, optional): Rate multiplier applied on a 4xx reply
+            recovery (float, optional): Fraction of the configured rate restored per success
+            base_backoff (float, optional): Pause in seconds after the first 4xx reply
+            max_backoff (float, optional): Upper bound for the exponential pause
+            max_pending (int, optional): Queued items before put() blocks
+        """
+        self.rate = rate
+        self.concurrency = concurrency
+        self.domain_rate = domain_rate
+        self.domain_concurrency = domain_concurrency
+        self.domain_limits = {k.lower(): v for k, v in (domain_limits or {}).items()}
+        self.backoff_factor = backoff_factor
+        self.recovery = recovery
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.max_pending = max_pending
+        
+        self.bucket = TokenBucket(rate) if rate else None
+        self.active = 0
+        self.paused_until = 0.0
+        self.pending_count = 0
+        self.closed = False
+        self.counters = {'dispatched': 0, 'deferred': 0, 'backoffs': 0}
+        self._domains = {}
+        self._ready = []
+        self._deferred = []
+        self._sequence = 0
+        self._cond = threading.Condition()
+
+    @classmethod
+    def from_profile(cls, profile, **overrides):
+        """
+        Create a scheduler from the optional limits stored on a profile
+        
+        Profiles may carry 'rate_limit' (messages per second), 'max_concurrency'
+        and 'domain_limits'. Keyword arguments that are not None take precedence.
+        
+        Args:
+            profile (dict): SMTP profile as stored by ConfigManager
+            **overrides: SendScheduler keyword arguments
+            
+        Returns:
+            SendScheduler: Configured scheduler
+        """
+        kwargs = {
+            'rate': profile.get('rate_limit'),
+            'concurrency': profile.get('max_concurrency'),
+            'domain_limits': dict(profile.get('domain_limits') or {})
+        }
+        domain_limits = overrides.pop('domain_limits', None)
+        if domain_limits:
+            kwargs['domain_limits'].update(domain_limits)
+        kwargs.update({key: value for key, value in overrides.items() if value is not None})
+        return cls(**kwargs)
+
+    def _domain(self, domain):
+        state = self._domains.get(domain)
+        if state is None:
+            limits = self.domain_limits.get(domain, {})
+            rate = limits.get('rate')
+            concurrency = limits.get('concurrency')
+            state = _DestinationState(self.domain_rate if rate is None else rate,
+                                      self.domain_concurrency if concurrency is None else concurrency)
+            self._domains[domain] = state
+        return state
+
+    def _schedule(self, domain, state, now):
+        """Put a domain in the ready heap if it has work and a free slot"""
+        if state.scheduled or not state.pending:
+            return
+        if state.concurrency and state.active >= state.concurrency:
+            return
+        self._sequence += 1
+        heapq.heappush(self._ready, (state.ready_time(now), self._sequence, domain))
+        state.scheduled = True
+
+    def put(self, domain, item):
+        """
+        Queue a work item for a recipient domain, blocking while the queue is full
+        
+        Args:
+            domain (str): Recipient domain
+            item: Work item returned by get()
+        """
+        domain = domain.lower()
+        with self._cond:
+            while self.pending_count >= self.max_pending:
+                self._cond.wait()
+            state = self._domain(domain)
+            state.pending.append(item)
+            self.pending_count += 1
+            self._schedule(domain, state, time.monotonic())
+            self._cond.notify_all()
+
+    def defer(self, domain, item, delay):
+        """
+        Re-queue a work item after a delay, e.g. to retry a temporary failure
+        
+        Args:
+            domain (str): Recipient domain
+            item: Work item
+            delay (float): Seconds to wait before the item becomes eligible
+        """
+        with self._cond:
+            self._sequence += 1
+            heapq.heappush(self._deferred, (time.monotonic() + delay, self._sequence, domain.lower(), item))
+            self.counters['deferred'] += 1
+            self._cond.notify_all()
+
+    def close(self):
+        """Signal that no more items will be put; get() returns None once drained"""
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+
+    def get(self):
+        """
+        Wait for the next work item that may be sent now
+        
+        Returns:
+            tuple: (domain, item), or None once the scheduler is closed and drained
+        """
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                while self._deferred and self._deferred[0][0] <= now:
+                    _, _, domain, item = heapq.heappop(self._deferred)
+                    state = self._domain(domain)
+                    state.pending.append(item)
+                    self.pending_count += 1
+                    self._schedule(domain, state, now)
+                
+                if self.closed and not self.pending_count and not self._deferred and not self.active:
+                    return None
+                
+                wait = self._deferred[0][0] - now if self._deferred else None
+                if self._ready and not (self.concurrency and self.active >= self.concurrency):
+                    ready_at, _, domain = self._ready[0]
+                    state = self._domains[domain]
+                    actual = state.ready_time(now)
+                    if actual > ready_at + 0.001:
+                        # Domain was slowed down since it was queued, re-file it
+                        heapq.heapreplace(self._ready, (actual, self._next_sequence(), domain))
+                        continue
+                    
+                    profile_ready = max(now, self.paused_until)
+                    if self.bucket:
+                        profile_ready = max(profile_ready, now + self.bucket.delay(now))
+                    start_at = max(actual, profile_ready)
+                    if start_at <= now:
+                        heapq.heappop(self._ready)
+                        state.scheduled = False
+                        item = state.pending.popleft()
+                        self.pending_count -= 1
+                        state.active += 1
+                        self.active += 1
+                        if state.bucket:
+                            state.bucket.take(now)
+                        if self.bucket:
+                            self.bucket.take(now)
+                        self.counters['dispatched'] += 1
+                        self._schedule(domain, state, now)
+                        self._cond.notify_all()
+                        return domain, item
+                    wait = start_at - now if wait is None else min(wait, start_at - now)
+                
+                self._cond.wait(wait)
+
+    def _next_sequence(self):
+        self._sequence += 1
+        return self._sequence
+
+    def complete(self, domain, code=None):
+        """
+        Report the outcome of a dispatched item and free its slot
+        
+        Args:
+            domain (str): Recipient domain the item was dispatched for
+            code (int, optional): SMTP reply code, used to detect deferrals
+            
+        Returns:
+            float: Suggested delay before retrying, 0 unless the reply was a
+            temporary refusal
+        """
+        domain = domain.lower()
+        with self._cond:
+            now = time.monotonic()
+            state = self._domain(domain)
+            state.active -= 1
+            self.active -= 1
+            retry_delay = 0.0
+            
+            if code is not None and 400 <= code < 500:
+                state.failures += 1
+                retry_delay = min(self.max_backoff, self.base_backoff * 2 ** (state.failures - 1))
+                retry_delay *= random.uniform(0.8, 1.2)
+                state.paused_until = max(state.paused_until, now + retry_delay)
+                if state.bucket:
+                    state.bucket.slow_down(self.backoff_factor, state.bucket.max_rate * 0.05)
+                if code == 421:
+                    # The relay itself is pushing back, slow the whole profile
+                    self.paused_until = max(self.paused_until, now + retry_delay)
+                    if self.bucket:
+                        self.bucket.slow_down(self.backoff_factor, self.bucket.max_rate * 0.05)
+                self.counters['backoffs'] += 1
+                logger.info(f"Backing off {domain} for {retry_delay:.1f}s after {code} reply")
+            elif code is not None and code < 400:
+                state.failures = 0
+                if state.bucket:
+                    state.bucket.speed_up(self.recovery)
+                if self.bucket:
+                    self.bucket.speed_up(self.recovery)
+            
+            self._schedule(domain, state, now)
+            self._cond.notify_all()
+            return retry_delay
+
+    def stats(self):
+        """
+        Get scheduler counters
+        
+        Returns:
+            dict: Dispatch, deferral and backoff counts and current queue depth
+        """
+        with self._cond:
+            return dict(self.counters, domains=len(self._domains), pending=self.pending_count,
+                        active=self.active)
+
+
+# Kinds of synthetic payload generated by SyntheticPayload
+PAYLOAD_KINDS = ('binary', 'text', 'html', 'parts', 'nested')
+
+# Bytes per chunk yielded by synthetic payloads; one buffer of this size is reused
+PAYLOAD_CHUNK_SIZE = 1024 * 1024
+
+# Content is generated in fixed blocks so the bytes for a seed do not depend on
+# the chunk size; binary blocks encode to whole 76-character base64 lines
+_TEXT_BLOCK = 64 * 1024
+_BINARY_BLOCK = 57 * 1024
+
+_SIZE_UNITS = {'': 1, 'B': 1, 'K': 1024, 'KB': 1024, 'M': 1024 ** 2, 'MB': 1024 ** 2,
+               'G': 1024 ** 3, 'GB': 1024 ** 3}
+
+
+def parse_size(value):
+    """
+    Parse a size such as '512', '64KB' or '100MB' (units are powers of 1024)
+    
+    Args:
+        value (str or int): Size in bytes, optionally with a K, M or G unit
+        
+    Returns:
+        int: Size in bytes
+        
+    Raises:
+        ValueError: If the size cannot be parsed
+    """
+    match = re.fullmatch(r'\s*(\d+(?:\.\d+)?)\s*([KMG]?B?)\s*', str(value), re.IGNORECASE)
+    if not match:
+        raise ValueError(f"Invalid size: {value}")
+    return int(float(match.group(1)) * _SIZE_UNITS[match.group(2).upper()])
+
+
+def _chunked(blocks, chunk_size):
+    """Copy blocks into one reusable buffer and yield views of it as it fills"""
+    buffer = bytearray(chunk_size)
+    view = memoryview(buffer)
+    filled = 0
+    for block in blocks:
+        block = memoryview(block)
+        while len(block):
+            count = min(len(block), chunk_size - filled)
+            view[filled:filled + count] = block[:count]
+            filled += count
+            block = block[count:]
+            if filled == chunk_size:
+                yield view
+                filled = 0
+    if filled:
+        yield view[:filled]
+
+
+class SyntheticPayload:
+    """Deterministic, seed-driven payload for size-dependent throughput tests
+    
+    The same kind, size and seed always produce the same bytes. Kinds:
+    
+    - ``binary``: random bytes, base64 encoded inside a message
+    - ``text``: compressible plain text built from a small random vocabulary
+    - ``html``: an HTML document of paragraphs, headings and links
+    - ``parts``: multipart/mixed with one small text, HTML or binary part per ``part_size`` bytes
+    - ``nested``: ``depth`` levels of multipart nesting with a leaf part at each level
+    
+    ``size`` counts the content bytes of all leaf parts before transfer
+    encoding. Content is generated lazily; iterating yields memoryview slices
+    of one reusable ``chunk_size`` buffer, so each slice must be consumed
+    before the next one is requested.
+    """
+    
+    def __init__(self, kind, size, seed=0, chunk_size=PAYLOAD_CHUNK_SIZE, part_size=1024, depth=32):
+        """
+        Initialize the payload
+        
+        Args:
+            kind (str): One of PAYLOAD_KINDS
+            size (int or str): Content size in bytes, or a size such as '10MB'
+            seed (int, optional): Seed for the generated content
+            chunk_size (int, optional): Bytes per yielded chunk
+            part_size (int, optional): Content bytes per part for 'parts'
+            depth (int, optional): Multipart levels for 'nested'
+            
+        Raises:
+            ValueError: If the kind or a size is invalid
+        """
+        if kind not in PAYLOAD_KINDS:
+            raise ValueError(f"Unknown payload kind: {kind}")
+        self.kind = kind
+        self.size = parse_size(size)
+        self.seed = int(seed)
+        self.chunk_size = max(1, parse_size(chunk_size))
+        self.part_size = max(1, parse_size(part_size))
+        self.depth = max(1, int(depth))
+    
+    @property
+    def content_type(self):
+        """str: Content-Type of the payload as a message body"""
+        if self.kind in ('parts', 'nested'):
+            return f'multipart/mixed; boundary="{self._boundary(0)}"'
+        return self._leaf_content_type(self.kind)
+    
+    @property
+    def transfer_encoding(self):
+        """str: Content-Transfer-Encoding of the payload as a message body"""
+        return 'base64' if self.kind == 'binary' else '7bit'
+    
+    def __iter__(self):
+        """Yield the raw payload; binary content is not base64 encoded"""
+        return _chunked(self._blocks(encode=False), self.chunk_size)
+    
+    def message(self, sender, recipients, subject=None, hostname=None):
+        """
+        Wrap the payload in a message
+        
+        Args:
+            sender (str): Email sender address
+            recipients (list): List of recipient email addresses
+            subject (str, optional): Email subject
+            hostname (str, optional): Domain used for the Message-ID
+            
+        Returns:
+            SyntheticMessage: Message that streams the payload as its body
+        """
+        return SyntheticMessage(self, sender, recipients, subject=subject, hostname=hostname)
+    
+    def _boundary(self, level):
+        return f'==synthetic-{self.seed}-{level}=='
+    
+    @staticmethod
+    def _leaf_content_type(kind):
+        if kind == 'binary':
+            return 'application/octet-stream'
+        return f"text/{'html' if kind == 'html' else 'plain'}; charset=us-ascii"
+    
+    def _blocks(self, encode):
+        """Yield the payload in blocks: raw content for leaf kinds, the MIME body for multipart"""
+        content = _SyntheticContent(self)
+        if self.kind == 'parts':
+            return content.parts()
+        if self.kind == 'nested':
+            return content.nested(0, self.size)
+        return content.content(self.kind, self.size, encode)
+
+
+class _SyntheticContent:
+    """Generator state for one pass over a SyntheticPayload"""
+    
+    def __init__(self, payload):
+        self.payload = payload
+        self.rng = random.Random(payload.seed)
+        self.vocabulary = [''.join(self.rng.choices(string.ascii_lowercase, k=self.rng.randint(2, 10)))
+                           for _ in range(512)]
+        self.lines = {}
+    
+    def line(self, width=72):
+        words = []
+        length = 0
+        while length < width - 12:
+            word = self.rng.choice(self.vocabulary)
+            words.append(word)
+            length += len(word) + 1
+        return ' '.join(words)
+    
+    def line_pool(self, kind):
+        """Lines that text and HTML content is assembled from, made once per kind"""
+        if kind not in self.lines:
+            if kind == 'html':
+                templates = ['<p>{}</p>', '<h2>{}</h2>', '<li><a href="https://example.com/{}">{}</a></li>',
+                             '<div class="{}"><span>{}</span></div>']
+                lines = []
+                for _ in range(256):
+                    template = self.rng.choice(templates)
+                    fields = [self.rng.choice(self.vocabulary)] * (template.count('{}') - 1) + [self.line()]
+                    lines.append(template.format(*fields))
+            else:
+                lines = [self.line() for _ in range(256)]
+            self.lines[kind] = [line.encode('ascii') + b'\r\n' for line in lines]
+        return self.lines[kind]
+    
+    def content(self, kind, size, encode):
+        """Yield size bytes of leaf content, base64 encoded for binary when encode is set"""
+        if kind == 'binary':
+            remaining = size
+            while remaining > 0:
+                block = self.rng.randbytes(min(remaining, _BINARY_BLOCK))
+                remaining -= len(block)
+                yield base64.encodebytes(block).replace(b'\n', b'\r\n') if encode else block
+            return
+        
+        pool = self.line_pool(kind)
+        shortest = min(len(line) for line in pool)
+        head = tail = b''
+        if kind == 'html':
+            head = b'<!DOCTYPE html>\r\n<html>\r\n<head><meta charset="us-ascii"><title>Synthetic payload</title></head>\r\n<body>\r\n'
+            tail = b'</body>\r\n</html>\r\n'
+            if size < len(head) + len(tail):
+                head = tail = b''
+        if head:
+            yield head
+        remaining = size - len(head) - len(tail)
+        while remaining > 0:
+            wanted = min(remaining, _TEXT_BLOCK)
+            block = b''.join(self.rng.choices(pool, k=wanted // shortest + 1))[:wanted]
+            remaining -= len(block)
+            yield block
+        if tail:
+            yield tail
+    
+    def leaf(self, kind, size, index):
+        """Yield one leaf body part with its headers"""
+        headers = f'Content-Type: {SyntheticPayload._leaf_content_type(kind)}\r\n'
+        if kind == 'binary':
+            headers += ('Content-Transfer-Encoding: base64\r\n'
+                        f'Content-Disposition: attachment; filename="part{index}.bin"\r\n')
+        else:
+            headers += 'Content-Transfer-Encoding: 7bit\r\n'
+        yield (headers + '\r\n').encode('ascii')
+        yield from self.content(kind, size, encode=True)
+    
+    def parts(self):
+        boundary = self.payload._boundary(0).encode('ascii')
+        remaining = self.payload.size
+        index = 0
+        while remaining > 0 or index == 0:
+            size = min(remaining, self.payload.part_size)
+            yield b'--' + boundary + b'\r\n'
+            yield from self.leaf(self.rng.choice(('text', 'html', 'binary')), size, index)
+            yield b'\r\n'
+            remaining -= size
+            index += 1
+        yield b'--' + boundary + b'--\r\n'
+    
+    def nested(self, level, size):
+        """Yield one multipart level: a leaf, then the next level or, at the bottom, a binary leaf"""
+        boundary = self.payload._boundary(level).encode('ascii')
+        share = size // (self.payload.depth - level + 1)
+        yield b'--' + boundary + b'\r\n'
+        yield from self.leaf('text' if level % 2 == 0 else 'html', share, level)
+        yield b'\r\n--' + boundary + b'\r\n'
+        if level + 1 < self.payload.depth:
+            yield f'Content-Type: multipart/mixed; boundary="{self.payload._boundary(level + 1)}"\r\n\r\n'.encode('ascii')
+            yield from self.nested(level + 1, size - share)
+        else:
+            yield from self.leaf('binary', size - share, level + 1)
+            yield b'\r\n'
+        yield b'--' + boundary + b'--\r\n'
+
+
+class SyntheticMessage:
+    """Message whose body is a SyntheticPayload, streamed in chunks
+    
+    Iterating yields the message with CRLF line endings as memoryview slices
+    of a reusable buffer, ready for SMTPSession.send. Everything below the
+    headers is identical for a given payload; Date and Message-ID are fresh
+    for every message.
+    """
+    
+    def __init__(self, payload, sender, recipients, subject=None, hostname=None):
+        """
+        Build the message headers
+        
+        Args:
+            payload (SyntheticPayload): Payload used as the message body
+            sender (str): Email sender address
+            recipients (list): List of recipient email addresses
+            subject (str, optional): Email subject
+            hostname (str, optional): Domain used for the Message-ID
+        """
+        self.payload = payload
+        self.message_id = make_msgid(domain=hostname or socket.getfqdn())
+        subject = subject or f"Synthetic {payload.kind} payload, {payload.size} bytes, seed {payload.seed}"
+        headers = [
+            ('From', sender),
+            ('To', ', '.join(recipients)),
+            ('Subject', subject),
+            ('Date', formatdate(localtime=True)),
+            ('Message-ID', self.message_id),
+            ('MIME-Version', '1.0'),
+            ('Content-Type', payload.content_type),
+            ('Content-Transfer-Encoding', payload.transfer_encoding),
+            ('X-Synthetic-Payload', f"kind={payload.kind}; size={payload.size}; seed={payload.seed}")
+        ]
+        self.headers = ''.join(f'{name}: {value}\r\n' for name, value in headers).encode('utf-8') + b'\r\n'
+        # Bytes yielded by the last complete iteration
+        self.length = None
+    
+    def __iter__(self):
+        length = 0
+        for chunk in _chunked(itertools.chain([self.headers], self.payload._blocks(encode=True)),
+                              self.payload.chunk_size):
+            length += len(chunk)
+            yield chunk
+        self.length = length
+
+
 class SMTPTool:
     """Class for handling SMTP operations including sending emails and testing connections"""
     
@@ -36,11 +1158,101 @@ class SMTPTool:
         """Initialize the SMTP Tool"""
         self.eicar_string = "X5O!P%@AP[4\\PZX54(P^)7CC)7}$EICAR-STANDARD-ANTIVIRUS-TEST-FILE!$H+H*"
         
+    def build_message(self, sender, recipients, cc=None, subject='', body='', body_type='plain',
+                      attachments=None, custom_headers=None, hostname=None):
+        """
+        Build the MIME message for an email
+        
+        Args:
+            sender (str): Email sender address
+            recipients (list): List of recipient email addresses
+            cc (list, optional): List of CC email addresses
+            subject (str, optional): Email subject
+            body (str, optional): Email body
+            body_type (str, optional): Email body type ('plain' or 'html')
+            attachments (list, optional): List of attachment file paths
+            custom_headers (dict, optional): Dictionary of custom headers
+            hostname (str, optional): Domain used for the Message-ID
+            
+        Returns:
+            MIMEMultipart: The message ready to be serialized
+        """
+        cc = cc or []
+        attachments = attachments or []
+        custom_headers = custom_headers or {}
+        
+        msg = MIMEMultipart()
+        msg['From'] = sender
+        msg['To'] = ', '.join(recipients)
+        if cc:
+            msg['Cc'] = ', '.join(cc)
+        msg['Subject'] = subject
+        msg['Date'] = formatdate(localtime=True)
+        msg['Message-ID'] = make_msgid(domain=hostname or socket.getfqdn())
+        
+        # Add all custom headers to the message
+        if custom_headers:
+            logger.debug(f"Email has {len(custom_headers)} custom headers to process")
+        for header_name, header_value in custom_headers.items():
+            try:
+                msg[header_name] = header_value
+                logger.debug(f"Added custom header: {header_name}")
+            except Exception as e:
+                logger.warning(f"Failed to add custom header {header_name}: {e}")
+        
+        # Attach the body with proper handling of HTML content
+        if body_type == 'html':
+            # Ensure content has proper HTML structure
+            if not body.strip().startswith('<!DOCTYPE') and not body.strip().startswith('<html'):
+                body = f"""<!DOCTYPE html>
+<html>
+<head>
+  <meta charset="UTF-8">
+</head>
+<body>
+  {body}
+</body>
+</html>"""
+            logger.debug(f"Sending email with HTML body type, length: {len(body)}")
+        
+        # Create the MIME part with the correct content type
+        msg.attach(MIMEText(body, body_type))
+        
+        # Attach files
+        for attachment_path in attachments:
+            if os.path.exists(attachment_path):
+                with open(attachment_path, 'rb') as f:
+                    attachment_data = f.read()
+                self.attach_data(msg, os.path.basename(attachment_path), attachment_data)
+        
+        return msg
+    
+    def attach_data(self, msg, filename, data):
+        """
+        Attach in-memory data to a message built by build_message
+        
+        Args:
+            msg (MIMEMultipart): Message to attach to
+            filename (str): Attachment filename; also used to guess the content type
+            data (bytes): Attachment content
+        """
+        content_type, encoding = mimetypes.guess_type(filename)
+        if content_type is None or encoding is not None:
+            content_type = 'application/octet-stream'
+        
+        maintype, subtype = content_type.split('/', 1)
+        attachment = MIMEApplication(data, subtype)
+        
+        attachment.add_header('Content-Disposition', 'attachment', 
+                             filename=filename)
+        msg.attach(attachment)
+    
     def send_email(self, server, port, use_tls, use_ssl, username, password, 
                    sender, recipients, cc=None, bcc=None, subject='', body='', 
                    body_type='plain', attachments=None, custom_headers=None,
                    hostname=None, ehlo_as=None, helo_as=None, mail_options=None,
-                   no_tls_verify=False):
+                   no_tls_verify=False, transcript=None, archive=None, optimize_encoding=False,
+                   spool=None, profile_name=None):
         """
         Send an email using the provided SMTP server and credentials
         
@@ -65,43 +1277,34 @@ class SMTPTool:
             helo_as (str, optional): Domain to use in HELO command
             mail_options (list, optional): Mail options for SMTP sendmail
             no_tls_verify (bool, optional): Disable TLS certificate verification
+            transcript (SMTPTranscript, optional): Transcript to record into, for live streaming
+            archive (MessageArchive, optional): Archive to store the message in, byte for byte
+            optimize_encoding (bool, optional): Use 8bit or binary parts when the server supports them
+            spool (MailSpool, optional): Spool to queue the message in for recipients the
+                server defers with a 4xx reply or when the connection fails transiently
+            profile_name (str, optional): Saved profile the server settings came from; retries
+                read the password from it, so authenticated sends are only queued with one
             
         Returns:
-            dict: Result of the operation with 'success' and optionally 'error' keys
+            dict: Result of the operation with 'success' and optionally 'error' keys;
+            'queued' holds the spool entry ID when the message was queued for retry
         """
-        smtp_log = []
+        smtp_log = transcript if transcript is not None else SMTPTranscript()
         start_time = time.time()
         smtp_log.append(f"Email Sending Started: {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(start_time))}")
+        message_id = None
+        message_data = None
+        all_recipients = None
+        send_options = mail_options or []
         
-        # Create a log capture function with better formatting
-        def log_smtp(smtp_instance, prefix=""):
-            original_debug = smtp_instance._print_debug
-            
-            def custom_debug(self, *args):
-                message = " ".join(str(a) for a in args)
-                # Clean up the message for better readability
-                if message.startswith("send: b'") and message.endswith("'"):
-                    # Extract content between b' and '
-                    content = message[8:-1]
-                    # Decode escape sequences for better readability
-                    content = content.replace('\\r\\n', '\n').replace('\\n', '\n')
-                    message = f"send: {content}"
-                elif message.startswith("reply: b'") and message.endswith("'"):
-                    # Extract content between b' and '
-                    content = message[9:-1]
-                    # Decode escape sequences
-                    content = content.replace('\\r\\n', '\n').replace('\\n', '\n')
-                    message = f"reply: {content}"
-                elif message.startswith("data: b'") and message.endswith("'"):
-                    # Extract content between b' and '
-                    content = message[8:-1]
-                    content = content.replace('\\r\\n', '\n').replace('\\n', '\n')
-                    message = f"data: {content}"
-                
-                smtp_log.append(f"{prefix}{message}")
-                return original_debug(self, *args)
-            
-            smtp_instance._print_debug = custom_debug
+        def queue_for_retry(deferred, error, code):
+            connection = {'server': server, 'port': port, 'use_tls': use_tls, 'use_ssl': use_ssl,
+                          'username': username, 'password': password, 'hostname': hostname,
+                          'no_tls_verify': no_tls_verify}
+            entry_id = spool.enqueue(message_data, sender, deferred, connection, profile=profile_name,
+                                     mail_options=send_options, error=error, code=code)
+            smtp_log.append(f"Queued for retry: {entry_id} ({len(deferred)} recipients)")
+            return entry_id
         
         try:
             # Initialize lists if None
@@ -112,64 +1315,18 @@ class SMTPTool:
             mail_options = mail_options or []
             
             # Create message
-            msg = MIMEMultipart()
-            msg['From'] = sender
-            msg['To'] = ', '.join(recipients)
-            if cc:
-                msg['Cc'] = ', '.join(cc)
-            msg['Subject'] = subject
-            msg['Date'] = formatdate(localtime=True)
-            msg['Message-ID'] = make_msgid(domain=hostname or socket.getfqdn())
-            
-            # Add custom headers with special handling - different approach
-            logging.info(f"Email has {len(custom_headers)} custom headers to process")
-            
-            # Process custom headers
-            
-            # Add all custom headers to the message
-            for header_name, header_value in custom_headers.items():
+            msg = self.build_message(sender, recipients, cc=cc, subject=subject, body=body,
+                                     body_type=body_type, attachments=attachments,
+                                     custom_headers=custom_headers, hostname=hostname)
+            message_id = msg['Message-ID']
+            # Serialized once with CRLF; these exact bytes are sent, archived and spooled
+            message_data = serialize_message(msg)
+            all_recipients = recipients + cc + bcc
+            if archive is not None:
                 try:
-                    msg[header_name] = header_value
-                    logging.info(f"Added custom header: {header_name}")
+                    archive.store(message_data, message_id)
                 except Exception as e:
-                    logging.warning(f"Failed to add custom header {header_name}: {e}")
-            
-            # Attach the body with proper handling of HTML content
-            if body_type == 'html':
-                # Ensure content has proper HTML structure
-                if not body.strip().startswith('<!DOCTYPE') and not body.strip().startswith('<html'):
-                    body = f"""<!DOCTYPE html>
-<html>
-<head>
-  <meta charset="UTF-8">
-</head>
-<body>
-  {body}
-</body>
-</html>"""
-                # Log that we're sending HTML content
-                logging.info(f"Sending email with HTML body type, length: {len(body)}")
-                
-            # Create the MIME part with the correct content type
-            msg.attach(MIMEText(body, body_type))
-            
-            # Attach files
-            for attachment_path in attachments:
-                if os.path.exists(attachment_path):
-                    with open(attachment_path, 'rb') as f:
-                        attachment_data = f.read()
-                        
-                    attachment_filename = os.path.basename(attachment_path)
-                    content_type, encoding = mimetypes.guess_type(attachment_path)
-                    if content_type is None or encoding is not None:
-                        content_type = 'application/octet-stream'
-                    
-                    maintype, subtype = content_type.split('/', 1)
-                    attachment = MIMEApplication(attachment_data, subtype)
-                    
-                    attachment.add_header('Content-Disposition', 'attachment', 
-                                         filename=attachment_filename)
-                    msg.attach(attachment)
+                    logger.warning(f"Failed to archive message {message_id}: {str(e)}")
             
             # Log connection attempt details
             smtp_log.append(f"Connection Info:")
@@ -183,11 +1340,10 @@ class SMTPTool:
                 smtp_log.append(f"  - TLS Verification: Enabled")
             
             # Connect to the SMTP server
+            smtp_log.append(f"Connecting to {server}:{port}...")
+            smtp_log.phase('connect')
             if use_ssl:
-                context = ssl.create_default_context()
-                if no_tls_verify:
-                    context.check_hostname = False
-                    context.verify_mode = ssl.CERT_NONE
+                context = create_ssl_context(no_tls_verify)
                 smtp = smtplib.SMTP_SSL(server, port, local_hostname=hostname, context=context)
                 
                 # Log SSL connection details immediately
@@ -224,9 +1380,10 @@ class SMTPTool:
             
             # Enable logging
             smtp.set_debuglevel(1)
-            log_smtp(smtp)
+            capture_smtp_log(smtp, smtp_log)
                 
             # Use EHLO/HELO with custom domain if specified
+            smtp_log.phase('ehlo')
             if ehlo_as:
                 response = smtp.ehlo(ehlo_as)
                 # Log server capabilities
@@ -239,13 +1396,13 @@ class SMTPTool:
                             smtp_log.append(f"  - {feature}")
             elif helo_as:
                 smtp.helo(helo_as)
+            else:
+                smtp.ehlo_or_helo_if_needed()
             
             # Use TLS if requested
             if use_tls and not use_ssl:
-                context = ssl.create_default_context()
-                if no_tls_verify:
-                    context.check_hostname = False
-                    context.verify_mode = ssl.CERT_NONE
+                smtp_log.phase('starttls')
+                context = create_ssl_context(no_tls_verify)
                 smtp.starttls(context=context)
                 
                 # Log detailed TLS information after STARTTLS
@@ -284,6 +1441,7 @@ class SMTPTool:
             
             # Authenticate if credentials are provided
             if username and password:
+                smtp_log.phase('auth')
                 # Log available authentication methods
                 if hasattr(smtp, 'esmtp_features') and 'auth' in smtp.esmtp_features:
                     auth_methods = smtp.esmtp_features['auth']
@@ -295,11 +1453,41 @@ class SMTPTool:
                 smtp_log.append(f"  - Status: Authentication successful")
             
             # Send the email
-            all_recipients = recipients + cc + bcc
-            smtp.sendmail(sender, all_recipients, msg.as_string(), mail_options=mail_options)
+            smtp_log.phase('data')
+            # An explicit BODY= option means the caller chose the encoding
+            if optimize_encoding and not any(option.upper().startswith('BODY=') for option in mail_options):
+                smtp.ehlo_or_helo_if_needed()
+                plan = plan_transfer_encoding(smtp.esmtp_features, sender, all_recipients)
+                changed = apply_transfer_encoding(msg, plan)
+                message_data = serialize_message(msg, plan)
+                smtp_log.append(f"Transfer Encoding: {plan['body'].upper()}, {changed} parts re-encoded, "
+                                f"{len(message_data)} bytes{' via BDAT' if plan['chunking'] else ''}")
+                if changed and archive is not None:
+                    try:
+                        archive.store(message_data, message_id)
+                    except Exception as e:
+                        logger.warning(f"Failed to archive message {message_id}: {str(e)}")
+                send_options = mail_options + [option for option in plan['mail_options'] if option not in mail_options]
+                refused = send_message(smtp, sender, all_recipients, message_data, mail_options=send_options,
+                                       chunking=plan['chunking'])
+            else:
+                refused = smtp.sendmail(sender, all_recipients, message_data, mail_options=mail_options)
+            
+            queued = None
+            for recipient, (code, reply) in refused.items():
+                smtp_log.append(f"Recipient refused: {recipient}: {code} {reply.decode('utf-8', errors='replace')}")
+            deferred = [recipient for recipient, (code, _) in refused.items() if 400 <= code < 500]
+            if deferred and spool is not None:
+                code, reply = refused[deferred[0]]
+                try:
+                    queued = queue_for_retry(deferred, f"{code} {reply.decode('utf-8', errors='replace')}", code)
+                except Exception as e:
+                    logger.error(f"Failed to queue message {message_id} for retry: {str(e)}")
             
             # Close the connection
+            smtp_log.phase('quit')
             smtp.quit()
+            smtp_log.end_phase()
             
             end_time = time.time()
             duration = end_time - start_time
@@ -307,22 +1495,47 @@ class SMTPTool:
             smtp_log.append(f"Total Duration: {duration:.2f} seconds")
             
             logger.info(f"Email sent successfully to {', '.join(recipients)}")
-            return {
+            result = {
                 'success': True,
-                'smtp_log': smtp_log,
-                'message_id': msg['Message-ID']
+                'smtp_log': list(smtp_log),
+                'timings': dict(smtp_log.timings),
+                'message_id': message_id
             }
+            if queued:
+                result['queued'] = queued
+            return result
             
         except Exception as e:
+            smtp_log.end_phase()
             logger.exception(f"Failed to send email: {str(e)}")
-            return {
+            code = get_reply_code(e)
+            queued = None
+            if spool is not None and message_data is not None and is_transient_error(e):
+                deferred = all_recipients
+                if isinstance(e, smtplib.SMTPRecipientsRefused):
+                    deferred = [recipient for recipient, (rcpt_code, _) in e.recipients.items()
+                                if 400 <= rcpt_code < 500]
+                try:
+                    queued = queue_for_retry(deferred, str(e), code)
+                except Exception as spool_error:
+                    logger.error(f"Failed to queue message {message_id} for retry: {str(spool_error)}")
+            result = {
                 'success': False, 
                 'error': str(e),
-                'smtp_log': smtp_log
+                'smtp_log': list(smtp_log),
+                'timings': dict(smtp_log.timings)
             }
+            if message_id:
+                result['message_id'] = message_id
+            if code is not None:
+                result['code'] = code
+            if queued:
+                result['queued'] = queued
+            return result
     
     def test_connection(self, server, port, use_tls, use_ssl, username, password, 
-                        hostname=None, ehlo_as=None, helo_as=None, no_tls_verify=False):
+                        hostname=None, ehlo_as=None, helo_as=None, no_tls_verify=False,
+                        transcript=None):
         """
         Test the connection to an SMTP server
         
@@ -337,58 +1550,29 @@ class SMTPTool:
             ehlo_as (str, optional): Domain to use in EHLO command
             helo_as (str, optional): Domain to use in HELO command
             no_tls_verify (bool, optional): Disable TLS certificate verification
+            transcript (SMTPTranscript, optional): Transcript to record into, for live streaming
             
         Returns:
             dict: Result of the operation with 'success' and optionally 'error' keys
         """
-        smtp_log = []
-        
-        # Create a log capture function with better formatting
-        def log_smtp(smtp_instance, prefix=""):
-            original_debug = smtp_instance._print_debug
-            
-            def custom_debug(self, *args):
-                message = " ".join(str(a) for a in args)
-                # Clean up the message for better readability
-                if message.startswith("send: b'") and message.endswith("'"):
-                    # Extract content between b' and '
-                    content = message[8:-1]
-                    # Decode escape sequences for better readability
-                    content = content.replace('\\r\\n', '\n').replace('\\n', '\n')
-                    message = f"send: {content}"
-                elif message.startswith("reply: b'") and message.endswith("'"):
-                    # Extract content between b' and '
-                    content = message[9:-1]
-                    # Decode escape sequences
-                    content = content.replace('\\r\\n', '\n').replace('\\n', '\n')
-                    message = f"reply: {content}"
-                elif message.startswith("data: b'") and message.endswith("'"):
-                    # Extract content between b' and '
-                    content = message[8:-1]
-                    content = content.replace('\\r\\n', '\n').replace('\\n', '\n')
-                    message = f"data: {content}"
-                
-                smtp_log.append(f"{prefix}{message}")
-                return original_debug(self, *args)
-            
-            smtp_instance._print_debug = custom_debug
-            
+        smtp_log = transcript if transcript is not None else SMTPTranscript()
+        
         try:
             # Connect to the SMTP server
+            smtp_log.append(f"Connecting to {server}:{port}...")
+            smtp_log.phase('connect')
             if use_ssl:
-                context = ssl.create_default_context()
-                if no_tls_verify:
-                    context.check_hostname = False
-                    context.verify_mode = ssl.CERT_NONE
+                context = create_ssl_context(no_tls_verify)
                 smtp = smtplib.SMTP_SSL(server, port, local_hostname=hostname, context=context)
             else:
                 smtp = smtplib.SMTP(server, port, local_hostname=hostname)
             
             # Enable logging
             smtp.set_debuglevel(1)
-            log_smtp(smtp)
+            capture_smtp_log(smtp, smtp_log)
             
             # Use EHLO/HELO with custom domain if specified
+            smtp_log.phase('ehlo')
             if ehlo_as:
                 server_info = smtp.ehlo(ehlo_as)
             elif helo_as:
@@ -403,10 +1587,8 @@ class SMTPTool:
             
             # Use TLS if requested
             if use_tls and not use_ssl:
-                context = ssl.create_default_context()
-                if no_tls_verify:
-                    context.check_hostname = False
-                    context.verify_mode = ssl.CERT_NONE
+                smtp_log.phase('starttls')
+                context = create_ssl_context(no_tls_verify)
                 smtp.starttls(context=context)
                 # Need to EHLO again after STARTTLS
                 if ehlo_as:
@@ -416,35 +1598,421 @@ class SMTPTool:
             
             # Authenticate if credentials are provided
             if username and password:
+                smtp_log.phase('auth')
                 smtp.login(username, password)
             
             # Check the server capabilities
             capabilities = []
             if hasattr(server_info, '__getitem__') and len(server_info) > 1:
-                for item in server_info[1]:
-                    if isinstance(item, bytes):
-                        item = item.decode('utf-8')
+                reply = server_info[1]
+                if isinstance(reply, bytes):
+                    reply = reply.decode('utf-8', errors='replace')
+                for item in reply.splitlines():
                     capabilities.append(item)
             
             # Close the connection
+            smtp_log.phase('quit')
             smtp.quit()
+            smtp_log.end_phase()
             
             logger.info(f"Successfully connected to SMTP server {server}:{port}")
             return {
                 'success': True, 
                 'message': 'Connection successful', 
                 'capabilities': capabilities,
-                'smtp_log': smtp_log
+                'smtp_log': list(smtp_log),
+                'timings': dict(smtp_log.timings)
             }
             
         except Exception as e:
+            smtp_log.end_phase()
             logger.exception(f"Failed to connect to SMTP server: {str(e)}")
             return {
                 'success': False, 
                 'error': str(e),
-                'smtp_log': smtp_log
+                'smtp_log': list(smtp_log),
+                'timings': dict(smtp_log.timings)
             }
     
+    def send_batch(self, profile, sender, template, rows, concurrency=4, hostname=None,
+                   max_messages_per_session=100, on_result=None, collect_results=True,
+                   scheduler=None, max_retries=0, attachments=None, build_processes=0, journal=None):
+        """
+        Send one personalized message per recipient row through reused sessions
+        
+        Rows are read lazily and handed to ``concurrency`` worker threads, each of
+        which keeps its own SMTP session open across messages. The template is
+        compiled once and its ``{{ field }}`` placeholders are filled from each row.
+        Rows are dispatched through a SendScheduler, which applies any per-profile
+        and per-domain rate limits and backs off on temporary 4xx replies.
+        With ``build_processes`` set, messages are built and serialized in a
+        MessageBuildPool and sent straight from shared memory. With a
+        ``journal`` every outcome is recorded durably so the run can be resumed.
+        
+        Args:
+            profile (dict): SMTP profile as stored by ConfigManager
+            sender (str): Envelope and header sender address
+            template (dict or CompiledTemplate): Template with 'subject', 'body' and 'body_type'
+            rows (iterable): Recipient rows, each a dict with an 'email' key; with a
+                journal, the (index, row) pairs from journal.rows()
+            concurrency (int, optional): Number of parallel SMTP sessions
+            hostname (str, optional): Hostname to use for SMTP connection
+            max_messages_per_session (int, optional): Messages per connection before reconnecting
+            on_result (callable, optional): Called with each per-recipient outcome as it completes;
+                calls never overlap
+            collect_results (bool, optional): Whether to return every outcome in the result
+            scheduler (SendScheduler, optional): Rate limiter; defaults to no limits
+            max_retries (int, optional): Times a message refused with a 4xx reply is
+                re-queued after the scheduler's backoff delay
+            attachments (list, optional): File paths attached to every message
+            build_processes (int, optional): Worker processes for building messages,
+                0 to build them in the sending threads
+            journal (BatchJournal, optional): Progress journal to record outcomes in
+            
+        Returns:
+            dict: 'success', 'stats' with counts and throughput, and 'results'
+            with per-recipient outcomes when collect_results is set
+        """
+        concurrency = max(1, int(concurrency))
+        template = compile_template(template)
+        body_type = template.body_type
+        if scheduler is None:
+            scheduler = SendScheduler(max_pending=concurrency * 100)
+        results = []
+        counts = {'sent': 0, 'failed': 0, 'invalid': 0, 'retried': 0}
+        sessions = []
+        lock = threading.Lock()
+        pool = MessageBuildPool(build_processes).start() if build_processes else None
+        
+        def record(outcome):
+            with lock:
+                counts[outcome['status']] += 1
+                if collect_results:
+                    results.append(outcome)
+                # Called under the lock so callbacks writing to a shared file need no locking of their own
+                if on_result:
+                    try:
+                        on_result(outcome)
+                    except Exception as e:
+                        logger.warning(f"Batch result callback failed: {str(e)}")
+            if journal is not None:
+                journal.record(outcome)
+        
+        def worker():
+            session = SMTPSession.from_profile(profile, hostname=hostname,
+                                               max_messages=max_messages_per_session)
+            with lock:
+                sessions.append(session)
+            try:
+                while True:
+                    item = scheduler.get()
+                    if item is None:
+                        return
+                    domain, (index, row, attempt) = item
+                    recipient = row['email']
+                    outcome = {'row': index, 'email': recipient}
+                    started = time.perf_counter()
+                    try:
+                        subject, body = template.render(row)
+                        if pool:
+                            with pool.build(sender, [recipient], subject=subject, body=body,
+                                            body_type=body_type, attachments=attachments,
+                                            hostname=hostname) as message:
+                                message_id = message.message_id
+                                reply = session.send(sender, [recipient], message.data)
+                        else:
+                            msg = self.build_message(sender, [recipient], subject=subject, body=body,
+                                                     body_type=body_type, attachments=attachments,
+                                                     hostname=hostname)
+                            message_id = msg['Message-ID']
+                            reply = session.send(sender, [recipient], serialize_message(msg))
+                        outcome.update({
+                            'status': 'sent',
+                            'code': reply['code'],
+                            'reply': reply['reply'],
+                            'message_id': message_id
+                        })
+                    except Exception as e:
+                        outcome.update({'status': 'failed', 'error': str(e)})
+                        code = get_reply_code(e)
+                        if code is not None:
+                            outcome['code'] = code
+                        # Start the next message on a fresh connection after transport errors
+                        if not isinstance(e, (smtplib.SMTPResponseException, smtplib.SMTPRecipientsRefused)):
+                            session.close()
+                    
+                    retry_delay = scheduler.complete(domain, outcome.get('code'))
+                    if retry_delay and attempt < max_retries:
+                        with lock:
+                            counts['retried'] += 1
+                        scheduler.defer(domain, (index, row, attempt + 1), retry_delay)
+                        continue
+                    if attempt:
+                        outcome['attempts'] = attempt + 1
+                    outcome['seconds'] = round(time.perf_counter() - started, 6)
+                    record(outcome)
+            finally:
+                session.close()
+        
+        threads = [threading.Thread(target=worker, name=f'batch-{i}', daemon=True) for i in range(concurrency)]
+        start_time = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        
+        total = 0
+        try:
+            for index, row in (rows if journal is not None else enumerate(rows)):
+                total += 1
+                recipient = (row.get('email') or '').strip()
+                reason = check_email(recipient)
+                if reason:
+                    record({'row': index, 'email': recipient, 'status': 'invalid', 'error': reason})
+                    continue
+                row['email'] = recipient
+                scheduler.put(recipient.rsplit('@', 1)[1], (index, row, 0))
+        finally:
+            scheduler.close()
+            for thread in threads:
+                thread.join()
+            if pool:
+                pool.close()
+            if journal is not None:
+                journal.sync()
+        
+        elapsed = time.perf_counter() - start_time
+        stats = {
+            'total': total,
+            'sent': counts['sent'],
+            'failed': counts['failed'],
+            'invalid': counts['invalid'],
+            'concurrency': concurrency,
+            'build_processes': build_processes,
+            'retried': counts['retried'],
+            'connections': sum(session.connections for session in sessions),
+            'elapsed_seconds': round(elapsed, 3),
+            'messages_per_second': round(counts['sent'] / elapsed, 2) if elapsed > 0 else 0
+        }
+        scheduler_stats = scheduler.stats()
+        if scheduler_stats['backoffs']:
+            stats['backoffs'] = scheduler_stats['backoffs']
+        if journal is not None:
+            stats['run_id'] = journal.run_id
+            stats['skipped'] = journal.skipped
+        stats['domains'] = scheduler_stats['domains']
+        logger.info(f"Batch finished: {stats['sent']}/{total} sent in {stats['elapsed_seconds']}s "
+                    f"({stats['messages_per_second']} msg/s)")
+        
+        result = {'success': counts['failed'] == 0 and counts['sent'] > 0, 'stats': stats}
+        if collect_results:
+            result['results'] = sorted(results, key=lambda outcome: outcome['row'])
+        return result
+    
+    def replay_message(self, profile, sender, recipients, message, count=1, concurrency=1,
+                       hostname=None, new_message_id=False, max_messages_per_session=0):
+        """
+        Re-send a serialized message byte for byte, as fast as the server accepts it
+        
+        A SyntheticPayload can be given instead of a message; each copy is then
+        a fresh SyntheticMessage streamed in chunks, so payloads of any size
+        are sent without being held in memory.
+        
+        Args:
+            profile (dict): SMTP profile as stored by ConfigManager
+            sender (str): Envelope sender
+            recipients (list): Envelope recipients
+            message (bytes or SyntheticPayload): Message exactly as originally sent
+            count (int, optional): Number of copies to send
+            concurrency (int, optional): Number of parallel SMTP sessions
+            hostname (str, optional): Hostname to use for SMTP connection
+            new_message_id (bool, optional): Give each copy a fresh Message-ID;
+                every other byte is left unchanged
+            max_messages_per_session (int, optional): Messages per connection, 0 for no limit
+            
+        Returns:
+            dict: 'success' and 'stats' with counts, reply codes of failures,
+            throughput and p50/p99 latency
+        """
+        concurrency = max(1, min(int(concurrency), count))
+        domain = hostname or socket.getfqdn()
+        synthetic = isinstance(message, SyntheticPayload)
+        message_size = None if synthetic else len(message)
+        remaining = iter(range(count))
+        latencies = []
+        errors = {}
+        sessions = []
+        lock = threading.Lock()
+        
+        def worker():
+            nonlocal message_size
+            session = SMTPSession.from_profile(profile, hostname=hostname,
+                                               max_messages=max_messages_per_session)
+            with lock:
+                sessions.append(session)
+            try:
+                while True:
+                    with lock:
+                        if next(remaining, None) is None:
+                            return
+                    if synthetic:
+                        data = message.message(sender, recipients, hostname=domain)
+                    elif new_message_id:
+                        data = replace_message_id(message, domain=domain)[0]
+                    else:
+                        data = message
+                    started = time.perf_counter()
+                    try:
+                        session.send(sender, recipients, data)
+                        with lock:
+                            latencies.append(time.perf_counter() - started)
+                            if synthetic:
+                                message_size = data.length
+                    except Exception as e:
+                        code = get_reply_code(e)
+                        key = str(code) if code is not None else type(e).__name__
+                        with lock:
+                            errors[key] = errors.get(key, 0) + 1
+                        if not isinstance(e, (smtplib.SMTPResponseException, smtplib.SMTPRecipientsRefused)):
+                            session.close()
+            finally:
+                session.close()
+        
+        threads = [threading.Thread(target=worker, name=f'replay-{i}', daemon=True) for i in range(concurrency)]
+        start_time = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start_time
+        
+        latencies.sort()
+        
+        def percentile(pct):
+            """Nearest-rank percentile in milliseconds"""
+            if not latencies:
+                return 0.0
+            rank = max(1, math.ceil(pct / 100.0 * len(latencies)))
+            return round(latencies[rank - 1] * 1000, 3)
+        
+        stats = {
+            'total': count,
+            'sent': len(latencies),
+            'failed': sum(errors.values()),
+            'errors': errors,
+            'concurrency': concurrency,
+            'connections': sum(session.connections for session in sessions),
+            'bytes': message_size,
+            'elapsed_seconds': round(elapsed, 3),
+            'messages_per_second': round(len(latencies) / elapsed, 2) if elapsed > 0 else 0,
+            'megabytes_per_second': (round(len(latencies) * message_size / elapsed / 1024 ** 2, 2)
+                                     if elapsed > 0 and message_size else 0),
+            'p50_ms': percentile(50),
+            'p99_ms': percentile(99)
+        }
+        logger.info(f"Replay finished: {stats['sent']}/{count} sent in {stats['elapsed_seconds']}s "
+                    f"({stats['messages_per_second']} msg/s)")
+        return {'success': stats['failed'] == 0 and stats['sent'] > 0, 'stats': stats}
+    
+    def send_grouped(self, profile, sender, recipients, message, max_recipients=None,
+                     hostname=None, transcript=None):
+        """
+        Send one message to many recipients using as few transactions as possible
+        
+        Recipients are deduplicated case-insensitively, grouped by domain and
+        packed up to the server's recipient limit (``max_recipients``, else the
+        RCPTMAX the server advertises, else 100) so the same payload is uploaded
+        once per transaction instead of once per recipient. When the server
+        answers 452 "too many recipients" the limit is lowered to what it
+        accepted and the remaining recipients are re-packed.
+        
+        Args:
+            profile (dict): SMTP profile as stored by ConfigManager
+            sender (str): Envelope sender
+            recipients (iterable): Envelope recipient addresses
+            message (bytes or str or Message): Message to deliver
+            max_recipients (int, optional): Recipients per transaction
+            hostname (str, optional): Hostname to use for SMTP connection
+            transcript (list, optional): Transcript to record the conversation into
+            
+        Returns:
+            dict: 'success', 'recipients' mapping each unique address to its
+            'status' (accepted, refused, deferred or failed), 'code', 'reply'
+            and 'transaction', 'duplicates' listing every input dropped as a
+            repeat, and 'stats'
+        """
+        if not isinstance(message, (bytes, str)):
+            message = serialize_message(message)
+        groups, duplicates = group_recipients_by_domain(recipients)
+        # Only unique addresses get a status; an exact repeat would otherwise share its key
+        statuses = {}
+        stats = {'unique': sum(len(addresses) for addresses in groups.values()),
+                 'duplicates': len(duplicates), 'transactions': 0, 'splits': 0}
+        
+        def mark(addresses, status, code=None, reply=None):
+            if isinstance(reply, bytes):
+                reply = reply.decode('utf-8', errors='replace')
+            for address in addresses:
+                statuses[address] = {'status': status, 'code': code, 'reply': reply,
+                                     'transaction': stats['transactions']}
+        
+        session = SMTPSession.from_profile(profile, hostname=hostname, max_messages=0, transcript=transcript)
+        limit = max_recipients or DEFAULT_RECIPIENT_LIMIT
+        try:
+            if groups:
+                session.open()
+            limit = max_recipients or session.recipient_limit or DEFAULT_RECIPIENT_LIMIT
+            pending = deque(pack_recipient_transactions(groups, limit))
+            
+            while pending:
+                batch = pending.popleft()
+                stats['transactions'] += 1
+                try:
+                    result = session.send(sender, batch, message)
+                    refused = result['refused']
+                    mark([a for a in batch if a not in refused], 'accepted', result['code'], result['reply'])
+                except smtplib.SMTPRecipientsRefused as e:
+                    refused = e.recipients
+                    result = None
+                except (smtplib.SMTPException, OSError) as e:
+                    code = get_reply_code(e)
+                    mark(batch, 'deferred' if code and 400 <= code < 500 else 'failed', code, str(e))
+                    if not isinstance(e, smtplib.SMTPResponseException):
+                        session.close()
+                    continue
+                
+                too_many = [a for a in batch if refused.get(a, (None,))[0] == 452]
+                accepted = len(batch) - len(refused)
+                for address, (code, reply) in refused.items():
+                    if address not in too_many or not accepted:
+                        mark([address], 'deferred' if 400 <= code < 500 else 'refused', code, reply)
+                
+                if too_many and accepted:
+                    # Learn the real limit and re-pack everything still waiting
+                    limit = accepted
+                    stats['splits'] += 1
+                    logger.info(f"Server accepted {accepted} recipients per transaction, re-packing")
+                    remaining, _ = group_recipients_by_domain(too_many + [a for t in pending for a in t])
+                    pending = deque(pack_recipient_transactions(remaining, limit))
+        except Exception as e:
+            logger.error(f"Grouped send failed: {str(e)}")
+            unsent = [a for addresses in groups.values() for a in addresses if a not in statuses]
+            mark(unsent, 'failed', None, str(e))
+        finally:
+            session.close()
+        
+        counts = {}
+        for status in statuses.values():
+            counts[status['status']] = counts.get(status['status'], 0) + 1
+        stats.update(counts)
+        stats['recipient_limit'] = limit
+        logger.info(f"Grouped send: {counts.get('accepted', 0)}/{stats['unique']} recipients accepted "
+                    f"in {stats['transactions']} transactions")
+        return {
+            'success': counts.get('accepted', 0) > 0 and counts.get('accepted', 0) == stats['unique'],
+            'recipients': statuses,
+            'duplicates': duplicates,
+            'stats': stats
+        }
+    
     def create_eicar_attachment(self):
         """Create an EICAR test file attachment for antivirus testing
         
@@ -1,4 +1,61 @@
 $(document).ready(function() {
+    // Follow a queued job, rendering transcript lines into logElement as they arrive.
+    // Uses Server-Sent Events when available and falls back to polling.
+    function followJob(job, logElement, onDone) {
+        let finished = false;
+        
+        function finish(result) {
+            if (finished) return;
+            finished = true;
+            onDone(result || {});
+        }
+        
+        function pollJob() {
+            $.ajax({
+                url: job.status_url,
+                type: 'GET',
+                success: function(response) {
+                    const status = response.job;
+                    if (status && (status.status === 'completed' || status.status === 'failed')) {
+                        finish(status.result);
+                    } else {
+                        setTimeout(pollJob, 1000);
+                    }
+                },
+                error: function(xhr, status, error) {
+                    console.error('Error polling job:', error);
+                    finish({ success: false, message: 'Lost track of the queued job. Check the logs page for its result.' });
+                }
+            });
+        }
+        
+        if (!window.EventSource || !job.events_url) {
+            pollJob();
+            return;
+        }
+        
+        const source = new EventSource(job.events_url);
+        source.addEventListener('line', function(e) {
+            const event = JSON.parse(e.data);
+            logElement.removeClass('d-none').append(document.createTextNode(event.line + '\n'));
+            logElement.scrollTop(logElement.prop('scrollHeight'));
+        });
+        source.addEventListener('phase', function(e) {
+            const event = JSON.parse(e.data);
+            const ms = (event.seconds * 1000).toFixed(1);
+            logElement.append(document.createTextNode('   [' + event.phase + ': ' + ms + ' ms]\n'));
+        });
+        source.addEventListener('done', function(e) {
+            source.close();
+            finish(JSON.parse(e.data).result);
+        });
+        source.onerror = function() {
+            // Stream dropped before completion, fall back to polling
+            source.close();
+            if (!finished) pollJob();
+        };
+    }
+    
     // Delete sender from dropdown with improved error handling
     $(document).on('click', '.delete-sender-item', function(e) {
         e.preventDefault();
@@ -263,6 +320,31 @@ $(document).ready(function() {
         
         // Sending indicator already set above, don't need to do it again
         
+        // Unique key for this submission so the server can suppress duplicates
+        const idempotencyKey = (window.crypto && crypto.randomUUID)
+            ? crypto.randomUUID()
+            : Date.now() + '-' + Math.random().toString(36).substring(2, 10);
+        
+        // Queue the send as a background job and poll for its result
+        formData.set('mode', 'job');
+        
+        function resetSendButton() {
+            $('#sendButton').html('<i class="fas fa-paper-plane me-2"></i>Send Email').prop('disabled', false);
+            isFormSubmitting = false;
+        }
+        
+        function showSendStatus(success, message) {
+            if (success) {
+                $('#statusModalHeader').removeClass('bg-danger').addClass('bg-success');
+                $('#statusModalTitle').text('Success');
+            } else {
+                $('#statusModalHeader').removeClass('bg-success').addClass('bg-danger');
+                $('#statusModalTitle').text('Failed');
+            }
+            $('#statusMessage').text(message);
+            $('#statusModal').modal('show');
+        }
+        
         // Send the email via AJAX
         $.ajax({
             url: '/send_email',
@@ -270,33 +352,39 @@ $(document).ready(function() {
             data: formData,
             processData: false,
             contentType: false,
+            headers: { 'Idempotency-Key': idempotencyKey },
             success: function(response) {
+                if (response.success && response.job_id) {
+                    // Show the live transcript while the send is in progress
+                    $('#sendButton').html('<i class="fas fa-spinner fa-spin me-2"></i>Sending...');
+                    $('#statusModalHeader').removeClass('bg-success bg-danger');
+                    $('#statusModalTitle').text('Sending...');
+                    $('#statusMessage').text(response.message);
+                    $('#statusLog').empty().addClass('d-none');
+                    $('#statusModal').modal('show');
+                    
+                    followJob(response, $('#statusLog'), function(result) {
+                        resetSendButton();
+                        showSendStatus(result.success, result.message || 'Email failed');
+                    });
+                    return;
+                }
+                
+                $('#statusLog').empty().addClass('d-none');
+                
                 // Reset the button and submission flag
-                $('#sendButton').html('<i class="fas fa-paper-plane me-2"></i>Send Email').prop('disabled', false);
-                isFormSubmitting = false;
+                resetSendButton();
                 
                 // Show status modal
-                if (response.success) {
-                    $('#statusModalHeader').removeClass('bg-danger').addClass('bg-success');
-                    $('#statusModalTitle').text('Success');
-                    $('#statusMessage').text(response.message);
-                } else {
-                    $('#statusModalHeader').removeClass('bg-success').addClass('bg-danger');
-                    $('#statusModalTitle').text('Failed');
-                    $('#statusMessage').text(response.message);
-                }
-                $('#statusModal').modal('show');
+                showSendStatus(response.success, response.message);
             },
             error: function(xhr, status, error) {
                 // Reset the button and submission flag
-                $('#sendButton').html('<i class="fas fa-paper-plane me-2"></i>Send Email').prop('disabled', false);
-                isFormSubmitting = false;
+                resetSendButton();
                 
                 // Show error message
-                $('#statusModalHeader').removeClass('bg-success').addClass('bg-danger');
-                $('#statusModalTitle').text('Failed');
-                $('#statusMessage').text('Email failed. Please try again.');
-                $('#statusModal').modal('show');
+                const message = (xhr.responseJSON && xhr.responseJSON.message) || 'Email failed. Please try again.';
+                showSendStatus(false, message);
                 
                 console.error('Error sending email:', error);
             }
@@ -393,27 +481,38 @@ $(document).ready(function() {
         $('#connectionDetails').addClass('d-none');
         $('#serverCapabilities').empty();
         
-        // Send test request
+        $('#connectionLog').empty().addClass('d-none');
+        
+        function showConnectionResult(response) {
+            if (response.success) {
+                $('#connectionStatus').html('<div class="alert alert-success"><i class="fas fa-check-circle me-2"></i>' + response.message + '</div>');
+                    
+                // Show capabilities if available
+                if (response.capabilities && response.capabilities.length > 0) {
+                    $('#serverCapabilities').empty();
+                    response.capabilities.forEach(function(capability) {
+                        $('#serverCapabilities').append('<li>' + capability + '</li>');
+                    });
+                    $('#connectionDetails').removeClass('d-none');
+                }
+            } else {
+                $('#connectionStatus').html('<div class="alert alert-danger"><i class="fas fa-times-circle me-2"></i>Connection failed: ' + (response.error || response.message || 'Unknown error') + '</div>');
+            }
+        }
+        
+        // Queue the test and stream its transcript
         $.ajax({
             url: '/test_connection',
             type: 'POST',
             data: {
-                profile: profile
+                profile: profile,
+                mode: 'job'
             },
             success: function(response) {
-                if (response.success) {
-                    $('#connectionStatus').html('<div class="alert alert-success"><i class="fas fa-check-circle me-2"></i>' + response.message + '</div>');
-                    
-                    // Show capabilities if available
-                    if (response.capabilities && response.capabilities.length > 0) {
-                        $('#serverCapabilities').empty();
-                        response.capabilities.forEach(function(capability) {
-                            $('#serverCapabilities').append('<li>' + capability + '</li>');
-                        });
-                        $('#connectionDetails').removeClass('d-none');
-                    }
+                if (response.success && response.job_id) {
+                    followJob(response, $('#connectionLog'), showConnectionResult);
                 } else {
-                    $('#connectionStatus').html('<div class="alert alert-danger"><i class="fas fa-times-circle me-2"></i>Connection failed: ' + (response.error || 'Unknown error') + '</div>');
+                    showConnectionResult(response);
                 }
             },
             error: function(xhr, status, error) {
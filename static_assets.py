@@ -0,0 +1,148 @@
+import gzip
+import hashlib
+import logging
+import mimetypes
+import os
+import re
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Cache lifetime of fingerprinted URLs; their content never changes
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+# Seconds a computed asset version is reused before the folder is walked again
+VERSION_TTL = 5
+
+# Content types that are stored with a gzip variant
+COMPRESSIBLE_TYPES = ('text/', 'application/javascript', 'application/json', 'image/svg+xml')
+
+# 'css/style.0123456789ab.css' -> 'css/style', '0123456789ab', '.css'
+_FINGERPRINTED = re.compile(r'^(?P<stem>.+)\.(?P<fingerprint>[0-9a-f]{12})(?P<suffix>\.[^./]+)$')
+
+
+class StaticAssets:
+    """Fingerprinted, precompressed static files
+
+    Each file is read once and kept in memory with a content fingerprint and,
+    for text types, a gzip variant compressed at the highest level. Files are
+    re-read when their size or modification time changes, so edits show up
+    without a restart.
+    """
+
+    def __init__(self, folder):
+        """
+        Initialize the asset store
+
+        Args:
+            folder (str): Static files directory
+        """
+        self.folder = os.path.abspath(folder)
+        self._assets = {}
+        self._lock = threading.Lock()
+        self._version = None
+        self._version_checked = 0
+
+    def get(self, filename):
+        """
+        Load a static file
+
+        Args:
+            filename (str): Path relative to the static folder
+
+        Returns:
+            dict: 'data', 'gzip' (None when not worth compressing), 'mimetype',
+            'fingerprint' and 'mtime', or None if the file does not exist
+        """
+        path = os.path.abspath(os.path.join(self.folder, filename))
+        if not path.startswith(self.folder + os.sep):
+            return None
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        key = (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            asset = self._assets.get(filename)
+        if asset and asset['key'] == key:
+            return asset
+
+        with open(path, 'rb') as f:
+            data = f.read()
+        mimetype = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        compressed = None
+        if mimetype.startswith(COMPRESSIBLE_TYPES):
+            compressed = gzip.compress(data, compresslevel=9, mtime=0)
+            if len(compressed) >= len(data):
+                compressed = None
+        asset = {
+            'key': key,
+            'data': data,
+            'gzip': compressed,
+            'mimetype': mimetype,
+            'fingerprint': hashlib.sha256(data).hexdigest()[:12],
+            'mtime': stat.st_mtime
+        }
+        with self._lock:
+            self._assets[filename] = asset
+        logger.debug(f"Loaded static asset {filename} ({len(data)} bytes, "
+                     f"{len(compressed) if compressed else '-'} gzipped)")
+        return asset
+
+    def url_path(self, filename):
+        """
+        Fingerprinted path of a static file, such as 'css/style.0123456789ab.css'
+
+        Args:
+            filename (str): Path relative to the static folder
+
+        Returns:
+            str: Fingerprinted path, or filename unchanged if the file does not exist
+        """
+        asset = self.get(filename)
+        if asset is None:
+            return filename
+        stem, suffix = os.path.splitext(filename)
+        return f"{stem}.{asset['fingerprint']}{suffix}"
+
+    def resolve(self, path):
+        """
+        Find the asset a requested path refers to
+
+        Args:
+            path (str): Requested path, fingerprinted or plain
+
+        Returns:
+            tuple: (asset, immutable) where immutable is True only when the
+            path carries the current fingerprint; (None, False) if not found
+        """
+        match = _FINGERPRINTED.match(path)
+        if match:
+            asset = self.get(match.group('stem') + match.group('suffix'))
+            if asset is not None:
+                return asset, asset['fingerprint'] == match.group('fingerprint')
+        return self.get(path), False
+
+    def version(self):
+        """
+        Fingerprint of every static file, for pages that link to them
+
+        The folder is walked at most once every VERSION_TTL seconds.
+
+        Returns:
+            str: Hash over all asset fingerprints
+        """
+        now = time.monotonic()
+        if self._version is not None and now - self._version_checked < VERSION_TTL:
+            return self._version
+        digest = hashlib.sha256()
+        for directory, _, files in sorted(os.walk(self.folder)):
+            for name in sorted(files):
+                filename = os.path.relpath(os.path.join(directory, name), self.folder).replace(os.sep, '/')
+                asset = self.get(filename)
+                if asset is not None:
+                    digest.update(f"{filename}:{asset['fingerprint']};".encode('utf-8'))
+        self._version = digest.hexdigest()[:16]
+        self._version_checked = now
+        return self._version
@@ -0,0 +1,172 @@
+import html
+import logging
+import os
+import re
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Merge field placeholders, e.g. {{ first_name }}
+PLACEHOLDER_PATTERN = re.compile(r'\{\{\s*([A-Za-z0-9_.-]+)\s*\}\}')
+
+
+class CompiledText:
+    """Text parsed once into literal segments and named placeholder slots
+
+    Rendering only looks up each slot's value and joins the pieces, so the cost
+    per message is proportional to the number of placeholders rather than the
+    length of the text.
+    """
+
+    __slots__ = ('source', 'fields', '_parts', '_slots', '_escape')
+
+    def __init__(self, text, escape_html=False):
+        """
+        Parse template text
+
+        Args:
+            text (str): Text containing ``{{ name }}`` placeholders
+            escape_html (bool, optional): HTML-escape substituted values
+        """
+        self.source = text or ''
+        self._escape = escape_html
+        # re.split alternates literal text and captured field names
+        pieces = PLACEHOLDER_PATTERN.split(self.source)
+        self._parts = pieces
+        self._slots = tuple((index, pieces[index]) for index in range(1, len(pieces), 2))
+        self.fields = tuple(dict.fromkeys(name for _, name in self._slots))
+
+    def render(self, values):
+        """
+        Fill the placeholder slots
+
+        Args:
+            values (dict): Field values; missing fields become empty strings
+
+        Returns:
+            str: Rendered text
+        """
+        if not self._slots:
+            return self.source
+        parts = self._parts.copy()
+        get = values.get
+        escape = self._escape
+        for index, name in self._slots:
+            value = get(name)
+            if value is None:
+                value = ''
+            elif not isinstance(value, str):
+                value = str(value)
+            parts[index] = html.escape(value) if escape else value
+        return ''.join(parts)
+
+
+class CompiledTemplate:
+    """Email template with precompiled subject and body"""
+
+    __slots__ = ('name', 'subject', 'body', 'body_type')
+
+    def __init__(self, template, name=None):
+        """
+        Compile a template as stored by ConfigManager
+
+        Args:
+            template (dict): Template with 'subject', 'body' and 'body_type'
+            name (str, optional): Template name
+        """
+        self.name = name
+        self.body_type = template.get('body_type', 'plain')
+        self.subject = CompiledText(template.get('subject', ''))
+        self.body = CompiledText(template.get('body', ''), escape_html=(self.body_type == 'html'))
+
+    @property
+    def fields(self):
+        """tuple: Names of all merge fields used by the subject and body"""
+        return tuple(dict.fromkeys(self.subject.fields + self.body.fields))
+
+    def render(self, values):
+        """
+        Render the subject and body for one recipient
+
+        Args:
+            values (dict): Merge field values
+
+        Returns:
+            tuple: (subject, body)
+        """
+        return self.subject.render(values), self.body.render(values)
+
+
+def compile_template(template, name=None):
+    """
+    Compile a template dict, passing through templates that are already compiled
+
+    Args:
+        template (dict or CompiledTemplate): Template to compile
+        name (str, optional): Template name
+
+    Returns:
+        CompiledTemplate: Compiled template
+    """
+    if isinstance(template, CompiledTemplate):
+        return template
+    return CompiledTemplate(template, name=name)
+
+
+class TemplateEngine:
+    """Cache of compiled templates from templates.json
+
+    Compiled templates are keyed by name and invalidated whenever the templates
+    file changes on disk, so edits made through the UI or CLI are picked up
+    without re-parsing on every render.
+    """
+
+    def __init__(self, config_manager):
+        """
+        Initialize the engine
+
+        Args:
+            config_manager (ConfigManager): Source of saved templates
+        """
+        self.config_manager = config_manager
+        self._cache = {}
+        self._version = None
+        self._lock = threading.Lock()
+
+    def _templates_version(self):
+        """Get the modification stamp of the templates file"""
+        try:
+            stat = os.stat(self.config_manager.templates_file)
+            return stat.st_mtime_ns, stat.st_size
+        except OSError:
+            return None
+
+    def get(self, name):
+        """
+        Get a compiled template by name
+
+        Args:
+            name (str): Template name
+
+        Returns:
+            CompiledTemplate: Compiled template or None if not found
+        """
+        version = self._templates_version()
+        with self._lock:
+            if version != self._version:
+                self._cache.clear()
+                self._version = version
+            compiled = self._cache.get(name)
+            if compiled is not None:
+                return compiled
+
+        template = self.config_manager.get_template(name)
+        if template is None:
+            return None
+
+        compiled = CompiledTemplate(template, name=name)
+        with self._lock:
+            if version == self._version:
+                self._cache[name] = compiled
+        logger.debug(f"Compiled template '{name}' with fields {compiled.fields}")
+        return compiled
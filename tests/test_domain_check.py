@@ -0,0 +1,179 @@
+import os
+import socket
+import struct
+import sys
+import threading
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from domain_check import (RCODE_NXDOMAIN, TYPE_A, TYPE_AAAA, TYPE_MX, TYPE_SOA, DNSError, DomainChecker,
+                          query)
+
+# Pointer to the question name, which always starts right after the header
+QUESTION_NAME = b'\xc0\x0c'
+
+
+def encode_name(name):
+    return b''.join(bytes([len(label)]) + label.encode('ascii') for label in name.split('.')) + b'\x00'
+
+
+def record(rtype, ttl, rdata, name=QUESTION_NAME):
+    return name + struct.pack('>HHIH', rtype, 1, ttl, len(rdata)) + rdata
+
+
+def soa(ttl, minimum):
+    rdata = encode_name('ns.test') + encode_name('admin.test') + struct.pack('>IIIII', 1, 3600, 600, 86400, minimum)
+    return record(TYPE_SOA, ttl, rdata)
+
+
+class StubDNSServer:
+    """UDP DNS server on 127.0.0.1 answering from a table of canned replies
+
+    Replies are keyed by (name, type) and given as (rcode, answers,
+    authority, flags); a callable entry builds the whole packet from the
+    query instead, for malformed responses.
+    """
+
+    def __init__(self, replies):
+        self.replies = replies
+        self.queries = []
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(('127.0.0.1', 0))
+        self.address = self.sock.getsockname()
+        self.thread = threading.Thread(target=self.serve, daemon=True)
+        self.thread.start()
+
+    def serve(self):
+        while True:
+            try:
+                data, peer = self.sock.recvfrom(4096)
+            except OSError:
+                return
+            offset = 12
+            labels = []
+            while data[offset]:
+                labels.append(data[offset + 1:offset + 1 + data[offset]].decode('ascii'))
+                offset += 1 + data[offset]
+            name = '.'.join(labels)
+            qtype = struct.unpack('>H', data[offset + 1:offset + 3])[0]
+            question = data[12:offset + 5]
+            self.queries.append((name, qtype))
+
+            reply = self.replies.get((name, qtype), (0, [], [], 0))
+            if callable(reply):
+                packet = reply(data[:2], question)
+            else:
+                rcode, answers, authority, flags = reply
+                packet = data[:2] + struct.pack('>HHHHH', 0x8180 | flags | rcode, 1, len(answers),
+                                                len(authority), 0)
+                packet += question + b''.join(answers) + b''.join(authority)
+            self.sock.sendto(packet, peer)
+
+    def close(self):
+        self.sock.close()
+
+
+def cut_short(query_id, question):
+    """Claims one MX answer but ends in the middle of its fixed fields"""
+    return query_id + struct.pack('>HHHHH', 0x8180, 1, 1, 0, 0) + question + QUESTION_NAME + b'\x00\x0f'
+
+
+def compression_loop(query_id, question):
+    """Answer name is a pointer to itself"""
+    loop = 12 + len(question)
+    return (query_id + struct.pack('>HHHHH', 0x8180, 1, 1, 0, 0) + question
+            + struct.pack('>H', 0xC000 | loop) + struct.pack('>HHIH', TYPE_MX, 1, 60, 0))
+
+
+REPLIES = {
+    # MX whose exchange is compressed against the question name
+    ('mx.test', TYPE_MX): (0, [record(TYPE_MX, 600, struct.pack('>H', 10) + b'\x04mail' + QUESTION_NAME)], [], 0),
+    # No MX, falls back to the A record
+    ('a-only.test', TYPE_MX): (0, [], [soa(3600, 300)], 0),
+    ('a-only.test', TYPE_A): (0, [record(TYPE_A, 120, socket.inet_aton('192.0.2.1'))], [], 0),
+    # Neither MX nor addresses
+    ('bare.test', TYPE_MX): (0, [], [soa(3600, 300)], 0),
+    ('bare.test', TYPE_A): (0, [], [soa(3600, 300)], 0),
+    ('bare.test', TYPE_AAAA): (0, [], [soa(3600, 300)], 0),
+    ('null-mx.test', TYPE_MX): (0, [record(TYPE_MX, 600, struct.pack('>H', 0) + b'\x00')], [], 0),
+    ('missing.test', TYPE_MX): (RCODE_NXDOMAIN, [], [soa(3600, 120)], 0),
+    ('truncated.test', TYPE_MX): (0, [], [], 0x0200),
+    ('short.test', TYPE_MX): cut_short,
+    ('loop.test', TYPE_MX): compression_loop,
+}
+
+
+class DomainCheckTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = StubDNSServer(REPLIES)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.close()
+
+    def setUp(self):
+        self.checker = DomainChecker(nameserver=self.server.address, timeout=1.0, retries=0)
+
+    def tearDown(self):
+        self.checker.close()
+
+    def test_query_reads_compressed_mx(self):
+        response = query('mx.test', TYPE_MX, self.server.address, timeout=1.0, retries=0)
+        self.assertEqual(response['rcode'], 0)
+        self.assertEqual(response['answers'], [(600, (10, 'mail.mx.test'))])
+
+    def test_nxdomain_reports_soa_minimum(self):
+        response = query('missing.test', TYPE_MX, self.server.address, timeout=1.0, retries=0)
+        self.assertEqual(response['rcode'], RCODE_NXDOMAIN)
+        self.assertEqual(response['negative_ttl'], 120)
+
+    def test_truncated_response_raises(self):
+        with self.assertRaises(DNSError):
+            query('truncated.test', TYPE_MX, self.server.address, timeout=1.0, retries=0)
+
+    def test_compression_loop_raises(self):
+        with self.assertRaises(DNSError):
+            query('loop.test', TYPE_MX, self.server.address, timeout=1.0, retries=0)
+
+    def test_mx_domain_is_ok(self):
+        self.assertEqual(self.checker.check_domain('MX.test.'), (True, None))
+
+    def test_falls_back_to_a_record(self):
+        self.assertEqual(self.checker.check_domain('a-only.test'), (True, None))
+        self.assertIn(('a-only.test', TYPE_A), self.server.queries)
+
+    def test_domain_without_mail_hosts(self):
+        ok, reason = self.checker.check_domain('bare.test')
+        self.assertFalse(ok)
+        self.assertIn('no mail server', reason)
+
+    def test_null_mx_is_rejected(self):
+        ok, reason = self.checker.check_domain('null-mx.test')
+        self.assertFalse(ok)
+        self.assertIn('null MX', reason)
+
+    def test_nxdomain_is_cached(self):
+        ok, reason = self.checker.check_domain('missing.test')
+        self.assertFalse(ok)
+        self.assertIn('does not exist', reason)
+        self.assertEqual(self.checker.check_domain('missing.test'), (ok, reason))
+        self.assertEqual(self.checker.lookups, 1)
+
+    def test_each_domain_resolved_once(self):
+        results = self.checker.check_domains(['mx.test', 'MX.TEST', 'a-only.test', 'mx.test'])
+        self.assertEqual(set(results), {'mx.test', 'a-only.test'})
+        # One MX query each, plus the A fallback
+        self.assertEqual(self.checker.lookups, 3)
+
+    def test_malformed_replies_fail_the_lookup(self):
+        for domain in ('truncated.test', 'short.test', 'loop.test'):
+            ok, reason = self.checker.check_domain(domain)
+            self.assertFalse(ok, domain)
+            self.assertIn('Domain lookup failed', reason)
+
+
+if __name__ == '__main__':
+    unittest.main()
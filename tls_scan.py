@@ -0,0 +1,213 @@
+import logging
+import smtplib
+import socket
+import ssl
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# Protocol versions probed, oldest first
+TLS_VERSIONS = {
+    'TLSv1.0': ssl.TLSVersion.TLSv1,
+    'TLSv1.1': ssl.TLSVersion.TLSv1_1,
+    'TLSv1.2': ssl.TLSVersion.TLSv1_2,
+    'TLSv1.3': ssl.TLSVersion.TLSv1_3
+}
+
+# Every cipher OpenSSL knows, including weak ones, so the server's choices decide
+ALL_CIPHERS = 'ALL:COMPLEMENTOFALL:@SECLEVEL=0'
+
+# Key exchanges that need pre-shared credentials and cannot be probed blindly
+SKIPPED_KEY_EXCHANGES = {'kx-psk', 'kx-ecdhe-psk', 'kx-dhe-psk', 'kx-rsa-psk', 'kx-srp'}
+
+
+def _context(version, cipher=None):
+    """Client context pinned to one protocol version and optionally one cipher"""
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+    context.check_hostname = False
+    context.verify_mode = ssl.CERT_NONE
+    context.minimum_version = version
+    context.maximum_version = version
+    context.set_ciphers(f'{cipher}:@SECLEVEL=0' if cipher else ALL_CIPHERS)
+    return context
+
+
+def cipher_group(cipher):
+    """
+    Describe a cipher by key exchange, authentication and bulk cipher
+
+    Args:
+        cipher (dict): Entry from ssl.SSLContext.get_ciphers()
+
+    Returns:
+        str: Group such as 'ecdhe/rsa/aes-128-gcm'
+    """
+    def strip(value, prefix):
+        value = value or 'any'
+        return value[len(prefix):] if value.startswith(prefix) else value
+    return '/'.join([strip(cipher.get('kea'), 'kx-'), strip(cipher.get('auth'), 'auth-'),
+                     cipher.get('symmetric') or 'none'])
+
+
+def probe_ciphers(version):
+    """
+    List the ciphers worth probing individually for a protocol version
+
+    TLS 1.3 suites cannot be restricted through the ssl module, so TLS 1.3 is
+    probed with one handshake and the negotiated suite is reported.
+
+    Args:
+        version (str): Key of TLS_VERSIONS
+
+    Returns:
+        list: Cipher dicts from get_ciphers(), or [None] for TLS 1.3
+    """
+    if version == 'TLSv1.3':
+        return [None]
+    ciphers = []
+    for cipher in _context(TLS_VERSIONS[version]).get_ciphers():
+        if cipher['protocol'] == 'TLSv1.3' or cipher.get('kea') in SKIPPED_KEY_EXCHANGES:
+            continue
+        # Ciphers introduced with TLS 1.2 (AEAD, SHA-256 MACs) cannot be used below it
+        if version != 'TLSv1.2' and cipher['protocol'] == 'TLSv1.2':
+            continue
+        ciphers.append(cipher)
+    return ciphers
+
+
+def handshake(server, port, mode, version, cipher=None, hostname=None, timeout=10):
+    """
+    Connect and perform one TLS handshake with a fixed version and cipher
+
+    Args:
+        server (str): SMTP server address
+        port (int): SMTP server port
+        mode (str): 'ssl' for implicit TLS or 'starttls'
+        version (str): Key of TLS_VERSIONS
+        cipher (str, optional): OpenSSL cipher name, None to offer all
+        hostname (str, optional): Hostname to use in EHLO
+        timeout (float, optional): Socket timeout in seconds
+
+    Returns:
+        dict: 'accepted', and on success the negotiated 'protocol', 'cipher',
+        'bits' and 'handshake_ms'; otherwise 'error'
+    """
+    context = _context(TLS_VERSIONS[version], cipher)
+    smtp = None
+    raw = None
+    sock = None
+    try:
+        if mode == 'ssl':
+            raw = socket.create_connection((server, port), timeout=timeout)
+        else:
+            smtp = smtplib.SMTP(server, port, local_hostname=hostname, timeout=timeout)
+            smtp.ehlo()
+            if not smtp.has_extn('starttls'):
+                return {'accepted': False, 'error': 'STARTTLS not offered'}
+            code, reply = smtp.docmd('STARTTLS')
+            if code != 220:
+                return {'accepted': False, 'error': f"STARTTLS refused: {code} {reply.decode('utf-8', errors='replace')}"}
+            raw = smtp.sock
+        sock = context.wrap_socket(raw, server_hostname=server, do_handshake_on_connect=False)
+        started = time.perf_counter()
+        sock.do_handshake()
+        elapsed = time.perf_counter() - started
+        name, _, bits = sock.cipher()
+        return {'accepted': True, 'protocol': sock.version(), 'cipher': name, 'bits': bits,
+                'handshake_ms': round(elapsed * 1000, 3)}
+    except ssl.SSLError as e:
+        return {'accepted': False, 'error': e.reason or str(e)}
+    except (OSError, smtplib.SMTPException) as e:
+        return {'accepted': False, 'error': str(e) or type(e).__name__}
+    finally:
+        for closable in (sock, raw, smtp):
+            if closable is not None:
+                closable.close()
+
+
+def scan_tls(targets, versions=None, concurrency=8, hostname=None, timeout=10, on_result=None):
+    """
+    Probe every protocol version and cipher for each target in parallel
+
+    Args:
+        targets (list): Dicts with 'name', 'server', 'port' and 'mode' ('ssl' or 'starttls')
+        versions (list, optional): Keys of TLS_VERSIONS to probe, default all
+        concurrency (int, optional): Parallel handshakes across all targets
+        hostname (str, optional): Hostname to use in EHLO
+        timeout (float, optional): Socket timeout in seconds
+        on_result (callable, optional): Called with each result as it completes
+
+    Returns:
+        dict: 'results' with one row per probe, and 'matrix' mapping
+        target name -> mode -> version -> accepted ciphers, cipher groups and
+        mean handshake latency
+    """
+    versions = versions or list(TLS_VERSIONS)
+    probes = []
+    for target in targets:
+        for version in versions:
+            for cipher in probe_ciphers(version):
+                probes.append((target, version, cipher))
+
+    def run(probe):
+        target, version, cipher = probe
+        result = handshake(target['server'], target['port'], target['mode'], version,
+                           cipher['name'] if cipher else None, hostname=hostname, timeout=timeout)
+        row = {'target': target['name'], 'server': f"{target['server']}:{target['port']}",
+               'mode': target['mode'], 'version': version,
+               'offered': cipher['name'] if cipher else 'TLS 1.3 suites',
+               'group': cipher_group(cipher) if cipher else None}
+        row.update(result)
+        if on_result:
+            on_result(row)
+        return row
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        results = list(executor.map(run, probes))
+    elapsed = time.perf_counter() - started
+
+    matrix = {}
+    latencies = {}
+    for row in results:
+        key = (row['target'], row['mode'], row['version'])
+        cell = matrix.setdefault(row['target'], {}).setdefault(row['mode'], {}).setdefault(
+            row['version'], {'accepted': [], 'groups': [], 'handshake_ms': None, 'errors': {}})
+        if row['accepted']:
+            cell['accepted'].append(row['cipher'])
+            group = row['group'] or row['cipher']
+            if group not in cell['groups']:
+                cell['groups'].append(group)
+            latencies.setdefault(key, []).append(row['handshake_ms'])
+        else:
+            cell['errors'][row['error']] = cell['errors'].get(row['error'], 0) + 1
+    for (target, mode, version), values in latencies.items():
+        matrix[target][mode][version]['handshake_ms'] = round(sum(values) / len(values), 3)
+
+    logger.info(f"TLS scan of {len(targets)} targets finished: {len(probes)} handshakes in {elapsed:.2f}s")
+    return {'results': results, 'matrix': matrix, 'elapsed_seconds': round(elapsed, 3)}
+
+
+def profile_targets(name, profile, ssl_port=None, starttls_port=None):
+    """
+    Build scan targets for a saved profile
+
+    The profile's own port is scanned in its configured mode; extra ports
+    add the other mode on the same server.
+
+    Args:
+        name (str): Profile name
+        profile (dict): Profile as stored by ConfigManager
+        ssl_port (int, optional): Also scan implicit TLS on this port
+        starttls_port (int, optional): Also scan STARTTLS on this port
+
+    Returns:
+        list: Target dicts for scan_tls
+    """
+    targets = [{'name': name, 'server': profile['server'], 'port': int(profile['port']),
+                'mode': 'ssl' if profile.get('use_ssl') else 'starttls'}]
+    for mode, port in (('ssl', ssl_port), ('starttls', starttls_port)):
+        if port and not any(t['mode'] == mode and t['port'] == port for t in targets):
+            targets.append({'name': name, 'server': profile['server'], 'port': int(port), 'mode': mode})
+    return targets
@@ -0,0 +1,285 @@
+import logging
+import re
+import smtplib
+from email import policy
+from email.generator import BytesGenerator
+from io import BytesIO
+
+logger = logging.getLogger(__name__)
+
+# Longest line, excluding CRLF, allowed outside of BINARYMIME (RFC 5321)
+MAX_LINE_LENGTH = 998
+
+# Bytes per BDAT chunk
+BDAT_CHUNK_SIZE = 1024 * 1024
+
+# A line starting with a dot, which DATA must double
+_DOT_LINE = re.compile(rb'\n\.')
+
+
+def _needs_smtputf8(addresses):
+    return any(not address.isascii() for address in addresses if address)
+
+
+def plan_transfer_encoding(features, sender=None, recipients=(), allow_binary=True):
+    """
+    Choose the cheapest transfer encoding the server supports
+
+    Args:
+        features (dict): smtplib esmtp_features read after EHLO
+        sender (str, optional): Envelope sender
+        recipients (list, optional): Envelope recipients
+        allow_binary (bool, optional): Allow binary parts sent with BDAT
+
+    Returns:
+        dict: 'body' ('binarymime', '8bitmime' or '7bit'), 'chunking' when
+        the message must be sent with BDAT, 'smtputf8' and the 'mail_options'
+        to add to MAIL FROM
+
+    Raises:
+        smtplib.SMTPNotSupportedError: If the envelope needs SMTPUTF8 and the server lacks it
+    """
+    features = {name.lower() for name in features or {}}
+    plan = {'body': '7bit', 'chunking': False, 'smtputf8': False, 'mail_options': []}
+
+    if allow_binary and 'binarymime' in features and 'chunking' in features:
+        plan.update(body='binarymime', chunking=True, mail_options=['BODY=BINARYMIME'])
+    elif '8bitmime' in features:
+        plan.update(body='8bitmime', mail_options=['BODY=8BITMIME'])
+
+    if _needs_smtputf8([sender, *recipients]):
+        if 'smtputf8' not in features:
+            raise smtplib.SMTPNotSupportedError('Non-ASCII addresses need SMTPUTF8, which the server does not offer')
+        plan['smtputf8'] = True
+        plan['mail_options'].append('SMTPUTF8')
+    return plan
+
+
+def _fits_in_lines(data):
+    """Whether data can be sent as 8bit text: no NUL, no bare CR and short lines"""
+    if b'\0' in data or b'\r' in data.replace(b'\r\n', b''):
+        return False
+    return all(len(line) <= MAX_LINE_LENGTH for line in data.replace(b'\r\n', b'\n').split(b'\n'))
+
+
+def _choose_encoding(part, data, body):
+    if part.get_content_maintype() == 'text' and _fits_in_lines(data):
+        return '7bit' if data.isascii() else '8bit'
+    if body == 'binarymime':
+        return 'binary'
+    return None
+
+
+def apply_transfer_encoding(message, plan):
+    """
+    Re-encode the leaf parts of a message in place for a transfer plan
+
+    Text parts become 7bit or 8bit when their lines allow it; under
+    BINARYMIME every other part is sent as raw binary. Parts that cannot use
+    the cheaper encoding keep their original one.
+
+    Args:
+        message (email.message.Message): Message to re-encode
+        plan (dict): Plan from plan_transfer_encoding
+
+    Returns:
+        int: Number of parts whose encoding changed
+    """
+    if plan['body'] == '7bit':
+        return 0
+    changed = 0
+    for part in message.walk():
+        if part.is_multipart():
+            continue
+        current = (part.get('Content-Transfer-Encoding') or '7bit').lower()
+        data = part.get_payload(decode=True)
+        if data is None:
+            continue
+        encoding = _choose_encoding(part, data, plan['body'])
+        if encoding is None or encoding == current:
+            continue
+        # Surrogate escapes carry the raw bytes through the generator unchanged
+        part.set_payload(data.decode('ascii', errors='surrogateescape'))
+        if 'Content-Transfer-Encoding' in part:
+            part.replace_header('Content-Transfer-Encoding', encoding)
+        else:
+            part['Content-Transfer-Encoding'] = encoding
+        changed += 1
+    return changed
+
+
+class _BinaryGenerator(BytesGenerator):
+    """BytesGenerator that writes binary parts without touching their line endings"""
+
+    def _handle_text(self, msg):
+        # Like the base class, read _payload directly: get_payload() decodes surrogates away
+        if (msg.get('Content-Transfer-Encoding') or '').lower() == 'binary' and isinstance(msg._payload, str):
+            self._fp.write(msg._payload.encode('ascii', errors='surrogateescape'))
+            return
+        super()._handle_text(msg)
+
+    # Non-text parts are dispatched here; the base class binds its own _handle_text
+    _writeBody = _handle_text
+
+
+def serialize_message(message, plan=None):
+    """
+    Serialize a message with CRLF line endings for sending
+
+    Args:
+        message (email.message.Message): Message to serialize
+        plan (dict, optional): Plan from plan_transfer_encoding; with SMTPUTF8
+            headers are written as raw UTF-8 instead of encoded words
+
+    Returns:
+        bytes: Message ready for DATA or BDAT
+    """
+    if plan and plan.get('smtputf8'):
+        message_policy = policy.SMTPUTF8
+    else:
+        message_policy = message.policy.clone(linesep='\r\n')
+    buffer = BytesIO()
+    _BinaryGenerator(buffer, mangle_from_=False, policy=message_policy).flatten(message)
+    return buffer.getvalue()
+
+
+def bdat(smtp, message, chunk_size=BDAT_CHUNK_SIZE):
+    """
+    Send message data with BDAT (RFC 3030) after the envelope was accepted
+
+    Args:
+        smtp (smtplib.SMTP): Connection with an open transaction
+        message (bytes): Serialized message, sent without dot-stuffing
+        chunk_size (int, optional): Bytes per BDAT command
+
+    Returns:
+        tuple: (code, reply) for the last chunk, or the first rejected chunk
+    """
+    offset = 0
+    while True:
+        chunk = message[offset:offset + chunk_size]
+        offset += len(chunk)
+        last = offset >= len(message)
+        smtp.send(f"BDAT {len(chunk)}{' LAST' if last else ''}\r\n".encode('ascii') + chunk)
+        code, reply = smtp.getreply()
+        if code != 250 or last:
+            return code, reply
+
+
+def bdat_stream(smtp, chunks):
+    """
+    Send message data with BDAT from an iterable of chunks
+
+    Each chunk is sent as it arrives, so chunks may be views of a buffer the
+    iterator reuses. The transaction ends with ``BDAT 0 LAST``.
+
+    Args:
+        smtp (smtplib.SMTP): Connection with an open transaction
+        chunks (iterable): Bytes-like chunks of the serialized message
+
+    Returns:
+        tuple: (code, reply) for the last chunk, or the first rejected chunk
+    """
+    for chunk in chunks:
+        if not len(chunk):
+            continue
+        smtp.send(f"BDAT {len(chunk)}\r\n".encode('ascii'))
+        smtp.send(chunk)
+        code, reply = smtp.getreply()
+        if code != 250:
+            return code, reply
+    smtp.send(b"BDAT 0 LAST\r\n")
+    return smtp.getreply()
+
+
+def data_stream(smtp, chunks):
+    """
+    Send message data with DATA from an iterable of chunks
+
+    The message must already use CRLF line endings. Dot-stuffing is applied
+    across chunk boundaries; chunks without a line starting with a dot are
+    sent without being copied.
+
+    Args:
+        smtp (smtplib.SMTP): Connection with an open transaction
+        chunks (iterable): Bytes-like chunks of the serialized message
+
+    Returns:
+        tuple: (code, reply) to the end of the data
+
+    Raises:
+        smtplib.SMTPDataError: If the server refuses the DATA command
+    """
+    code, reply = smtp.docmd('DATA')
+    if code != 354:
+        raise smtplib.SMTPDataError(code, reply)
+    tail = b'\r\n'
+    for chunk in chunks:
+        if not len(chunk):
+            continue
+        if (tail.endswith(b'\n') and chunk[0] == 0x2e) or _DOT_LINE.search(chunk):
+            data = _DOT_LINE.sub(b'\n..', bytes(chunk))
+            if tail.endswith(b'\n') and data.startswith(b'.'):
+                data = b'.' + data
+            smtp.send(data)
+        else:
+            smtp.send(chunk)
+        tail = (tail + bytes(chunk[-2:]))[-2:]
+    smtp.send(b'.\r\n' if tail == b'\r\n' else b'\r\n.\r\n')
+    return smtp.getreply()
+
+
+def send_message(smtp, sender, recipients, message, mail_options=(), rcpt_options=(), chunking=False):
+    """
+    Send a serialized message, using BDAT when the plan requires it
+
+    Behaves like smtplib.SMTP.sendmail, which is used directly without chunking.
+
+    Args:
+        smtp (smtplib.SMTP): Connected and authenticated SMTP connection
+        sender (str): Envelope sender
+        recipients (list): Envelope recipients
+        message (bytes): Serialized message
+        mail_options (list, optional): ESMTP options for MAIL FROM
+        rcpt_options (list, optional): ESMTP options for RCPT TO
+        chunking (bool, optional): Send the message data with BDAT
+
+    Returns:
+        dict: Refused recipients mapped to (code, reply)
+
+    Raises:
+        smtplib.SMTPException: If the message was not accepted for any recipient
+    """
+    if not chunking:
+        return smtp.sendmail(sender, recipients, message, mail_options=list(mail_options),
+                             rcpt_options=list(rcpt_options))
+
+    smtp.ehlo_or_helo_if_needed()
+    code, reply = smtp.mail(sender, list(mail_options))
+    if code != 250:
+        if code == 421:
+            smtp.close()
+        else:
+            smtp.rset()
+        raise smtplib.SMTPSenderRefused(code, reply, sender)
+
+    refused = {}
+    for recipient in recipients:
+        code, reply = smtp.rcpt(recipient, list(rcpt_options))
+        if code not in (250, 251):
+            refused[recipient] = (code, reply)
+            if code == 421:
+                smtp.close()
+                raise smtplib.SMTPRecipientsRefused(refused)
+    if len(refused) == len(recipients):
+        smtp.rset()
+        raise smtplib.SMTPRecipientsRefused(refused)
+
+    code, reply = bdat(smtp, message)
+    if code != 250:
+        if code == 421:
+            smtp.close()
+        else:
+            smtp.rset()
+        raise smtplib.SMTPDataError(code, reply)
+    return refused